@@ -3,12 +3,11 @@ import streamlit as st
 import time
 
 from rag.retrieval import RetrievalParams
-from rag import create_app_services, OllamaHealth
+from rag import OllamaHealth
+from rag.versions import ActiveServices
 
 # ---------- Setup ----------
 PROJECT_ROOT = Path(__file__).resolve().parent
-svc = create_app_services(PROJECT_ROOT)
-ollama = OllamaHealth()
 
 st.set_page_config(
     page_title="RAG Chat",
@@ -17,6 +16,30 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+
+# Streamlit re-runs this script on every interaction: build services once per
+# process (heavy LangChain/Chroma imports happen lazily on first real use).
+# ActiveServices follows the active index version across cutovers/rollbacks.
+@st.cache_resource(show_spinner=False)
+def get_services():
+    return ActiveServices(PROJECT_ROOT), OllamaHealth()
+
+
+live, ollama = get_services()
+svc = live.get()
+
+
+@st.cache_data(ttl=10, show_spinner=False)
+def list_doc_files(docs_dir: str) -> list:
+    return svc.doc_manager.list_files()
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def kb_status(generation: str) -> tuple:
+    # keyed by index generation, so any index change refreshes it at once
+    return svc.vector_db.exists(), svc.vector_db.count_chunks()
+
+
 # ---------- CSS & Styling ----------
 st.markdown(
     """
@@ -187,6 +210,80 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+def format_metrics(m) -> str:
+    parts = ["⚡ cached answer"] if getattr(m, "cached", False) else []
+    if m.ttft_s is not None:
+        parts.append(f"TTFT {m.ttft_s:.2f}s")
+    if m.tokens_per_s is not None:
+        parts.append(f"{m.tokens_per_s:.1f} tok/s")
+    parts.append(f"total {m.total_s:.2f}s")
+    if m.context_tokens:
+        parts.append(f"context ~{m.context_tokens} tok")
+    return " · ".join(parts)
+
+def index_progress(jobs, active: bool) -> None:
+    # polls once a second while a build runs, without rerunning the whole page
+    @st.fragment(run_every=1.0 if active else None)
+    def _render():
+        job = jobs.status()
+        if job is None:
+            return
+        if job.active:
+            label = f"{job.files_done}/{job.files_pending} files" if job.files_pending else "Scanning..."
+            st.progress(job.fraction, text=label)
+            parts = [f"{job.chunks_written} chunks", f"{job.chunks_per_s:.0f} chunks/s"]
+            if job.current:
+                parts.append(f"`{job.current}`")
+            st.caption(" · ".join(parts))
+            if st.button("⏹️ Cancel indexing", use_container_width=True, key="btn_cancel_index"):
+                jobs.cancel()
+        elif active:
+            # just finished: refresh the whole page (KB status, button states)
+            st.rerun()
+        elif job.status == "interrupted":
+            st.warning(f"Last indexing run stopped after {job.files_done}/{job.files_pending} files.")
+            if st.button("▶️ Resume indexing", use_container_width=True, key="btn_resume_index"):
+                jobs.submit()
+                st.rerun()
+        elif job.status == "failed":
+            st.error(f"Indexing failed: {job.error}")
+        elif job.status == "cancelled":
+            st.caption(f"Indexing cancelled after {job.files_done}/{job.files_pending} files.")
+        elif job.stats:
+            st.caption(f"Last run: {job.stats.get('chunks_added', 0)} chunks added, {job.stats.get('skipped', 0)} files unchanged")
+
+    _render()
+
+def migration_progress(versions, active: bool) -> None:
+    @st.fragment(run_every=1.0 if active else None)
+    def _render():
+        mig = versions.migration()
+        if mig is None:
+            return
+        if mig.active:
+            if mig.status == "checking":
+                st.progress(1.0, text=f"Smoke-testing `{mig.tag}`...")
+            elif mig.status == "syncing":
+                st.progress(1.0, text=f"Applying recent document changes to `{mig.tag}`...")
+            else:
+                label = f"{mig.files_done}/{mig.files_pending} files" if mig.files_pending else "Scanning..."
+                st.progress(mig.files_done / mig.files_pending if mig.files_pending else 0.0, text=label)
+                st.caption(f"Building `{mig.tag}` · {mig.chunks_written} chunks · {mig.chunks_per_s:.0f} chunks/s")
+            if st.button("⏹️ Cancel rebuild", use_container_width=True, key="btn_cancel_migration"):
+                versions.cancel_build()
+        elif active:
+            st.rerun()
+        elif mig.status == "active":
+            st.caption(f"Now serving `{mig.tag}`.")
+        elif mig.status == "failed":
+            st.error(f"`{mig.tag}` not activated: {mig.error or mig.smoke}")
+        elif mig.status == "ready":
+            st.caption(f"`{mig.tag}` is built and passed the smoke test.")
+        elif mig.status == "cancelled":
+            st.caption(f"Rebuild of `{mig.tag}` cancelled.")
+
+    _render()
+
 # ---------- Session State ----------
 if "messages" not in st.session_state:
     st.session_state.messages = []
@@ -207,7 +304,7 @@ with st.sidebar:
     
     st.markdown('<div style="margin-top: -10px;"></div>', unsafe_allow_html=True)
     
-    is_ready = ollama.is_ready(timeout_s=0.25)
+    is_ready = ollama.cached_ready(max_age_s=5.0, timeout_s=0.25)
     
     if is_ready:
         st.markdown('<div class="ollama-status active">Ollama Active</div>', unsafe_allow_html=True)
@@ -229,12 +326,13 @@ with st.sidebar:
         if uploaded:
             for uf in uploaded:
                 svc.doc_manager.save_upload_bytes(uf.name, uf.getbuffer().tobytes())
+            list_doc_files.clear()
             upload_notice.success(f"Uploaded {len(uploaded)} file(s) ✅")
             st.session_state.uploader_key += 1
             time.sleep(2)
             st.rerun()
 
-        files = svc.doc_manager.list_files()
+        files = list_doc_files(str(svc.cfg.docs_dir))
         if files:
             rel_map = {str(p.relative_to(svc.cfg.docs_dir)): p for p in files}
             options = list(rel_map.keys())
@@ -254,6 +352,7 @@ with st.sidebar:
                 ):
                     paths = [rel_map[s] for s in selected]
                     deleted = svc.doc_manager.delete_files(paths)
+                    list_doc_files.clear()
                     st.toast(f"Deleted {deleted} file(s) from disk.", icon="🗑️")
                     st.rerun()
 
@@ -272,26 +371,81 @@ with st.sidebar:
 
     # --- Knowledge Base Section ---
     with st.expander("🧠 Knowledge Base", expanded=False):
-        if svc.vector_db.exists():
-            cnt = svc.vector_db.count_chunks()
+        exists, cnt = kb_status(svc.vector_db.generation())
+        if exists:
             st.caption(f"Status: **Ready** | Chunks: **{cnt}**")
+            qc = svc.retriever.cache_stats()["results"]
+            if qc["hits"] + qc["misses"]:
+                st.caption(f"Query cache: {qc['hit_rate']:.0%} hits ({qc['hits']}/{qc['hits'] + qc['misses']})")
         else:
             st.caption("Status: **Not Indexed**")
 
+        # Indexing runs in the background: chat keeps answering from the current index
+        jobs = svc.index_manager.jobs()
+        job = jobs.status()
+        indexing = job is not None and job.active
+
         # Only Build/Update is Primary (Purple)
-        if st.button("🚀 Build / Update Index", type="primary", use_container_width=True):
-            with st.spinner("Indexing..."):
-                msg, stats = svc.index_manager.build_or_update()
-            st.toast(f"Indexed: {stats['chunks']} chunks", icon="🎉")
-            time.sleep(0.5)
+        if st.button("🚀 Build / Update Index", type="primary", use_container_width=True, disabled=indexing):
+            jobs.submit()
             st.rerun()
-            
-        if st.button("🧹 Reset Database", type="secondary", use_container_width=True):
+
+        index_progress(jobs, indexing)
+
+        watcher = svc.index_manager.watcher()
+        if svc.cfg.watch_docs and "auto_index" not in st.session_state:
+            watcher.start()
+        auto_index = st.toggle(
+            "👀 Auto-index changes",
+            value=watcher.running,
+            key="auto_index",
+            help="Watch documents/ and index added, changed or deleted files within seconds.",
+        )
+        if auto_index and not watcher.running:
+            watcher.start()
+        elif not auto_index and watcher.running:
+            watcher.stop()
+
+        if st.button("🧹 Reset Database", type="secondary", use_container_width=True, disabled=indexing):
             svc.index_manager.reset()
             st.toast("DB Reset", icon="🗑️")
             time.sleep(0.5)
             st.rerun()
 
+    # --- Index Versions Section ---
+    with st.expander("🔁 Index Versions", expanded=False):
+        # Full rebuilds (new embedding model / chunking) go to a new version;
+        # the active one keeps serving until the new one passes its smoke test
+        versions = live.versions
+        mig = versions.migration()
+        migrating = mig is not None and mig.active
+        st.caption(f"Active: `{versions.active()}`")
+        with st.form("new_version", border=False):
+            embed_model = st.text_input("Embedding model", svc.cfg.embed_model)
+            c1, c2 = st.columns(2)
+            chunk_size = c1.number_input("Chunk size", 100, 8000, svc.cfg.chunk_size, 50)
+            chunk_overlap = c2.number_input("Overlap", 0, 2000, svc.cfg.chunk_overlap, 10)
+            if st.form_submit_button("🏗️ Rebuild as new version", use_container_width=True, disabled=migrating):
+                versions.start_build(embed_model=embed_model.strip(), chunk_size=int(chunk_size), chunk_overlap=int(chunk_overlap))
+                st.rerun()
+
+        migration_progress(versions, migrating)
+
+        for v in versions.list_versions():
+            mark = "🟢" if v["active"] else ("↩️" if v["previous"] else "⚪")
+            smoke = v.get("smoke") or {}
+            detail = f" · self-retrieval {smoke['self_retrieval']:.0%}" if "self_retrieval" in smoke else ""
+            st.caption(f"{mark} `{v['tag']}` · {v.get('status', 'ready')}{detail}")
+            if not v["active"] and v.get("status", "ready") == "ready":
+                if st.button(f"Activate {v['tag']}", use_container_width=True, key=f"btn_activate_{v['tag']}", disabled=migrating or indexing):
+                    versions.activate(v["tag"])
+                    st.rerun()
+
+        if versions.previous() is not None:
+            if st.button(f"↩️ Roll back to {versions.previous()}", use_container_width=True, disabled=migrating or indexing):
+                versions.rollback()
+                st.rerun()
+
     # --- Settings Section ---
     with st.expander("⚙️ Config", expanded=False):
         st.markdown(f"""
@@ -309,13 +463,18 @@ with st.sidebar:
         </div>
         """, unsafe_allow_html=True)
         
-        retrieval_mode = st.selectbox("Retrieval Mode", ["similarity", "mmr", "threshold"])
+        retrieval_mode = st.selectbox("Retrieval Mode", ["similarity", "mmr", "threshold", "hybrid"])
         k_val = st.slider("Context (Top-k)", 1, 12, svc.cfg.default_k)
+        token_budget = st.slider("Context budget (tokens)", 256, 8000, max(256, min(8000, svc.cfg.context_token_budget)), 64)
 
         fetch_k = 20
         score_threshold = 0.35
+        lambda_mult = 0.5
         if retrieval_mode == "mmr":
-            fetch_k = st.slider("MMR fetch_k", 10, 60, 20)
+            fetch_k = st.slider("MMR fetch_k", 10, 2000, 100, 10)
+            lambda_mult = st.slider("MMR diversity (λ)", 0.0, 1.0, 0.5, 0.05, help="1 = pure relevance, 0 = max diversity")
+        if retrieval_mode == "hybrid":
+            fetch_k = st.slider("Hybrid candidates per list", 10, 200, 40)
         if retrieval_mode == "threshold":
             score_threshold = st.slider("Score threshold", 0.0, 1.0, 0.35, 0.01)
 
@@ -336,6 +495,8 @@ st.markdown(
 for m in st.session_state.messages:
     with st.chat_message(m["role"], avatar="👤" if m["role"] == "user" else "🤖"):
         st.markdown(m["content"])
+        if m.get("metrics"):
+            st.caption(m["metrics"])
         if m.get("sources"):
             with st.expander("📚 Sources"):
                 for idx, s in enumerate(m["sources"], 1):
@@ -356,20 +517,32 @@ if user_q:
                 k=k_val,
                 fetch_k=fetch_k,
                 score_threshold=score_threshold,
+                lambda_mult=lambda_mult,
+                token_budget=token_budget,
             )
             
-            ans, sources, debug_chunks = svc.chat.answer(user_q, params=params)
-            st.markdown(ans)
-            
-            if sources:
-                with st.expander("📚 Sources"):
-                    for idx, s in enumerate(sources, 1):
-                        st.write(s)
-
-            if show_retrieved and debug_chunks:
-                with st.expander("🔎 Retrieved chunks (debug)"):
-                    for i, ch in enumerate(debug_chunks, 1):
-                        st.markdown(f"**{i}.** `{ch.source}` | Score: `{ch.score:.3f}`")
-                        st.code(ch.text[:300])
-            
-            st.session_state.messages.append({"role": "assistant", "content": ans, "sources": sources})
\ No newline at end of file
+            stream = svc.chat.answer_stream(user_q, params=params)
+
+        # tokens render as they arrive; sources/debug are already known
+        ans = st.write_stream(stream)
+        metrics_line = format_metrics(stream.metrics)
+        st.caption(metrics_line)
+
+        sources, debug_chunks = stream.sources, stream.debug_chunks
+        if sources:
+            with st.expander("📚 Sources"):
+                for idx, s in enumerate(sources, 1):
+                    st.write(s)
+
+        if show_retrieved and debug_chunks:
+            with st.expander("🔎 Retrieved chunks (debug)"):
+                for i, ch in enumerate(debug_chunks, 1):
+                    score = f"{ch.score:.3f}" if ch.score is not None else "n/a"
+                    st.markdown(f"**{i}.** `{ch.source}` | Score: `{score}`")
+                    st.code(ch.text[:300])
+
+        if show_retrieved and stream.trace is not None and stream.trace.spans:
+            with st.expander("⏱️ Timings (debug)"):
+                st.table(stream.trace.as_dicts())
+        
+        st.session_state.messages.append({"role": "assistant", "content": ans, "sources": sources, "metrics": metrics_line})
\ No newline at end of file
@@ -0,0 +1,14 @@
+"""
+Offline benchmarks for BuildRAG (no Ollama needed).
+
+    python -m bench --sizes 20,100,500 --backend chroma --out results.json
+
+Generates a synthetic PDF/TXT/MD corpus and swaps deterministic fake
+embedding/LLM backends (tunable latency) into the shared handle pool. It then
+measures indexing throughput, no-op reindex time, retrieval latency per mode,
+answer TTFT, and peak memory, and writes JSON.
+"""
+from .corpus import make_corpus, make_queries
+from .fakes import FakeEmbeddings, FakeLLM
+
+__all__ = ["make_corpus", "make_queries", "FakeEmbeddings", "FakeLLM"]
@@ -0,0 +1,137 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import List, Sequence
+import random
+import textwrap
+
+# small fixed vocabulary so text looks like prose and BM25 has repeated terms
+_WORDS = (
+    "system service request response cache index vector query document page "
+    "config server client latency throughput memory disk network error retry "
+    "timeout batch stream token model embedding chunk source answer context "
+    "user session worker process thread queue lock update delete insert scan "
+    "report metric trace span budget limit policy deploy release rollback "
+    "storage backup restore replica shard cluster node region zone health"
+).split()
+
+
+def _sentence(words: List[str]) -> str:
+    s = " ".join(words)
+    return s[:1].upper() + s[1:] + "."
+
+
+def paragraph(rng: random.Random, code: str, words: int = 90) -> str:
+    """
+    One synthetic paragraph mentioning a unique code (e.g. ERR-0042),
+    so queries can target a known chunk.
+    """
+    body = [rng.choice(_WORDS) for _ in range(words)]
+    body.insert(rng.randrange(len(body)), code)
+    sentences, out = [], []
+    for w in body:
+        out.append(w)
+        if len(out) >= rng.randint(8, 16):
+            sentences.append(_sentence(out))
+            out = []
+    if out:
+        sentences.append(_sentence(out))
+    return " ".join(sentences)
+
+
+def _pdf_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: Path, pages: Sequence[str], width: int = 90) -> None:
+    """
+    Minimal text-only PDF (Helvetica, one content stream per page).
+    Readable by pypdf; no third-party writer needed.
+    """
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = len(objects) + 1 + 2 * len(pages)  # reserved after page objects
+    kids = []
+    for text in pages:
+        lines = []
+        for para in text.split("\n\n"):
+            lines.extend(textwrap.wrap(para, width) or [""])
+            lines.append("")
+        ops = ["BT", "/F1 10 Tf", "12 TL", "40 800 Td"]
+        ops += [f"({_pdf_escape(line)}) '" for line in lines]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font, content)
+        ))
+    add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{k} 0 R" for k in kids).encode(), len(kids)))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    path.write_bytes(bytes(out))
+
+
+def make_corpus(
+    docs_dir: Path,
+    files: int,
+    paragraphs: int = 20,
+    kinds: Sequence[str] = ("md", "txt", "pdf"),
+    paragraphs_per_page: int = 4,
+    seed: int = 0,
+) -> List[str]:
+    """
+    Write `files` synthetic documents (cycling through `kinds`) into docs_dir.
+    Paragraph j of file i contains the code ERR-<i><j:03d>.
+    Returns the codes, for building queries.
+    """
+    rng = random.Random(seed)
+    docs_dir.mkdir(parents=True, exist_ok=True)
+    codes: List[str] = []
+    for i in range(files):
+        kind = kinds[i % len(kinds)]
+        paras = []
+        for j in range(paragraphs):
+            code = f"ERR-{i}{j:03d}"
+            codes.append(code)
+            paras.append(paragraph(rng, code))
+        path = docs_dir / f"doc{i:05d}.{kind}"
+        if kind == "pdf":
+            pages = [
+                "\n\n".join(paras[p:p + paragraphs_per_page])
+                for p in range(0, len(paras), paragraphs_per_page)
+            ]
+            write_pdf(path, pages)
+        elif kind == "md":
+            path.write_text(f"# Document {i}\n\n" + "\n\n".join(paras), encoding="utf-8")
+        else:
+            path.write_text("\n\n".join(paras), encoding="utf-8")
+    return codes
+
+
+def make_queries(codes: Sequence[str], n: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    templates = (
+        "What does {code} mean?",
+        "How do I fix {code} in the {w} {w2}?",
+        "{w} {w2} {code}",
+        "Explain the {w} issue behind {code}",
+    )
+    return [
+        rng.choice(templates).format(code=rng.choice(codes), w=rng.choice(_WORDS), w2=rng.choice(_WORDS))
+        for _ in range(n)
+    ]
@@ -0,0 +1,106 @@
+from __future__ import annotations
+from typing import Any, AsyncIterator, Iterator, List, Optional
+import asyncio
+import hashlib
+import re
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+_TOKEN_RE = re.compile(r"[\w\-]+")
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic stand-in for OllamaEmbeddings: hashed bag-of-words vectors,
+    so texts sharing words land close together. Latency per request and per
+    text can be tuned to mimic a local embedding server.
+    """
+
+    def __init__(self, dim: int = 768, request_ms: float = 0.0, per_text_ms: float = 0.0):
+        self.dim = dim
+        self.request_ms = request_ms
+        self.per_text_ms = per_text_ms
+        self.requests = 0
+        self.texts = 0
+        self._word_cache: dict[str, np.ndarray] = {}
+
+    def _word(self, w: str) -> np.ndarray:
+        v = self._word_cache.get(w)
+        if v is None:
+            seed = int.from_bytes(hashlib.blake2b(w.encode(), digest_size=8).digest(), "little")
+            v = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            self._word_cache[w] = v
+        return v
+
+    def _vec(self, text: str) -> List[float]:
+        v = np.zeros(self.dim, dtype=np.float32)
+        for w in _TOKEN_RE.findall(text.lower()):
+            v += self._word(w)
+        n = float(np.linalg.norm(v))
+        return (v / n if n else v).tolist()
+
+    def _delay(self, n: int) -> float:
+        self.requests += 1
+        self.texts += n
+        return (self.request_ms + self.per_text_ms * n) / 1000.0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self._delay(len(texts)))
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self._delay(1))
+        return self._vec(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self._delay(len(texts)))
+        return [self._vec(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self._delay(1))
+        return self._vec(text)
+
+
+class FakeLLM(LLM):
+    """
+    Deterministic stand-in for OllamaLLM: streams `tokens` words taken from
+    the prompt, after `ttft_ms`, with `token_ms` between tokens.
+    """
+
+    tokens: int = 64
+    ttft_ms: float = 0.0
+    token_ms: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-bench"
+
+    def _words(self, prompt: str) -> List[str]:
+        words = prompt.split() or ["ok"]
+        start = int.from_bytes(hashlib.blake2b(prompt.encode(), digest_size=4).digest(), "little") % len(words)
+        return [words[(start + i) % len(words)] + " " for i in range(self.tokens)]
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        return "".join(self._stream_text(prompt))
+
+    def _stream_text(self, prompt: str) -> Iterator[str]:
+        time.sleep(self.ttft_ms / 1000.0)
+        for i, w in enumerate(self._words(prompt)):
+            if i:
+                time.sleep(self.token_ms / 1000.0)
+            yield w
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        for w in self._stream_text(prompt):
+            yield GenerationChunk(text=w)
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        await asyncio.sleep(self.ttft_ms / 1000.0)
+        for i, w in enumerate(self._words(prompt)):
+            if i:
+                await asyncio.sleep(self.token_ms / 1000.0)
+            yield GenerationChunk(text=w)
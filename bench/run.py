@@ -0,0 +1,221 @@
+from __future__ import annotations
+from dataclasses import replace
+from pathlib import Path
+from typing import List, Optional, Sequence
+import argparse
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from rag import RagConfig, create_app_services
+from rag.embed_cache import CachedEmbeddings
+from rag.handles import invalidate, shared
+from rag.retrieval import RetrievalParams
+from rag.tracing import get_tracer
+
+from .corpus import make_corpus, make_queries
+from .fakes import FakeEmbeddings, FakeLLM
+
+MODES = ("similarity", "mmr", "threshold", "hybrid")
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb() -> dict:
+    """
+    High-water resident memory so far (this process, and finished children
+    such as the ingest pool). Monotonic, so read it after each phase.
+    """
+    if resource is None:
+        return {"self": None, "children": None}
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # bytes on macOS, KiB on Linux
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def summarize(samples_s: Sequence[float]) -> dict:
+    ms = np.asarray(samples_s, dtype=np.float64) * 1000.0
+    if not len(ms):
+        return {"n": 0}
+    return {
+        "n": int(len(ms)),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def install_fakes(svc, args) -> FakeEmbeddings:
+    """
+    Put the fake backends into the process-wide handle pool under the keys
+    VectorDB.embeddings() and ChatEngine.llm() use, so the real code paths
+    run unchanged.
+    """
+    cfg = svc.cfg
+    emb = FakeEmbeddings(dim=args.dim, request_ms=args.embed_request_ms, per_text_ms=args.embed_text_ms)
+    shared(("embeddings", cfg.embed_model, str(cfg.cache_dir)), lambda: CachedEmbeddings(
+        emb, cache=svc.vector_db.embed_cache(), model=cfg.embed_model,
+    ))
+    invalidate("llm", cfg.llm_model)
+    shared(("llm", cfg.llm_model), lambda: FakeLLM(
+        tokens=args.answer_tokens, ttft_ms=args.llm_ttft_ms, token_ms=args.llm_token_ms,
+    ))
+    return emb
+
+
+def run_size(root: Path, files: int, args) -> dict:
+    if root.exists():
+        shutil.rmtree(root)
+    root.mkdir(parents=True)
+    cfg = replace(
+        RagConfig.from_project_root(root),
+        vector_backend=args.backend,
+        # measure the real work, not the caches in front of it
+        query_cache_entries=0,
+        answer_cache_entries=0,
+    )
+    svc = create_app_services(root, cfg=cfg)
+    emb = install_fakes(svc, args)
+    get_tracer().reset()
+    out: dict = {"files": files}
+
+    t = time.perf_counter()
+    codes = make_corpus(cfg.docs_dir, files, paragraphs=args.paragraphs, kinds=args.kinds, seed=files)
+    out["corpus"] = {
+        "seconds": round(time.perf_counter() - t, 3),
+        "bytes": sum(p.stat().st_size for p in cfg.docs_dir.iterdir()),
+    }
+
+    t = time.perf_counter()
+    _, stats = svc.index_manager.build_or_update()
+    dt = time.perf_counter() - t
+    out["index"] = {
+        "seconds": round(dt, 3),
+        "files_per_s": round(files / dt, 2),
+        "chunks": stats["chunks"],
+        "chunks_per_s": round(stats["chunks"] / dt, 2),
+        "embed_requests": emb.requests,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    noop = []
+    for _ in range(args.noop_runs):
+        t = time.perf_counter()
+        svc.index_manager.build_or_update()
+        noop.append(time.perf_counter() - t)
+    out["noop_reindex"] = summarize(noop)
+
+    queries = make_queries(codes, args.queries, seed=files + 1)
+    vectors = [emb._vec(q) for q in queries]
+    out["retrieval"] = {}
+    for mode in args.modes:
+        params = RetrievalParams(mode=mode, k=args.k, fetch_k=args.fetch_k, score_threshold=0.0)
+        for q in queries[: min(5, len(queries))]:  # warm up
+            svc.retriever.retrieve(q, params)
+        end_to_end, search = [], []
+        for q, v in zip(queries, vectors):
+            t = time.perf_counter()
+            svc.retriever.retrieve(q, params)
+            end_to_end.append(time.perf_counter() - t)
+            t = time.perf_counter()
+            svc.retriever.retrieve_by_vector(v, params, query=q)
+            search.append(time.perf_counter() - t)
+        out["retrieval"][mode] = {"retrieve": summarize(end_to_end), "search": summarize(search)}
+    out["retrieval_peak_rss_mb"] = peak_rss_mb()
+
+    ttft, total, ctx_tokens = [], [], []
+    params = RetrievalParams(mode="similarity", k=args.k)
+    for q in queries[: args.answers]:
+        stream = svc.chat.answer_stream(q, params)
+        stream.read()
+        m = stream.metrics
+        if m.ttft_s is not None:
+            ttft.append(m.ttft_s)
+        total.append(m.total_s)
+        ctx_tokens.append(m.context_tokens)
+    out["answer"] = {
+        "ttft": summarize(ttft),
+        "total": summarize(total),
+        "context_tokens_mean": round(float(np.mean(ctx_tokens)), 1) if ctx_tokens else 0,
+    }
+
+    out["peak_rss_mb"] = peak_rss_mb()
+    out["stages"] = get_tracer().snapshot()["spans"]
+    svc.vector_db.close()
+    return out
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> dict:
+    ap = argparse.ArgumentParser(description="Offline BuildRAG benchmark (no Ollama needed)")
+    ap.add_argument("--sizes", default="20,100", help="comma-separated corpus sizes (files)")
+    ap.add_argument("--paragraphs", type=int, default=20, help="paragraphs per file")
+    ap.add_argument("--kinds", default="md,txt,pdf", help="file types to cycle through")
+    ap.add_argument("--backend", default="chroma", choices=("chroma", "numpy"))
+    ap.add_argument("--modes", default=",".join(MODES))
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--answers", type=int, default=20)
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--fetch-k", type=int, default=20)
+    ap.add_argument("--noop-runs", type=int, default=3)
+    ap.add_argument("--dim", type=int, default=768, help="fake embedding dimension")
+    ap.add_argument("--embed-request-ms", type=float, default=0.0, help="fake latency per embedding request")
+    ap.add_argument("--embed-text-ms", type=float, default=0.0, help="fake latency per embedded text")
+    ap.add_argument("--llm-ttft-ms", type=float, default=0.0, help="fake time to first token")
+    ap.add_argument("--llm-token-ms", type=float, default=0.0, help="fake time between tokens")
+    ap.add_argument("--answer-tokens", type=int, default=64)
+    ap.add_argument("--workdir", help="where corpora/indexes go (default: a temp dir, removed afterwards)")
+    ap.add_argument("--out", help="write JSON results here (default: stdout)")
+    args = ap.parse_args(argv)
+    args.kinds = tuple(k.strip() for k in args.kinds.split(",") if k.strip())
+    args.modes = tuple(m.strip() for m in args.modes.split(",") if m.strip())
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    work = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="ragbench-"))
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "workdir")},
+        },
+        "runs": [],
+    }
+    try:
+        for n in sizes:
+            print(f"[bench] {n} files ...", file=sys.stderr)
+            results["runs"].append(run_size(work / f"corpus-{n}", n, args))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(work, ignore_errors=True)
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+        print(f"[bench] wrote {args.out}", file=sys.stderr)
+    else:
+        print(text)
+    return results
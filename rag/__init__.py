@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from pathlib import Path
 from dataclasses import dataclass
+from typing import Optional
 
 from .config import RagConfig
 from .db import VectorDB
@@ -26,12 +27,17 @@ class AppServices:
     chat: ChatEngine
 
 
-def create_app_services(project_root: Path) -> AppServices:
+def create_app_services(project_root: Path, cfg: Optional[RagConfig] = None) -> AppServices:
     """
     Single entrypoint to initialize the whole RAG system.
     Use from the UI layer (app.py) or any other runner.
+    Pass `cfg` to override settings (e.g. built with dataclasses.replace);
+    by default the active index version is served (see rag.versions).
     """
-    cfg = RagConfig.from_project_root(project_root)
+    if cfg is None:
+        from .versions import IndexVersions
+
+        cfg = IndexVersions(RagConfig.from_project_root(project_root)).active_config()
 
     vector_db = VectorDB(cfg)
     doc_manager = DocumentManager(cfg)
@@ -58,5 +64,5 @@ __all__ = [
     "ChatEngine",
     "AppServices",
     "create_app_services",
-    "OllamaHealth"
+    "OllamaHealth",
 ]
\ No newline at end of file
@@ -0,0 +1,163 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+import threading
+import time
+
+import numpy as np
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    text: str
+    sources: List[str]
+    chunks: list                      # List[RetrievedChunk]
+    chunk_ids: frozenset
+    doc_hashes: Dict[str, str]        # doc_id -> file_hash the answer was built from
+    similarity: float = 0.0           # set on lookup
+    created: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+def _unit(vec) -> np.ndarray:
+    v = np.asarray(vec, dtype=np.float32)
+    n = float(np.linalg.norm(v))
+    return v / n if n > 0 else v
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by question embedding.
+    A new question hits when it is within `threshold` cosine similarity of
+    an earlier one AND retrieval returned exactly the same chunk ids AND
+    none of the contributing documents has been re-indexed since.
+    """
+
+    def __init__(self, max_entries: int, threshold: float, ttl_s: float = 0.0):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: List[CachedAnswer] = []
+        self._vecs: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def _drop(self, idx: List[int]) -> None:
+        for i in sorted(idx, reverse=True):
+            del self._entries[i]
+            del self._vecs[i]
+        self._matrix = None
+
+    def _expired(self, e: CachedAnswer, now: float) -> bool:
+        return self.ttl_s > 0 and now - e.created > self.ttl_s
+
+    def lookup(
+        self,
+        query_vec,
+        chunk_ids: Iterable[str],
+        doc_hashes: Callable[[Iterable[str]], Dict[str, str]],
+    ) -> Optional[CachedAnswer]:
+        """
+        Best matching entry or None. `doc_hashes` returns the currently indexed
+        file_hash per doc_id and is only called for a candidate hit.
+        """
+        if self.max_entries <= 0:
+            return None
+        ids = frozenset(chunk_ids)
+        q = _unit(query_vec)
+        now = time.monotonic()
+        with self._lock:
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix = np.stack(self._vecs)
+            sims = self._matrix @ q
+            stale = []
+            best = None
+            for i in np.argsort(-sims):
+                if sims[i] < self.threshold:
+                    break
+                e = self._entries[i]
+                if self._expired(e, now):
+                    stale.append(e)
+                    continue
+                if e.chunk_ids == ids:
+                    best = (int(i), float(sims[i]))
+                    break
+            candidate = self._entries[best[0]] if best else None
+
+        if candidate is not None:
+            current = doc_hashes(candidate.doc_hashes.keys())
+            if current != candidate.doc_hashes:
+                # a contributing doc was re-indexed (or removed) since
+                self.invalidate_docs(candidate.doc_hashes.keys())
+                candidate = None
+
+        with self._lock:
+            if stale:
+                gone = {id(e) for e in stale}
+                self._drop([i for i, e in enumerate(self._entries) if id(e) in gone])
+            if candidate is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            candidate.last_used = now
+            candidate.similarity = best[1]
+            return candidate
+
+    def put(
+        self,
+        query_vec,
+        question: str,
+        text: str,
+        sources: List[str],
+        chunks: list,
+        chunk_ids: Iterable[str],
+        doc_hashes: Dict[str, str],
+    ) -> None:
+        if self.max_entries <= 0 or not text.strip():
+            return
+        entry = CachedAnswer(
+            question=question,
+            text=text,
+            sources=list(sources),
+            chunks=list(chunks),
+            chunk_ids=frozenset(chunk_ids),
+            doc_hashes=dict(doc_hashes),
+        )
+        with self._lock:
+            self._entries.append(entry)
+            self._vecs.append(_unit(query_vec))
+            self._matrix = None
+            if len(self._entries) > self.max_entries:
+                lru = min(range(len(self._entries)), key=lambda i: self._entries[i].last_used)
+                self._drop([lru])
+
+    def invalidate_docs(self, doc_ids: Iterable[str]) -> int:
+        """
+        Drop every answer built from any of these documents.
+        """
+        ids = set(doc_ids)
+        with self._lock:
+            idx = [i for i, e in enumerate(self._entries) if ids.intersection(e.doc_hashes)]
+            self._drop(idx)
+        return len(idx)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._vecs.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
@@ -0,0 +1,167 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+import math
+
+
+@dataclass
+class SearchHit:
+    id: str
+    text: str
+    metadata: dict
+    score: Optional[float] = None  # 0-1 relevance
+    embedding: Optional[Any] = None  # only when requested
+
+
+def l2_relevance(distance: float) -> float:
+    """
+    Squared-L2 distance -> relevance, the convention used by the Chroma
+    LangChain wrapper, so every backend reports comparable scores.
+    """
+    return 1.0 - distance / math.sqrt(2)
+
+
+class VectorBackend(ABC):
+    """
+    Storage engine behind VectorDB. Implementations store pre-embedded chunks
+    (id, vector, text, metadata) and answer exact or approximate top-k queries.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings: Sequence, documents: List[str], metadatas: List[dict]) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, ids: List[str]) -> None:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def get(self, ids: List[str], include_embeddings: bool = False) -> List[SearchHit]:
+        """
+        Hits (score=None) for the ids that exist, in the requested order.
+        """
+
+    @abstractmethod
+    def query(self, vector: Sequence[float], k: int, include_embeddings: bool = False) -> List[SearchHit]:
+        """
+        Top-k nearest chunks, best first, with relevance scores.
+        """
+
+    @abstractmethod
+    def iter_records(self, batch_size: int = 1000) -> Iterator[Tuple[str, str, dict]]:
+        """
+        Every stored (id, text, metadata); used for one-time migrations.
+        """
+
+    def sync(self) -> None:
+        """
+        Bring derived structures (e.g. quantized codes) up to date; writer side.
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class ChromaBackend(VectorBackend):
+    """
+    Chroma persistent collection (through the LangChain wrapper, so existing
+    chroma_db/ directories keep working).
+    """
+
+    name = "chroma"
+
+    def __init__(self, persist_dir: Path, embedding_function=None):
+        from langchain_chroma import Chroma
+
+        self.persist_dir = Path(persist_dir)
+        self.store = Chroma(persist_directory=str(self.persist_dir), embedding_function=embedding_function)
+        self._collection = self.store._collection
+        try:
+            self._to_relevance = self.store._select_relevance_score_fn()
+        except Exception:
+            self._to_relevance = l2_relevance
+        try:
+            self._max_batch = self.store._client.get_max_batch_size()
+        except Exception:
+            self._max_batch = 5000
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        n = self._max_batch
+        for i in range(0, len(ids), n):
+            self._collection.upsert(
+                ids=ids[i:i + n],
+                embeddings=embeddings[i:i + n],
+                documents=documents[i:i + n],
+                metadatas=metadatas[i:i + n],
+            )
+
+    def delete(self, ids) -> None:
+        n = self._max_batch
+        for i in range(0, len(ids), n):
+            self._collection.delete(ids=ids[i:i + n])
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def get(self, ids, include_embeddings: bool = False) -> List[SearchHit]:
+        if not ids:
+            return []
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        res = self._collection.get(ids=list(ids), include=include)
+        docs = res.get("documents")
+        metas = res.get("metadatas")
+        embs = res.get("embeddings") if include_embeddings else None
+        by_id = {}
+        for i, cid in enumerate(res.get("ids", [])):
+            by_id[cid] = SearchHit(
+                id=cid,
+                text=(docs[i] if docs is not None else "") or "",
+                metadata=(metas[i] if metas is not None else {}) or {},
+                embedding=embs[i] if embs is not None else None,
+            )
+        return [by_id[c] for c in ids if c in by_id]
+
+    def query(self, vector, k: int, include_embeddings: bool = False) -> List[SearchHit]:
+        if k <= 0:
+            return []
+        include = ["documents", "metadatas", "distances"] + (["embeddings"] if include_embeddings else [])
+        res = self._collection.query(query_embeddings=[list(map(float, vector))], n_results=k, include=include)
+
+        def first(key):
+            col = res.get(key)
+            return col[0] if col is not None and len(col) else None
+
+        ids = first("ids") or []
+        docs, metas, dists = first("documents"), first("metadatas"), first("distances")
+        embs = first("embeddings") if include_embeddings else None
+        return [
+            SearchHit(
+                id=cid,
+                text=(docs[i] if docs is not None else "") or "",
+                metadata=(metas[i] if metas is not None else {}) or {},
+                score=self._to_relevance(dists[i]) if dists is not None else None,
+                embedding=embs[i] if embs is not None else None,
+            )
+            for i, cid in enumerate(ids)
+        ]
+
+    def iter_records(self, batch_size: int = 1000) -> Iterator[Tuple[str, str, dict]]:
+        offset = 0
+        while True:
+            res = self._collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            ids = res.get("ids", []) or []
+            if not ids:
+                return
+            docs = res.get("documents") if res.get("documents") is not None else [""] * len(ids)
+            metas = res.get("metadatas") if res.get("metadatas") is not None else [{}] * len(ids)
+            for cid, text, md in zip(ids, docs, metas):
+                yield cid, text or "", md or {}
+            offset += len(ids)
@@ -0,0 +1,81 @@
+from __future__ import annotations
+from typing import Dict, List, Tuple
+import asyncio
+import weakref
+
+
+class QueryEmbeddingBatcher:
+    """
+    Micro-batcher for query embeddings.
+    Queries arriving within `window_ms` of each other are merged into one
+    embedding request (up to `max_batch` texts); identical queries in a batch
+    are embedded once. State is kept per event loop.
+    """
+
+    def __init__(self, embeddings, window_ms: float = 3.0, max_batch: int = 64):
+        self.embeddings = embeddings
+        self.window_s = max(window_ms, 0.0) / 1000.0
+        self.max_batch = max(max_batch, 1)
+        self.requests = 0
+        self.batches = 0
+        self._state: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+    def _loop_state(self) -> dict:
+        loop = asyncio.get_running_loop()
+        st = self._state.get(loop)
+        if st is None:
+            st = {"pending": [], "timer": None, "tasks": set()}
+            self._state[loop] = st
+        return st
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch": (self.requests / self.batches) if self.batches else 0.0,
+        }
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        st = self._loop_state()
+        fut: asyncio.Future = loop.create_future()
+        st["pending"].append((text, fut))
+        self.requests += 1
+
+        if len(st["pending"]) >= self.max_batch:
+            self._flush(st)
+        elif st["timer"] is None:
+            st["timer"] = loop.call_later(self.window_s, self._flush, st)
+        return await fut
+
+    def _flush(self, st: dict) -> None:
+        if st["timer"] is not None:
+            st["timer"].cancel()
+            st["timer"] = None
+        batch: List[Tuple[str, asyncio.Future]] = st["pending"]
+        st["pending"] = []
+        if batch:
+            self.batches += 1
+            # the loop only holds weak references to tasks: keep one until done
+            task = asyncio.ensure_future(self._run(batch))
+            st["tasks"].add(task)
+            task.add_done_callback(st["tasks"].discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        texts = list(dict.fromkeys(t for t, _ in batch))
+        try:
+            vectors = await self.embeddings.aembed_queries(texts)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        except BaseException:
+            # cancelled (e.g. server shutdown): don't leave the callers waiting
+            for _, fut in batch:
+                fut.cancel()
+            raise
+        by_text: Dict[str, List[float]] = dict(zip(texts, vectors))
+        for t, fut in batch:
+            if not fut.done():
+                fut.set_result(by_text[t])
@@ -1,40 +1,362 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import List, Tuple
-
-from langchain_ollama import OllamaLLM
-from langchain.prompts import PromptTemplate
+from collections import deque
+from dataclasses import dataclass, field
+from functools import partial
+from typing import TYPE_CHECKING, AsyncIterator, Deque, Iterable, Iterator, List, Optional, Tuple
+import asyncio
+import time
 
+from .answer_cache import CachedAnswer, SemanticAnswerCache
 from .config import RagConfig
-from .retrieval import Retriever, RetrievalParams, RetrievedChunk
-
-RAG_PROMPT = PromptTemplate(
-    input_variables=["context", "question"],
-    template=(
-        "You are a careful RAG assistant. Answer the user's question using ONLY the context.\n"
-        "Always answer in English.\n"
-        "If the context does not contain the answer, say: \"I couldn't find that in the provided documents.\"\n\n"
-        "Question: {question}\n\n"
-        "Context:\n{context}\n\n"
-        "Answer:"
-    ),
+from .context import estimate_tokens
+from .handles import shared
+from .limits import AsyncLimiter
+from .retrieval import Retriever, RetrievalParams, RetrievalResult, RetrievedChunk
+from .tracing import Trace, get_tracer, span
+
+if TYPE_CHECKING:
+    from langchain_ollama import OllamaLLM
+
+# plain str.format template (what PromptTemplate does for f-string templates,
+# without importing langchain at startup)
+RAG_PROMPT = (
+    "You are a careful RAG assistant. Answer the user's question using ONLY the context.\n"
+    "Always answer in English.\n"
+    "If the context does not contain the answer, say: \"I couldn't find that in the provided documents.\"\n\n"
+    "Question: {question}\n\n"
+    "Context:\n{context}\n\n"
+    "Answer:"
 )
 
+@dataclass
+class AnswerMetrics:
+    retrieval_s: float = 0.0
+    ttft_s: Optional[float] = None  # time to first token, measured from the start of the request
+    generation_s: float = 0.0
+    total_s: float = 0.0
+    tokens: int = 0                 # streamed token chunks
+    tokens_per_s: Optional[float] = None
+    queued_s: float = 0.0           # async only: time spent waiting for a free slot
+    context_tokens: int = 0         # estimated prompt tokens of the packed context
+    cached: bool = False            # answer served from the semantic answer cache
+
+    def token(self, started: float) -> None:
+        if self.ttft_s is None:
+            self.ttft_s = time.perf_counter() - started
+        self.tokens += 1
+
+    def finish(self, started: float, gen_start: float) -> None:
+        now = time.perf_counter()
+        self.generation_s = now - gen_start
+        self.total_s = now - started
+        if self.ttft_s is not None and self.tokens > 1:
+            decode_s = self.total_s - self.ttft_s
+            self.tokens_per_s = (self.tokens - 1) / decode_s if decode_s > 0 else None
+
+
+class AnswerStream:
+    """
+    Streaming answer. Sources and debug chunks are available right away
+    (retrieval has already run); iterating yields answer tokens as the LLM
+    produces them. `text` and `metrics` are complete once iteration finishes.
+    """
+
+    def __init__(
+        self,
+        tokens: Iterable[str],
+        sources: List[str],
+        debug_chunks: List[RetrievedChunk],
+        metrics: AnswerMetrics,
+        started: float,
+        on_done=None,
+        on_complete=None,
+    ):
+        self.sources = sources
+        self.debug_chunks = debug_chunks
+        self.metrics = metrics
+        self.text = ""
+        self._tokens = tokens
+        self._started = started
+        self._on_done = on_done
+        self._on_complete = on_complete  # called with the full text if generation ran to the end
+        self._consumed = False
+        self.trace: Optional[Trace] = None  # per-answer spans (see rag.tracing)
+
+    def __iter__(self) -> Iterator[str]:
+        if self._consumed:
+            yield self.text
+            return
+        self._consumed = True
+
+        m = self.metrics
+        gen_start = time.perf_counter()
+        parts: list[str] = []
+        complete = False
+        try:
+            for tok in self._tokens:
+                if not tok:
+                    continue
+                m.token(self._started)
+                parts.append(tok)
+                yield tok
+            complete = True
+        finally:
+            self.text = "".join(parts)
+            m.finish(self._started, gen_start)
+            if self._on_done is not None:
+                self._on_done(m)
+            if complete and self._on_complete is not None:
+                self._on_complete(self.text)
+
+    def read(self) -> str:
+        for _ in self:
+            pass
+        return self.text
+
+
+class AsyncAnswerStream:
+    """
+    Async counterpart of AnswerStream: `async for tok in stream`.
+    Holds a concurrency slot until iteration finishes; call aclose()
+    if you decide not to consume it.
+    """
+
+    def __init__(
+        self,
+        tokens: Optional[AsyncIterator[str]],
+        sources: List[str],
+        debug_chunks: List[RetrievedChunk],
+        metrics: AnswerMetrics,
+        started: float,
+        on_done=None,
+        fixed_text: str = "",
+        release=None,
+        on_complete=None,
+    ):
+        self.sources = sources
+        self.debug_chunks = debug_chunks
+        self.metrics = metrics
+        self.text = fixed_text
+        self._tokens = tokens
+        self._started = started
+        self._on_done = on_done
+        self._release = release
+        self._on_complete = on_complete
+        self._consumed = False
+        self.trace: Optional[Trace] = None
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        if self._consumed or self._tokens is None:
+            first = not self._consumed
+            self._consumed = True
+            await self.aclose()
+            if self.text:
+                yield self.text
+            if first and self._on_done is not None:
+                # e.g. a cached answer: still counted in recent_metrics and traces
+                self._on_done(self.metrics)
+            return
+        self._consumed = True
+
+        m = self.metrics
+        gen_start = time.perf_counter()
+        parts: list[str] = []
+        complete = False
+        try:
+            async for tok in self._tokens:
+                if not tok:
+                    continue
+                m.token(self._started)
+                parts.append(tok)
+                yield tok
+            complete = True
+        finally:
+            self.text = "".join(parts)
+            m.finish(self._started, gen_start)
+            await self.aclose()
+            if self._on_done is not None:
+                self._on_done(m)
+            if complete and self._on_complete is not None:
+                self._on_complete(self.text)
+
+    async def aclose(self) -> None:
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    async def read(self) -> str:
+        async for _ in self:
+            pass
+        return self.text
+
+
 @dataclass
 class ChatEngine:
     cfg: RagConfig
     retriever: Retriever
+    recent_metrics: Deque[AnswerMetrics] = field(default_factory=lambda: deque(maxlen=200), repr=False)
+    limiter: Optional[AsyncLimiter] = field(default=None, repr=False)
+
+    def __post_init__(self):
+        if self.limiter is None:
+            self.limiter = AsyncLimiter(
+                self.cfg.max_concurrent_answers,
+                self.cfg.max_queued_answers,
+                self.cfg.answer_queue_timeout_s,
+            )
+
+    def llm(self) -> OllamaLLM:
+        from langchain_ollama import OllamaLLM
+
+        # one client per model for the whole process (keeps its HTTP connection alive)
+        return shared(("llm", self.cfg.llm_model), lambda: OllamaLLM(model=self.cfg.llm_model, temperature=0.2))
+
+    def answer_cache(self) -> SemanticAnswerCache:
+        # shared by all sessions; per index dir, LLM and embedding model
+        key = ("answer_cache", str(self.cfg.db_dir), self.cfg.llm_model, self.cfg.embed_model)
+        return shared(key, lambda: SemanticAnswerCache(
+            self.cfg.answer_cache_entries,
+            self.cfg.answer_cache_threshold,
+            self.cfg.answer_cache_ttl_s,
+        ))
+
+    def _cached_answer(self, result: RetrievalResult) -> Optional[CachedAnswer]:
+        if result.query_vec is None:
+            return None
+        return self.answer_cache().lookup(
+            result.query_vec,
+            [c.chunk_id for c in result.chunks],
+            self.retriever.vector_db.doc_hashes,
+        )
+
+    def _store_answer(self, question: str, result: RetrievalResult, text: str) -> None:
+        if result.query_vec is None:
+            return
+        doc_ids = {c.doc_id for c in result.chunks if c.doc_id}
+        self.answer_cache().put(
+            result.query_vec,
+            question,
+            text,
+            result.sources,
+            result.chunks,
+            [c.chunk_id for c in result.chunks],
+            self.retriever.vector_db.doc_hashes(doc_ids),
+        )
+
+    def _finished(self, trace: Trace, m: AnswerMetrics) -> None:
+        self.recent_metrics.append(m)
+        tracer = get_tracer()
+        if m.cached:
+            # nothing was generated: keep it out of the generation latency/throughput stats
+            tracer.record("chat.answer_cache_hit", m.total_s, trace=trace)
+        else:
+            tracer.record("chat.generate", m.generation_s, trace=trace, tokens=m.tokens)
+        tracer.record("chat.answer", m.total_s, trace=trace)
+
+    def _prompt(self, context: str, question: str) -> str:
+        with span("chat.prompt") as sp:
+            prompt_text = RAG_PROMPT.format(context=context, question=question)
+            sp.set(prompt_tokens=estimate_tokens(prompt_text))
+        return prompt_text
+
+    def answer_stream(self, question: str, params: RetrievalParams) -> AnswerStream:
+        """
+        Retrieve now, generate lazily: iterate the result to stream tokens.
+        Time-to-first-token and tokens/s end up in stream.metrics and recent_metrics;
+        per-stage spans in stream.trace.
+        """
+        with get_tracer().collect() as trace:
+            stream = self._answer_stream(question, params, trace)
+        stream.trace = trace
+        return stream
+
+    def _answer_stream(self, question: str, params: RetrievalParams, trace: Trace) -> AnswerStream:
+        started = time.perf_counter()
+        metrics = AnswerMetrics()
 
-    def answer(self, question: str, params: RetrievalParams):
         if not question.strip():
-            return ("Question cannot be empty.", [], [])
+            return AnswerStream(["Question cannot be empty."], [], [], metrics, started)
 
-        context, sources, debug_chunks = self.retriever.retrieve(question, params=params)
+        with span("chat.retrieve"):
+            result = self.retriever.retrieve(question, params=params)
+        context, sources, debug_chunks = result
+        metrics.retrieval_s = time.perf_counter() - started
+        metrics.context_tokens = result.context_tokens
         if not context.strip():
-            return ("No index found or no relevant context. Please embed/index documents first.", [], debug_chunks)
+            msg = "No index found or no relevant context. Please embed/index documents first."
+            return AnswerStream([msg], [], debug_chunks, metrics, started)
+
+        hit = self._cached_answer(result)
+        if hit is not None:
+            metrics.cached = True
+            return AnswerStream([hit.text], sources, debug_chunks, metrics, started, on_done=partial(self._finished, trace))
+
+        prompt_text = self._prompt(context, question)
+        tokens = self.llm().stream(prompt_text)
+        return AnswerStream(
+            tokens, sources, debug_chunks, metrics, started,
+            on_done=partial(self._finished, trace),
+            on_complete=partial(self._store_answer, question, result),
+        )
+
+    def answer(self, question: str, params: RetrievalParams) -> Tuple[str, List[str], List[RetrievedChunk]]:
+        stream = self.answer_stream(question, params=params)
+        return (stream.read(), stream.sources, stream.debug_chunks)
+
+    async def astream_answer(self, question: str, params: RetrievalParams) -> AsyncAnswerStream:
+        """
+        Async streaming answer over non-blocking Ollama HTTP.
+        Waits for a slot on the global limiter (raises Overloaded when the queue is full),
+        retrieves, and returns a stream whose tokens are generated as you iterate.
+        """
+        with get_tracer().collect() as trace:
+            stream = await self._astream_answer(question, params, trace)
+        stream.trace = trace
+        return stream
+
+    async def _astream_answer(self, question: str, params: RetrievalParams, trace: Trace) -> AsyncAnswerStream:
+        started = time.perf_counter()
+        metrics = AnswerMetrics()
+
+        if not question.strip():
+            return AsyncAnswerStream(None, [], [], metrics, started, fixed_text="Question cannot be empty.")
+
+        await self.limiter.acquire()
+        metrics.queued_s = time.perf_counter() - started
+        try:
+            with span("chat.retrieve"):
+                result = await self.retriever.aretrieve(question, params=params)
+            context, sources, debug_chunks = result
+            metrics.retrieval_s = time.perf_counter() - started - metrics.queued_s
+            metrics.context_tokens = result.context_tokens
+            if not context.strip():
+                self.limiter.release()
+                msg = "No index found or no relevant context. Please embed/index documents first."
+                return AsyncAnswerStream(None, [], debug_chunks, metrics, started, fixed_text=msg)
+
+            hit = await asyncio.to_thread(self._cached_answer, result)
+            if hit is not None:
+                self.limiter.release()
+                metrics.cached = True
+                metrics.total_s = time.perf_counter() - started
+                return AsyncAnswerStream(
+                    None, sources, debug_chunks, metrics, started,
+                    on_done=partial(self._finished, trace),
+                    fixed_text=hit.text,
+                )
 
-        llm = OllamaLLM(model=self.cfg.llm_model, temperature=0.2)
-        prompt_text = RAG_PROMPT.format(context=context, question=question)
-        answer = llm.invoke(prompt_text)
+            prompt_text = self._prompt(context, question)
+            tokens = self.llm().astream(prompt_text)
+        except BaseException:
+            self.limiter.release()
+            raise
+        return AsyncAnswerStream(
+            tokens, sources, debug_chunks, metrics, started,
+            on_done=partial(self._finished, trace),
+            release=self.limiter.release,
+            on_complete=partial(self._store_answer, question, result),
+        )
 
-        return (answer, sources, debug_chunks)
\ No newline at end of file
+    async def aanswer(self, question: str, params: RetrievalParams) -> Tuple[str, List[str], List[RetrievedChunk]]:
+        stream = await self.astream_answer(question, params=params)
+        return (await stream.read(), stream.sources, stream.debug_chunks)
\ No newline at end of file
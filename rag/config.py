@@ -1,11 +1,13 @@
 from dataclasses import dataclass
 from pathlib import Path
+import os
 
 @dataclass(frozen=True)
 class RagConfig:
     base_dir: Path
     docs_dir: Path
     db_dir: Path
+    cache_dir: Path
 
     embed_model: str = "nomic-embed-text"
     llm_model: str = "llama3.1:8b"
@@ -15,11 +17,65 @@ class RagConfig:
 
     default_k: int = 4
 
+    # Max estimated tokens of retrieved context per prompt (<= 0: no limit)
+    context_token_budget: int = 1500
+
+    # Query embedding + retrieval result cache, shared by all sessions (0 entries = off)
+    query_cache_entries: int = 2048
+    query_cache_ttl_s: float = 600.0
+
+    # Semantic answer cache: reuse an answer for a near-duplicate question
+    # (cosine >= threshold) that retrieved the same chunks (0 entries = off)
+    answer_cache_entries: int = 512
+    answer_cache_threshold: float = 0.95
+    answer_cache_ttl_s: float = 24 * 3600.0
+
+    # Vector engine: "chroma" (persistent Chroma collection) or
+    # "numpy" (in-process exact search over memory-mapped arrays)
+    vector_backend: str = "chroma"
+    # numpy backend only: "none" | "int8" (4x smaller) | "binary" (32x smaller)
+    # codes for the first pass, then k * vector_rescore candidates rescored exactly
+    vector_quantization: str = "none"
+    vector_rescore: int = 10
+
+    # Embedding cache (survives reset, lives in cache_dir)
+    embed_cache_max_entries: int = 500_000
+    embed_cache_max_bytes: int = 2 * 1024**3
+
+    # Rehash every file instead of trusting the stat manifest
+    paranoid_hashing: bool = False
+
+    # Indexing pipeline
+    ingest_workers: int = min(8, os.cpu_count() or 1)  # processes for load + split
+    embed_batch_size: int = 64       # texts per embedding request
+    embed_concurrency: int = 4       # embedding requests in flight
+    write_batch_size: int = 1000     # chunks per vector store upsert
+    stream_parse_bytes: int = 8 * 1024 * 1024  # bigger files are parsed page by page in-process
+    # Keep extracted page text per file (by sha256) in cache_dir/parsed,
+    # so re-chunking or rebuilding never parses an unchanged file again
+    parsed_text_cache: bool = True
+
+    # Watch documents/ and index changes automatically (inotify, else polling)
+    watch_docs: bool = False
+    watch_debounce_s: float = 1.0    # quiet time before a changed file is indexed
+    watch_poll_s: float = 2.0        # polling fallback interval
+
+    # Async serving: answers running at once / waiting, and max wait
+    max_concurrent_answers: int = 8
+    max_queued_answers: int = 256
+    answer_queue_timeout_s: float = 60.0
+
+    # HTTP service: merge query embeddings arriving within this window
+    query_batch_window_ms: float = 3.0
+    query_batch_max: int = 64
+
     @staticmethod
     def from_project_root(project_root: Path) -> "RagConfig":
         base = project_root.resolve()
         docs = base / "documents"
         db = base / "chroma_db"
+        cache = base / ".rag_cache"
         docs.mkdir(exist_ok=True)
         db.mkdir(exist_ok=True)
-        return RagConfig(base_dir=base, docs_dir=docs, db_dir=db)
\ No newline at end of file
+        cache.mkdir(exist_ok=True)
+        return RagConfig(base_dir=base, docs_dir=docs, db_dir=db, cache_dir=cache)
\ No newline at end of file
@@ -0,0 +1,202 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+import math
+
+from .backends import SearchHit
+
+CHARS_PER_TOKEN = 4.0  # rough average for English text with llama-style tokenizers
+SEPARATOR = "\n\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (no tokenizer round-trip to Ollama).
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def _boundary(text: str, i: int) -> bool:
+    # position i sits between words (or at either end of text)
+    return i <= 0 or i >= len(text) or text[i - 1].isspace() or text[i].isspace()
+
+
+def _overlap(a: str, b: str, max_chars: int, min_chars: int) -> int:
+    """
+    Length of the longest suffix of `a` that is a prefix of `b` (up to
+    max_chars), if it is at least min_chars long and starts and ends on word
+    boundaries; else 0. A short or mid-word match ("...40 Nm" + "m. Remove")
+    is a coincidence, not the splitter's overlap.
+    """
+    if min_chars <= 0:
+        return 0  # chunks were split without overlap: never merged by text
+    for n in range(min(len(a), len(b), max_chars), min_chars - 1, -1):
+        if a.endswith(b[:n]) and _boundary(b, n) and _boundary(a, len(a) - n):
+            return n
+    return 0
+
+
+@dataclass
+class Passage:
+    """
+    Contiguous text from one doc/page built from one or more retrieved chunks.
+    """
+    text: str
+    doc_key: tuple
+    start: Optional[int]
+    end: Optional[int]
+    rank: int                       # best (lowest) retrieval rank among its chunks
+    hits: List[SearchHit] = field(default_factory=list)
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+
+@dataclass
+class PackedContext:
+    text: str
+    passages: List[Passage]
+    tokens: int          # estimated tokens of `text`
+    input_tokens: int    # estimated tokens of the raw retrieved chunks
+    dropped: int         # passages that did not fit the budget
+
+
+def _doc_key(hit: SearchHit) -> tuple:
+    md = hit.metadata
+    return (md.get("doc_id") or md.get("source"), md.get("page"))
+
+
+def _merge(p: Passage, hit: SearchHit, rank: int, max_overlap: int, min_overlap: int) -> bool:
+    """
+    Try to fold `hit` into passage `p` (same doc/page). Uses start_index
+    offsets when both sides have them, otherwise detects the overlap from
+    the text itself (chunks indexed before start_index was stored), which
+    must be at least min_overlap chars. Returns False if they are not adjacent.
+    """
+    text = hit.text
+    start = hit.metadata.get("start_index")
+    if p.start is not None and isinstance(start, int) and start >= 0:
+        end = start + len(text)
+        if start > p.end or end < p.start:
+            return False
+        if start >= p.start and end <= p.end:
+            pass  # fully contained
+        elif start <= p.start and end >= p.end:
+            p.text, p.start, p.end = text, start, end
+        elif start > p.start:
+            p.text += text[p.end - start:]
+            p.end = end
+        else:
+            p.text = text + p.text[end - p.start:]
+            p.start = start
+    else:
+        if text in p.text:
+            pass
+        elif p.text in text:
+            p.text = text
+        else:
+            tail = _overlap(p.text, text, max_overlap, min_overlap)
+            head = _overlap(text, p.text, max_overlap, min_overlap) if not tail else 0
+            if tail:
+                p.text += text[tail:]
+            elif head:
+                p.text = text + p.text[head:]
+            else:
+                return False
+        p.start = p.end = None
+    p.rank = min(p.rank, rank)
+    p.hits.append(hit)
+    return True
+
+
+def build_passages(hits: Sequence[SearchHit], max_overlap: int = 400, min_overlap: int = 20) -> List[Passage]:
+    """
+    Merge hits from the same doc_id/page whose spans overlap or touch into
+    contiguous passages. Hits are assumed to be in rank order.
+    """
+    passages: List[Passage] = []
+    by_key: dict[tuple, List[Passage]] = {}
+    for rank, hit in enumerate(hits):
+        key = _doc_key(hit)
+        group = by_key.setdefault(key, [])
+        target = None
+        for p in group:
+            if _merge(p, hit, rank, max_overlap, min_overlap):
+                target = p
+                break
+        if target is None:
+            start = hit.metadata.get("start_index")
+            start = start if isinstance(start, int) and start >= 0 else None
+            p = Passage(
+                text=hit.text,
+                doc_key=key,
+                start=start,
+                end=start + len(hit.text) if start is not None else None,
+                rank=rank,
+                hits=[hit],
+            )
+            group.append(p)
+            passages.append(p)
+            continue
+        # a merge can make the passage touch another one in the group; fold those in too
+        for other in [q for q in group if q is not target]:
+            if _merge_passages(target, other, max_overlap, min_overlap):
+                group.remove(other)
+                passages.remove(other)
+    return passages
+
+
+def _merge_passages(p: Passage, other: Passage, max_overlap: int, min_overlap: int) -> bool:
+    probe = SearchHit(
+        id="",
+        text=other.text,
+        metadata={"start_index": other.start} if other.start is not None else {},
+    )
+    if not _merge(p, probe, other.rank, max_overlap, min_overlap):
+        return False
+    p.hits.pop()
+    p.hits.extend(other.hits)
+    return True
+
+
+def pack_context(
+    hits: Sequence[SearchHit],
+    budget_tokens: int,
+    max_overlap: int = 400,
+    separator: str = SEPARATOR,
+    min_overlap: int = 20,
+) -> PackedContext:
+    """
+    Dedupe and merge neighboring chunks into passages, then add passages in
+    rank order until the token budget is used up (budget <= 0: no limit).
+    Chunks without start_index are merged only on a text overlap of at
+    least min_overlap chars.
+    The best passage is truncated rather than dropped if it alone is too big.
+    """
+    passages = build_passages(hits, max_overlap=max_overlap, min_overlap=min_overlap)
+    passages.sort(key=lambda p: p.rank)
+    input_tokens = sum(estimate_tokens(h.text) for h in hits)
+
+    sep_tokens = estimate_tokens(separator)
+    kept: List[Passage] = []
+    used = 0
+    for p in passages:
+        cost = p.tokens + (sep_tokens if kept else 0)
+        if budget_tokens > 0 and used + cost > budget_tokens:
+            if not kept:
+                p.text = p.text[: int(budget_tokens * CHARS_PER_TOKEN)]
+                kept.append(p)
+                used = p.tokens
+            continue
+        kept.append(p)
+        used += cost
+
+    text = separator.join(p.text for p in kept)
+    return PackedContext(
+        text=text,
+        passages=kept,
+        tokens=estimate_tokens(text),
+        input_tokens=input_tokens,
+        dropped=len(passages) - len(kept),
+    )
@@ -1,84 +1,294 @@
 from __future__ import annotations
 from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
 
-from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
-
+from .backends import ChromaBackend, VectorBackend
 from .config import RagConfig
+from .handles import invalidate, release_chroma_system, shared
+from .lexical import LexicalIndex
+from .qcache import QueryCache, bump_generation, read_generation
+from .tracing import span
+from .registry import DocRegistry
+
+if TYPE_CHECKING:
+    from .embed_cache import CachedEmbeddings, EmbeddingCache
 
 @dataclass
 class VectorDB:
+    """
+    Vector store facade. The storage backend (cfg.vector_backend), embedding
+    client, embedding cache and registry are process-wide shared handles
+    (see rag.handles), created lazily and reused by every session;
+    close() invalidates them.
+    """
     cfg: RagConfig
 
     def exists(self) -> bool:
         return self.cfg.db_dir.exists() and any(self.cfg.db_dir.iterdir())
 
-    def embeddings(self) -> OllamaEmbeddings:
-        return OllamaEmbeddings(model=self.cfg.embed_model)
+    def embed_cache(self) -> EmbeddingCache:
+        from .embed_cache import EmbeddingCache
+
+        path = self.cfg.cache_dir / "embeddings.sqlite"
+        return shared(("embed_cache", str(path)), lambda: EmbeddingCache(
+            path,
+            max_entries=self.cfg.embed_cache_max_entries,
+            max_bytes=self.cfg.embed_cache_max_bytes,
+        ))
+
+    def embeddings(self) -> CachedEmbeddings:
+        """
+        Ollama embeddings fronted by the on-disk embedding cache,
+        so unchanged chunk text is never re-embedded.
+        One instance per model, so its HTTP connection pool is reused.
+        """
+        # imported on first use: langchain_ollama costs ~1.5s at import
+        from langchain_ollama import OllamaEmbeddings
 
-    def open(self) -> Chroma:
-        return Chroma(
-            persist_directory=str(self.cfg.db_dir),
-            embedding_function=self.embeddings(),
+        from .embed_cache import CachedEmbeddings
+
+        return shared(("embeddings", self.cfg.embed_model, str(self.cfg.cache_dir)), lambda: CachedEmbeddings(
+            OllamaEmbeddings(model=self.cfg.embed_model),
+            cache=self.embed_cache(),
+            model=self.cfg.embed_model,
+        ))
+
+    def open(self) -> VectorBackend:
+        return shared(
+            ("backend", str(self.cfg.db_dir), self.cfg.vector_backend, self.cfg.embed_model, self.cfg.vector_quantization),
+            self._open_backend,
         )
 
+    def _open_backend(self) -> VectorBackend:
+        with span("vector_db.open", backend=self.cfg.vector_backend):
+            return self._create_backend()
+
+    def _create_backend(self) -> VectorBackend:
+        kind = self.cfg.vector_backend
+        if kind == "chroma":
+            return ChromaBackend(self.cfg.db_dir, embedding_function=self.embeddings())
+        if kind == "numpy":
+            from .npstore import NumpyBackend
+
+            return NumpyBackend(
+                self.cfg.db_dir / "numpy",
+                quantization=self.cfg.vector_quantization,
+                rescore=self.cfg.vector_rescore,
+            )
+        raise ValueError(f"Unknown vector backend: {kind!r} (expected 'chroma' or 'numpy')")
+
+    def registry(self) -> DocRegistry:
+        return shared(("registry", str(self.cfg.db_dir)), self._open_registry)
+
+    def _open_registry(self) -> DocRegistry:
+        reg = DocRegistry(self.cfg.db_dir / "registry.sqlite")
+        fresh = not reg.exists()
+        reg.open()
+        if fresh:
+            self._bootstrap_registry(reg)
+        return reg
+
+    def _bootstrap_registry(self, reg: DocRegistry) -> None:
+        """
+        One-time migration for stores indexed before the registry existed:
+        rebuild it from chunk metadata.
+        """
+        try:
+            backend = self.open()
+            if backend.count() == 0:
+                return
+            reg.bootstrap((cid, md) for cid, _, md in backend.iter_records())
+        except Exception:
+            return
+
+    def lexical(self) -> LexicalIndex:
+        """
+        BM25 index over chunk text, kept in step with upsert/delete_ids.
+        """
+        return shared(("lexical", str(self.cfg.db_dir)), self._open_lexical)
+
+    def _open_lexical(self) -> LexicalIndex:
+        lex = LexicalIndex(self.cfg.db_dir / "lexical.sqlite")
+        fresh = not lex.exists()
+        lex.open()
+        if fresh:
+            # one-time build for stores indexed before the lexical index existed
+            try:
+                backend = self.open()
+                if backend.count():
+                    lex.bootstrap((cid, text) for cid, text, _ in backend.iter_records())
+            except Exception:
+                pass
+        return lex
+
+    def query_cache(self) -> QueryCache:
+        return shared(("query_cache", str(self.cfg.db_dir)), lambda: QueryCache(
+            self.cfg.query_cache_entries,
+            self.cfg.query_cache_ttl_s,
+        ))
+
+    def _generation_path(self):
+        # kept in cache_dir so it survives reset() deleting db_dir
+        return self.cfg.cache_dir / "index_generation"
+
+    def generation(self) -> str:
+        """
+        Token that changes whenever the index content changes (any process).
+        """
+        return read_generation(self._generation_path())
+
+    def bump_generation(self) -> str:
+        """
+        Mark the index as changed: cached retrieval results keyed on the
+        previous generation are never served again.
+        """
+        self.query_cache().results.clear()
+        return bump_generation(self._generation_path())
+
+    def close(self) -> None:
+        """
+        Invalidate the shared handles for this directory
+        (call before the directory is deleted). Every session picks up
+        fresh handles on next use.
+        """
+        d = str(self.cfg.db_dir)
+        for h in invalidate("registry", d) + invalidate("lexical", d) + invalidate("backend", d):
+            h.close()
+        release_chroma_system(self.cfg.db_dir)
+
     def count_chunks(self) -> int:
         if not self.exists():
             return 0
-        db = self.open()
         try:
-            return db._collection.count()
+            return self.registry().count_chunks()
         except Exception:
             return -1
 
     def delete_doc_id(self, doc_id: str) -> int:
         """
         Delete all vectors/chunks belonging to a given doc_id.
-        Returns how many were deleted (best effort).
+        The doc is unpublished atomically first, then its chunks are
+        garbage-collected. Returns how many were deleted.
+        """
+        return self.delete_docs([doc_id])
+
+    def delete_docs(self, doc_ids) -> int:
+        """
+        delete_doc_id for several docs, with a single garbage collection.
         """
         if not self.exists():
             return 0
-        db = self.open()
+        reg = self.registry()
+        n = sum(len(reg.drop_doc(d)) for d in doc_ids)
+        self.collect_garbage()
+        return n
+
+    def stage_chunks(self, doc_id: str, file_hash: str, chunk_ids: list[str]) -> None:
+        """
+        Journal chunks of a doc update before they are written; they are not
+        served until commit_doc (see DocRegistry).
+        """
+        if chunk_ids:
+            self.registry().stage(doc_id, file_hash, chunk_ids)
+
+    def commit_doc(self, doc_id: str, file_name: str, file_hash: str, chunk_ids: list[str], removed_ids: list[str]) -> None:
+        """
+        Finish a document update once its new chunks are written: switch the
+        doc to its new chunk set in one registry transaction. The replaced
+        chunks stay stored (never served) until collect_garbage().
+        """
+        self.registry().commit(doc_id, file_name, file_hash, chunk_ids, removed_ids)
+
+    def collect_garbage(self) -> int:
+        """
+        Delete the chunks replaced by committed updates, in one bulk delete.
+        Returns how many were deleted.
+        """
+        if not self.exists():
+            return 0
+        return self._purge(self.registry().journal(("committed",)), state="committed")
+
+    def recover(self) -> dict:
+        """
+        Finish what an interrupted indexing run left behind: roll unpublished
+        updates back and committed ones forward. Only call from the writer
+        (with no update in flight).
+        """
+        if not self.exists():
+            return {"rolled_back": 0, "rolled_forward": 0, "chunks_deleted": 0}
+        entries = self.registry().journal()
+        deleted = self._purge(entries)
+        return {
+            "rolled_back": sum(1 for _, state, _ in entries if state == "writing"),
+            "rolled_forward": sum(1 for _, state, _ in entries if state == "committed"),
+            "chunks_deleted": deleted,
+        }
+
+    def _purge(self, entries: list, state: Optional[str] = None) -> int:
+        if not entries:
+            return 0
+        ids = sorted({cid for _, _, doc_ids in entries for cid in doc_ids})
+        self.delete_ids(ids)
+        self.registry().clear_journal((doc_id for doc_id, _, _ in entries), state=state)
+        return len(ids)
+
+    def live_chunk_ids(self, chunk_ids: list[str]) -> Optional[set[str]]:
+        """
+        The given chunk ids that are currently published, or None when there
+        is no registry to ask (serve everything).
+        """
         try:
-            before = db._collection.count()
-            db._collection.delete(where={"doc_id": doc_id})
-            after = db._collection.count()
-            return max(0, before - after)
+            reg = self.registry()
+            if not reg.exists():
+                return None
+            return reg.live_ids(chunk_ids)
         except Exception:
-            # Even if we can't compute exact count, attempt delete
-            try:
-                db._collection.delete(where={"doc_id": doc_id})
-            except Exception:
-                pass
-            return -1
+            return None
 
-    def list_indexed_docs(self) -> dict[str, dict]:
+    def upsert(self, ids: list[str], embeddings: list, documents: list[str], metadatas: list[dict]) -> None:
+        """
+        Write pre-embedded chunks to the backend and the lexical index.
+        """
+        if not ids:
+            return
+        backend = self.open()
+        lexical = self.lexical()
+        backend.upsert(ids, embeddings, documents, metadatas)
+        lexical.add(ids, documents)
+
+    def get_chunk_ids(self, doc_id: str) -> set[str]:
+        """
+        Ids of all chunks currently recorded for a doc_id.
+        """
+        if not self.exists():
+            return set()
+        return self.registry().chunk_ids(doc_id)
+
+    def delete_ids(self, ids: list[str]) -> None:
+        if not ids or not self.exists():
+            return
+        self.open().delete(ids)
+        self.lexical().remove(ids)
+
+    def doc_hashes(self, doc_ids) -> dict[str, str]:
         """
-        Returns a dict: doc_id -> {"file_name":..., "file_hash":...}
-        Reads metadata from collection and deduplicates.
+        doc_id -> file_hash of the indexed version, for the given docs.
         """
         if not self.exists():
             return {}
+        try:
+            return self.registry().file_hashes(doc_ids)
+        except Exception:
+            return {}
 
-        db = self.open()
+    def list_indexed_docs(self) -> dict[str, dict]:
+        """
+        Returns a dict: doc_id -> {"file_name", "file_hash", "chunks", "indexed_at", "updated_at"}
+        Answered from the document registry.
+        """
+        if not self.exists():
+            return {}
         try:
-            n = db._collection.count()
-            if n == 0:
-                return {}
-            res = db._collection.get(include=["metadatas"], limit=n)
-            metadatas = res.get("metadatas", []) or []
-            out: dict[str, dict] = {}
-            for md in metadatas:
-                if not md:
-                    continue
-                did = md.get("doc_id")
-                if not did:
-                    continue
-                if did not in out:
-                    out[did] = {
-                        "file_name": md.get("file_name"),
-                        "file_hash": md.get("file_hash"),
-                    }
-            return out
+            return self.registry().list_docs()
         except Exception:
-            return {}
\ No newline at end of file
+            return {}
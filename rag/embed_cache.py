@@ -0,0 +1,207 @@
+from __future__ import annotations
+from array import array
+from pathlib import Path
+from typing import List, Optional, Sequence
+import hashlib
+import sqlite3
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding cache.
+    Keyed by (embed model, sha256 of chunk text) and stored in SQLite,
+    with least-recently-used eviction once entry/byte limits are exceeded.
+    """
+
+    def __init__(self, path: Path, max_entries: int = 500_000, max_bytes: int = 2 * 1024**3):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._tick = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " vec BLOB NOT NULL,"
+            " last_used INTEGER NOT NULL,"
+            " PRIMARY KEY (model, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings(last_used)")
+        self._conn.commit()
+
+        row = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(vec)), 0), COALESCE(MAX(last_used), 0) FROM embeddings"
+        ).fetchone()
+        self._entries, self._bytes, self._tick = int(row[0]), int(row[1]), int(row[2])
+
+    def _next_tick(self) -> int:
+        self._tick += 1
+        return self._tick
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Returns one vector per text, or None where the cache has no entry.
+        """
+        keys = [text_key(t) for t in texts]
+        found: dict[str, List[float]] = {}
+        with self._lock:
+            uniq = list(dict.fromkeys(keys))
+            # stay well below SQLite's bound-parameter limit
+            for i in range(0, len(uniq), 500):
+                part = uniq[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE model = ? AND key IN ({marks})",
+                    [model, *part],
+                ).fetchall()
+                for k, blob in rows:
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    found[k] = vec.tolist()
+            if found:
+                tick = self._next_tick()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                    [(tick, model, k) for k in found],
+                )
+                self._conn.commit()
+
+            out = [found.get(k) for k in keys]
+            hit = sum(1 for v in out if v is not None)
+            self.hits += hit
+            self.misses += len(out) - hit
+        return out
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        rows = {}
+        for t, v in zip(texts, vectors):
+            rows[text_key(t)] = array("f", v).tobytes()
+        if not rows:
+            return
+        with self._lock:
+            tick = self._next_tick()
+            keys = list(rows)
+            old_entries = old_bytes = 0
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                n, size = self._conn.execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings WHERE model = ? AND key IN ({marks})",
+                    [model, *part],
+                ).fetchone()
+                old_entries += int(n)
+                old_bytes += int(size)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings(model, key, vec, last_used) VALUES (?, ?, ?, ?)",
+                [(model, k, blob, tick) for k, blob in rows.items()],
+            )
+            self._entries += len(rows) - old_entries
+            self._bytes += sum(len(b) for b in rows.values()) - old_bytes
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """
+        Drop least-recently-used entries until both limits hold.
+        Caller must hold the lock.
+        """
+        while self._entries > 0 and (self._entries > self.max_entries or self._bytes > self.max_bytes):
+            excess = max(self._entries - self.max_entries, 0)
+            if self._bytes > self.max_bytes and self._entries:
+                avg = max(self._bytes // self._entries, 1)
+                excess = max(excess, (self._bytes - self.max_bytes) // avg + 1)
+            excess = max(excess, 1)
+            rows = self._conn.execute(
+                "SELECT model, key, LENGTH(vec) FROM embeddings ORDER BY last_used LIMIT ?",
+                (excess,),
+            ).fetchall()
+            if not rows:
+                self._entries, self._bytes = 0, 0
+                break
+            self._conn.executemany(
+                "DELETE FROM embeddings WHERE model = ? AND key = ?",
+                [(m, k) for m, k, _ in rows],
+            )
+            self._entries -= len(rows)
+            self._bytes -= sum(int(n) for _, _, n in rows)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": self._entries,
+            "bytes": self._bytes,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._entries, self._bytes = 0, 0
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that answers document embeddings from an EmbeddingCache
+    and only forwards cache misses to the wrapped model.
+    Query embeddings are passed straight through.
+    """
+
+    def __init__(self, inner: Embeddings, cache: EmbeddingCache, model: str):
+        self.inner = inner
+        self.cache = cache
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        out = self.cache.get_many(self.model, texts)
+
+        # embed each missing text once, even if it repeats within the batch
+        missing = list(dict.fromkeys(t for t, v in zip(texts, out) if v is None))
+        if missing:
+            fresh = self.inner.embed_documents(missing)
+            self.cache.put_many(self.model, missing, fresh)
+            by_text = dict(zip(missing, fresh))
+            out = [v if v is not None else list(by_text[t]) for t, v in zip(texts, out)]
+        return out
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.inner.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        out = self.cache.get_many(self.model, texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, out) if v is None))
+        if missing:
+            fresh = await self.inner.aembed_documents(missing)
+            self.cache.put_many(self.model, missing, fresh)
+            by_text = dict(zip(missing, fresh))
+            out = [v if v is not None else list(by_text[t]) for t, v in zip(texts, out)]
+        return out
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.inner.aembed_query(text)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several queries in one request (uncached).
+        Ollama embeds queries and documents identically, so this is a single batch call.
+        """
+        return await self.inner.aembed_documents(texts)
@@ -0,0 +1,83 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable
+import threading
+
+
+class HandlePool:
+    """
+    Process-wide pool of long-lived handles (vector store clients, Ollama
+    clients, SQLite connections). Each handle is created lazily on first use,
+    shared by every session/thread, and can be invalidated by key prefix.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handles: Dict[tuple, Any] = {}
+        self._creating: Dict[tuple, threading.Lock] = {}
+
+    def get(self, key: tuple, factory: Callable[[], Any]) -> Any:
+        h = self._handles.get(key)
+        if h is not None:
+            return h
+        with self._lock:
+            h = self._handles.get(key)
+            if h is not None:
+                return h
+            # per-key lock so a slow factory doesn't block unrelated handles
+            key_lock = self._creating.setdefault(key, threading.Lock())
+        with key_lock:
+            h = self._handles.get(key)
+            if h is None:
+                h = factory()
+                with self._lock:
+                    self._handles[key] = h
+                    self._creating.pop(key, None)
+        return h
+
+    def invalidate(self, *prefix: Hashable) -> list:
+        """
+        Drop every handle whose key starts with prefix; returns the dropped handles
+        so the caller can close them.
+        """
+        n = len(prefix)
+        with self._lock:
+            keys = [k for k in self._handles if k[:n] == prefix]
+            return [self._handles.pop(k) for k in keys]
+
+
+_POOL = HandlePool()
+
+
+def shared(key: tuple, factory: Callable[[], Any]) -> Any:
+    return _POOL.get(key, factory)
+
+
+def invalidate(*prefix: Hashable) -> list:
+    return _POOL.invalidate(*prefix)
+
+
+def release_chroma_system(persist_dir: Path) -> None:
+    """
+    chromadb caches one System per persist directory for the whole process.
+    Stop and forget it so a deleted/recreated directory gets a fresh client.
+    """
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+    except Exception:
+        return
+    target = str(Path(persist_dir).resolve())
+    systems = SharedSystemClient._identifier_to_system
+    for ident in list(systems):
+        try:
+            same = str(Path(ident).resolve()) == target
+        except Exception:
+            same = False
+        if same:
+            system = systems.pop(ident, None)
+            getattr(SharedSystemClient, "_identifier_to_refcount", {}).pop(ident, None)
+            if system is not None:
+                try:
+                    system.stop()
+                except Exception:
+                    pass
@@ -1,14 +1,62 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import partial
+import hashlib
+import os
 import shutil
-from typing import Tuple
-
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple
 
 from .config import RagConfig
 from .db import VectorDB
+from .handles import shared
 from .ingestion import DocumentManager
+from .manifest import FileEntry
+from .jobs import IndexJobRunner
+from .watcher import DocWatcher
+from .pipeline import BatchWriter, EmbedStage, batched, parse_files
+from .tracing import get_tracer
+
+
+def make_chunk_ids(doc_id: str, chunks, seen: Optional[dict] = None) -> List[str]:
+    """
+    Deterministic chunk ids: doc_id plus a hash of the chunk's page and text.
+    Identical chunks within one document get an occurrence suffix so ids stay unique.
+    Pass the same `seen` dict for successive batches of one document.
+    """
+    ids: list[str] = []
+    seen = {} if seen is None else seen
+    for ch in chunks:
+        page = (ch.metadata or {}).get("page", "")
+        digest = hashlib.sha256(f"{page}\x00{ch.page_content}".encode("utf-8")).hexdigest()[:32]
+        n = seen.get(digest, 0)
+        seen[digest] = n + 1
+        ids.append(f"{doc_id}::{digest}" if n == 0 else f"{doc_id}::{digest}-{n}")
+    return ids
+
+@dataclass
+class IndexProgress:
+    """
+    Live state of one build_or_update run, passed to its progress callback.
+    """
+    files_total: int = 0        # supported files found
+    files_pending: int = 0      # new or changed files to (re)index
+    files_done: int = 0         # pending files fully written and committed
+    chunks_written: int = 0
+    current: Optional[str] = None  # doc_id being parsed
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed_s(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def chunks_per_s(self) -> float:
+        dt = self.elapsed_s
+        return self.chunks_written / dt if dt > 0 else 0.0
+
 
 @dataclass
 class IndexManager:
@@ -16,97 +64,290 @@ class IndexManager:
     doc_manager: DocumentManager
     vector_db: VectorDB
 
-    def _split(self, docs):
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.cfg.chunk_size,
-            chunk_overlap=self.cfg.chunk_overlap,
-        )
-        return splitter.split_documents(docs)
+    def jobs(self) -> IndexJobRunner:
+        """
+        Background indexing queue for this index (shared by all sessions,
+        so a browser refresh finds the running job again).
+        """
+        return shared(("index_jobs", str(self.cfg.db_dir)), lambda: IndexJobRunner(
+            self, self.cfg.cache_dir / "jobs" / f"{self.cfg.db_dir.name}.json",
+        ))
 
-    def build_or_update(self) -> Tuple[str, dict]:
+    def watcher(self) -> DocWatcher:
+        """
+        Watcher for documents/ that queues per-file index/remove jobs
+        (start() it; shared by all sessions).
+        """
+        def on_changes(changed: List[Path], removed: List[Path]) -> None:
+            self.jobs().submit_files(changed, removed)
+
+        return shared(("doc_watcher", str(self.cfg.docs_dir), str(self.cfg.db_dir)), lambda: DocWatcher(
+            self.cfg.docs_dir,
+            on_changes,
+            debounce_s=self.cfg.watch_debounce_s,
+            poll_s=self.cfg.watch_poll_s,
+            on_overflow=lambda: self.jobs().submit(),  # events were lost: rescan once
+        ))
+
+    @staticmethod
+    def _empty_stats() -> dict:
+        return {
+            "new": 0, "updated": 0, "skipped": 0, "chunks": 0,
+            "chunks_added": 0, "chunks_removed": 0,
+            "embed_cache_hits": 0, "embed_cache_misses": 0,
+            "cancelled": False,
+        }
+
+    def build_or_update(
+        self,
+        progress: Optional[Callable[[IndexProgress], None]] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Tuple[str, dict]:
         """
         Incremental indexing:
         - New file -> add
-        - Changed file -> delete old doc_id chunks, then add
+        - Changed file -> diff chunk ids, delete removed chunks, add new ones
         - Unchanged file -> skip
+        Changed files are loaded/split in a process pool (large ones page by
+        page in this process), embedded in concurrent batches and written by
+        a single batching writer; a file's chunks flow through in bounded
+        batches, never all at once.
+        Each file is committed to the registry once its chunks are written,
+        which is the checkpoint: after a crash or cancel, the next run skips
+        committed files (and re-embeds a partly written one from the cache).
+        `progress` is called (from the indexing and writer threads) as files
+        start and commit; setting `cancel` stops the run between batches.
         Returns (message, stats dict)
         """
-        files = self.doc_manager.list_files()
-        if not files:
-            return ("No documents found in documents/.", {"new": 0, "updated": 0, "skipped": 0, "chunks": 0})
+        entries = self.doc_manager.scan()
+        if not entries:
+            return ("No documents found in documents/.", self._empty_stats())
+        return self._index_entries(entries, progress, cancel, whole_tree=True)
 
-        indexed = self.vector_db.list_indexed_docs()  # doc_id -> {file_hash,...}
+    def update_files(
+        self,
+        paths: Iterable[Path],
+        progress: Optional[Callable[[IndexProgress], None]] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Tuple[str, dict]:
+        """
+        Incremental indexing of just these files (e.g. from the watcher),
+        without scanning documents/. Missing or unsupported paths are ignored.
+        """
+        entries = [e for e in map(self.doc_manager.entry_for, paths) if e is not None]
+        if not entries:
+            return ("No indexable files.", self._empty_stats())
+        return self._index_entries(entries, progress, cancel, whole_tree=False)
 
-        embeddings = self.vector_db.embeddings()
-        db = None
+    def _index_entries(
+        self,
+        entries: List[FileEntry],
+        progress: Optional[Callable[[IndexProgress], None]],
+        cancel: Optional[threading.Event],
+        whole_tree: bool,
+    ) -> Tuple[str, dict]:
+        started = time.perf_counter()
+        prog = IndexProgress()
+        report = progress or (lambda p: None)
 
-        new_cnt = updated_cnt = skipped_cnt = 0
-        total_chunks = 0
+        indexed = self.vector_db.doc_hashes([e.doc_id for e in entries])  # doc_id -> file_hash
 
-        # Open/create db lazily
-        if self.vector_db.exists():
-            db = Chroma(persist_directory=str(self.cfg.db_dir), embedding_function=embeddings)
+        cache = self.vector_db.embed_cache()
+        hits_before, misses_before = cache.hits, cache.misses
 
-        for fp in files:
-            doc_id = self.doc_manager.make_doc_id(fp)
-            file_hash = self.doc_manager.hash_file(fp)
+        new_cnt = updated_cnt = skipped_cnt = 0
+        total_chunks = added_chunks = removed_chunks = 0
 
-            prev = indexed.get(doc_id)
-            prev_hash = prev.get("file_hash") if prev else None
+        # decide what needs (re)indexing before parsing anything;
+        # unchanged files are recognized from the stat manifest without reading them
+        hashes = self.doc_manager.hash_entries(entries, prune=whole_tree)
+        text_cache = self.doc_manager.text_cache()
+        pending: dict[Path, Tuple[str, str, Optional[str]]] = {}
+        for e in entries:
+            fp, doc_id = e.path, e.doc_id
+            file_hash = hashes[doc_id]
+            prev_hash = indexed.get(doc_id)
 
             if prev_hash == file_hash:
                 skipped_cnt += 1
                 continue
+            pending[fp] = (doc_id, file_hash, prev_hash)
 
-            # load & split this single file
-            raw_docs = self.doc_manager.load_langchain_documents_for_file(fp)
-            if not raw_docs:
-                # unsupported or empty
-                skipped_cnt += 1
-                continue
+        prog.files_total, prog.files_pending = len(entries), len(pending)
+        report(prog)
+        cancelled = False
+
+        if self.vector_db.exists():
+            # e.g. encode quantized codes for vectors written before quantization was enabled
+            self.vector_db.open().sync()
+            # finish what an interrupted run left behind
+            self.vector_db.recover()
+
+        if pending:
+            self.vector_db.open()  # creates the collection if needed
+            self.vector_db.registry()
+            self.vector_db.lexical()
+            writer = BatchWriter(self.vector_db, batch_size=self.cfg.write_batch_size)
+            embedder = EmbedStage(
+                self.vector_db.embeddings(),
+                writer,
+                batch_size=self.cfg.embed_batch_size,
+                concurrency=self.cfg.embed_concurrency,
+            )
+
+            def committed(doc_id, *args) -> None:
+                # runs in the writer thread once the doc's chunks are written
+                self.vector_db.commit_doc(doc_id, *args)
+                prog.files_done += 1
+                prog.chunks_written = writer.written
+                report(prog)
+
+            try:
+                for fp, chunks in parse_files(
+                    pending,
+                    chunk_size=self.cfg.chunk_size,
+                    chunk_overlap=self.cfg.chunk_overlap,
+                    workers=self.cfg.ingest_workers,
+                    stream_bytes=self.cfg.stream_parse_bytes,
+                    text_cache=text_cache,
+                    hashes={fp: file_hash for fp, (_, file_hash, _) in pending.items()},
+                ):
+                    doc_id, file_hash, prev_hash = pending[fp]
+                    prog.current = doc_id
+                    report(prog)
+
+                    # if changed: only touch chunks whose content actually changed
+                    stored = self.vector_db.get_chunk_ids(doc_id) if prev_hash is not None else set()
+                    ids: list[str] = []
+                    seen: dict[str, int] = {}
+                    for batch in batched(chunks, self.cfg.embed_batch_size):
+                        if cancel is not None and cancel.is_set():
+                            cancelled = True
+                            break
+                        # add our metadata on each chunk
+                        for ch in batch:
+                            ch.metadata = dict(ch.metadata or {})
+                            ch.metadata["doc_id"] = doc_id
+                            ch.metadata["file_hash"] = file_hash
+                            ch.metadata["file_name"] = fp.name
+                        batch_ids = make_chunk_ids(doc_id, batch, seen)
+                        ids.extend(batch_ids)
+
+                        to_add = [(cid, ch) for cid, ch in zip(batch_ids, batch) if cid not in stored]
+                        if to_add:
+                            # journaled before written, so a crash can roll them back
+                            self.vector_db.stage_chunks(doc_id, file_hash, [c for c, _ in to_add])
+                            embedder.submit(
+                                [c for c, _ in to_add],
+                                [ch.page_content for _, ch in to_add],
+                                [ch.metadata for _, ch in to_add],
+                            )
+                        added_chunks += len(to_add)
+
+                    if cancelled:
+                        # this doc is left uncommitted; the next run redoes it
+                        break
+                    if not ids:
+                        # unsupported or empty
+                        skipped_cnt += 1
+                        continue
+                    if prev_hash is not None:
+                        updated_cnt += 1
+                    else:
+                        new_cnt += 1
 
-            chunks = self._split(raw_docs)
-
-            # add our metadata on each chunk
-            for ch in chunks:
-                ch.metadata = dict(ch.metadata or {})
-                ch.metadata["doc_id"] = doc_id
-                ch.metadata["file_hash"] = file_hash
-                ch.metadata["file_name"] = fp.name
-
-            # if changed: delete old first
-            if prev_hash is not None and prev_hash != file_hash:
-                self.vector_db.delete_doc_id(doc_id)
-                updated_cnt += 1
-            else:
-                new_cnt += 1
-
-            # create db if needed
-            if db is None:
-                Chroma.from_documents(
-                    documents=chunks,
-                    embedding=embeddings,
-                    persist_directory=str(self.cfg.db_dir),
-                )
-                db = Chroma(persist_directory=str(self.cfg.db_dir), embedding_function=embeddings)
-            else:
-                db.add_documents(chunks)
-
-            total_chunks += len(chunks)
-
-        msg = "Index complete."
-        stats = {"new": new_cnt, "updated": updated_cnt, "skipped": skipped_cnt, "chunks": total_chunks}
+                    removed = sorted(stored.difference(ids))
+                    # once the new chunks are written: drop removed ones and update the registry
+                    embedder.mark(partial(committed, doc_id, fp.name, file_hash, ids, removed))
+
+                    removed_chunks += len(removed)
+                    total_chunks += len(ids)
+            finally:
+                try:
+                    embedder.close()
+                finally:
+                    try:
+                        writer.close()
+                    finally:
+                        try:
+                            # drop replaced chunks in bulk; roll back docs left uncommitted
+                            self.vector_db.recover()
+                        finally:
+                            # even a partial run changed the index
+                            self.vector_db.bump_generation()
+
+            prog.chunks_written = writer.written
+
+        if whole_tree and not cancelled and text_cache is not None:
+            # parsed text of files that are gone (or changed) is never read again
+            text_cache.prune(hashes.values())
+
+        prog.current = None
+        report(prog)
+        msg = "Index cancelled." if cancelled else "Index complete."
+        stats = {
+            "new": new_cnt,
+            "updated": updated_cnt,
+            "skipped": skipped_cnt,
+            "chunks": total_chunks,
+            "chunks_added": added_chunks,
+            "chunks_removed": removed_chunks,
+            "embed_cache_hits": cache.hits - hits_before,
+            "embed_cache_misses": cache.misses - misses_before,
+            "cancelled": cancelled,
+        }
+        get_tracer().record(
+            "index.build",
+            time.perf_counter() - started,
+            files=len(entries),
+            changed=new_cnt + updated_cnt,
+            chunks_added=added_chunks,
+            chunks_removed=removed_chunks,
+        )
         return (msg, stats)
 
+    def remove_files(self, paths: Iterable[Path]) -> int:
+        """
+        Remove deleted (or moved-away) files from the index; a directory path
+        removes every doc under it. Returns how many chunks were deleted.
+        """
+        doc_ids: set[str] = set()
+        listed: Optional[dict] = None
+        for p in paths:
+            try:
+                doc_id = self.doc_manager.make_doc_id(Path(p))
+            except ValueError:
+                continue
+            if self.vector_db.doc_hashes([doc_id]):
+                doc_ids.add(doc_id)
+                continue
+            if listed is None:
+                listed = self.vector_db.list_indexed_docs()
+            prefix = doc_id.rstrip(os.sep) + os.sep
+            doc_ids.update(d for d in listed if d.startswith(prefix))
+        if not doc_ids:
+            return 0
+        try:
+            return self.vector_db.delete_docs(sorted(doc_ids))
+        finally:
+            self.vector_db.bump_generation()
+
     def remove_from_index(self, file_path) -> int:
         """
         Remove a single file's vectors from the DB by doc_id.
         """
         fp = file_path if hasattr(file_path, "resolve") else self.cfg.docs_dir / str(file_path)
         doc_id = self.doc_manager.make_doc_id(fp)
-        return self.vector_db.delete_doc_id(doc_id)
+        try:
+            return self.vector_db.delete_doc_id(doc_id)
+        finally:
+            self.vector_db.bump_generation()
 
     def reset(self) -> None:
+        # never delete the store under a running build
+        self.jobs().cancel(wait=True)
+        self.vector_db.close()
         if self.cfg.db_dir.exists():
             shutil.rmtree(self.cfg.db_dir)
-        self.cfg.db_dir.mkdir(exist_ok=True)
\ No newline at end of file
+        self.cfg.db_dir.mkdir(exist_ok=True)
+        self.vector_db.bump_generation()
\ No newline at end of file
@@ -1,25 +1,118 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable, List, Union
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Union
 import hashlib
-
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from langchain_core.documents import Document
+import os
 
 from .config import RagConfig
+from .manifest import FileEntry, FileManifest
+from .tracing import span
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from .textcache import ParsedTextCache
 
 PathLike = Union[str, Path]
 
+SUPPORTED_SUFFIXES = (".pdf", ".txt", ".md")
+
+
+def iter_documents(file_path: Path) -> Iterator[Document]:
+    """
+    Yield one file's LangChain Documents lazily: one per PDF page, parsed as
+    the caller advances, so a 3,000-page manual is never held in memory whole.
+    """
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader
+
+    suffix = file_path.suffix.lower()
+    if suffix == ".pdf":
+        yield from PyPDFLoader(str(file_path)).lazy_load()
+    elif suffix in (".txt", ".md"):
+        yield from TextLoader(str(file_path)).lazy_load()
+
+
 @dataclass
 class DocumentManager:
     cfg: RagConfig
+    _manifest: Optional[FileManifest] = field(default=None, init=False, repr=False)
+
+    def manifest(self) -> FileManifest:
+        if self._manifest is None:
+            self._manifest = FileManifest(self.cfg.cache_dir / "manifest.json")
+        return self._manifest
+
+    def text_cache(self) -> Optional[ParsedTextCache]:
+        """
+        Parsed-text cache in cache_dir/parsed (None if disabled).
+        """
+        if not self.cfg.parsed_text_cache:
+            return None
+        from .textcache import ParsedTextCache
+
+        return ParsedTextCache(self.cfg.cache_dir / "parsed")
+
+    def scan(self) -> List[FileEntry]:
+        """
+        Single os.scandir walk over documents/.
+        Returns supported files with their stat signature, sorted by path.
+        """
+        with span("docs.scan") as sp:
+            out = self._scan()
+            sp.set(files=len(out))
+        return out
+
+    def _scan(self) -> List[FileEntry]:
+        out: list[FileEntry] = []
+        root = str(self.cfg.docs_dir)
+        stack = [(root, "")]
+        while stack:
+            dir_path, rel = stack.pop()
+            try:
+                it = os.scandir(dir_path)
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((entry.path, rel + entry.name + os.sep))
+                            continue
+                        if not entry.name.endswith(SUPPORTED_SUFFIXES) or not entry.is_file():
+                            continue
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    out.append(FileEntry(
+                        path=Path(entry.path),
+                        doc_id=rel + entry.name,
+                        size=st.st_size,
+                        mtime_ns=st.st_mtime_ns,
+                        inode=st.st_ino,
+                    ))
+        out.sort(key=lambda e: e.path)
+        return out
 
     def list_files(self) -> List[Path]:
-        files: list[Path] = []
-        for ext in ("*.pdf", "*.txt", "*.md"):
-            files.extend(self.cfg.docs_dir.rglob(ext))
-        return sorted(files)
+        return [e.path for e in self.scan()]
+
+    def entry_for(self, file_path: Path) -> Optional[FileEntry]:
+        """
+        Stat signature of one file (as scan() would report it), or None if it
+        is missing, unsupported or outside documents/.
+        """
+        path = Path(file_path)
+        if not path.name.endswith(SUPPORTED_SUFFIXES):
+            return None
+        try:
+            st = path.stat()
+            doc_id = self.make_doc_id(path)
+        except (OSError, ValueError):
+            return None
+        if not path.is_file():
+            return None
+        return FileEntry(path=path, doc_id=doc_id, size=st.st_size, mtime_ns=st.st_mtime_ns, inode=st.st_ino)
 
     def make_doc_id(self, file_path: Path) -> str:
         # stable id: relative path inside documents/
@@ -35,6 +128,47 @@ class DocumentManager:
                 h.update(chunk)
         return h.hexdigest()
 
+    def hash_entries(
+        self,
+        entries: List[FileEntry],
+        paranoid: Optional[bool] = None,
+        prune: bool = True,
+    ) -> Dict[str, str]:
+        """
+        Returns doc_id -> sha256 for the scanned entries.
+        Files whose (size, mtime_ns, inode) match the manifest are not read;
+        paranoid mode (cfg.paranoid_hashing) rehashes everything anyway.
+        With prune (entries is the whole tree), manifest entries for other
+        files are dropped.
+        """
+        if paranoid is None:
+            paranoid = self.cfg.paranoid_hashing
+        manifest = self.manifest()
+
+        out: dict[str, str] = {}
+        stale: list[FileEntry] = []
+        for e in entries:
+            sha = None if paranoid else manifest.lookup(e)
+            if sha is None:
+                stale.append(e)
+            else:
+                out[e.doc_id] = sha
+
+        if stale:
+            workers = max(1, min(self.cfg.ingest_workers, len(stale)))
+            with span("docs.hash", files=len(stale), bytes=sum(e.size for e in stale)):
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    for e, sha in zip(stale, pool.map(lambda e: self.hash_file(e.path), stale)):
+                        out[e.doc_id] = sha
+                        manifest.update(e, sha)
+
+        if prune and len(entries) != len(manifest):
+            manifest.retain(e.doc_id for e in entries)
+            manifest.save()
+        elif stale:
+            manifest.save()
+        return out
+
     def save_upload_bytes(self, filename: str, data: bytes) -> Path:
         out_path = self.cfg.docs_dir / filename
         if out_path.exists():
@@ -69,10 +203,16 @@ class DocumentManager:
         """
         Load one file and return LangChain Documents (with metadata like source/page).
         """
-        suffix = file_path.suffix.lower()
-        if suffix == ".pdf":
-            return PyPDFLoader(str(file_path)).load()
-        elif suffix in (".txt", ".md"):
-            return TextLoader(str(file_path)).load()
-        else:
-            return []
\ No newline at end of file
+        return list(self.iter_langchain_documents_for_file(file_path))
+
+    def iter_langchain_documents_for_file(self, file_path: Path) -> Iterator[Document]:
+        """
+        Like load_langchain_documents_for_file, but yields page by page.
+        Files inside documents/ go through the parsed-text cache.
+        """
+        cache = self.text_cache()
+        entry = self.entry_for(file_path) if cache is not None else None
+        if entry is None:
+            return iter_documents(file_path)
+        file_hash = self.hash_entries([entry], prune=False)[entry.doc_id]
+        return cache.iter_documents(entry.path, file_hash)
\ No newline at end of file
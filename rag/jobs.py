@@ -0,0 +1,226 @@
+from __future__ import annotations
+from dataclasses import asdict, dataclass, field, replace
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, List, Optional
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+if TYPE_CHECKING:
+    from .indexing import IndexManager, IndexProgress
+
+ACTIVE = ("queued", "running")
+
+# seconds between checkpoint file writes while a job runs
+_SAVE_EVERY_S = 1.0
+
+
+@dataclass
+class IndexJob:
+    id: str
+    status: str = "queued"  # queued | running | done | cancelled | failed | interrupted
+    kind: str = "build"     # build (scan documents/) | files (just `paths` and `removed`)
+    paths: List[str] = field(default_factory=list)    # files to (re)index
+    removed: List[str] = field(default_factory=list)  # files/dirs to drop from the index
+    files_total: int = 0
+    files_pending: int = 0
+    files_done: int = 0
+    chunks_written: int = 0
+    chunks_per_s: float = 0.0
+    current: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    message: str = ""
+    stats: dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE
+
+    @property
+    def fraction(self) -> float:
+        if self.status == "done":
+            return 1.0
+        return self.files_done / self.files_pending if self.files_pending else 0.0
+
+
+class IndexJobRunner:
+    """
+    Runs index builds on one background thread, one at a time.
+    submit() queues a full build and submit_files() per-file updates; both
+    coalesce into the job already waiting in the queue, if any.
+    status() shows live per-file progress and throughput, cancel() stops
+    the running build between batches.
+    Job state is checkpointed to a JSON file: a job still marked running
+    when the process starts again was interrupted, and resuming it is just
+    another build (committed files are skipped).
+    """
+
+    def __init__(self, index: IndexManager, state_path: Path):
+        self._index = index
+        self.state_path = Path(state_path)
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread: Optional[threading.Thread] = None
+        self._queued: Optional[IndexJob] = None
+        self._last: Optional[IndexJob] = self._load()
+        self._saved_at = 0.0
+
+    def _load(self) -> Optional[IndexJob]:
+        try:
+            data = json.loads(self.state_path.read_text(encoding="utf-8"))
+            job = IndexJob(**data)
+        except Exception:
+            return None
+        if job.active:
+            # no runner in this process has it: the previous process died
+            job.status = "interrupted"
+            job.current = None
+        return job
+
+    def _save(self, job: IndexJob, force: bool = False) -> None:
+        with self._save_lock:
+            now = time.monotonic()
+            if not force and now - self._saved_at < _SAVE_EVERY_S:
+                return
+            self._saved_at = now
+            with self._lock:
+                data = asdict(job)
+            try:
+                self.state_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+                tmp.write_text(json.dumps(data), encoding="utf-8")
+                os.replace(tmp, self.state_path)
+            except Exception:
+                pass
+
+    def submit(self) -> IndexJob:
+        """
+        Queue a full build (scan documents/, index new and changed files).
+        """
+        with self._lock:
+            job = self._enqueue()
+            job.kind = "build"
+            return replace(job)
+
+    def submit_files(self, changed: Iterable[Path], removed: Iterable[Path] = ()) -> IndexJob:
+        """
+        Queue per-file updates: index `changed`, drop `removed`.
+        The latest request for a path wins.
+        """
+        with self._lock:
+            job = self._enqueue()
+            paths, gone = dict.fromkeys(job.paths), dict.fromkeys(job.removed)
+            for p in map(str, changed):
+                gone.pop(p, None)
+                paths[p] = None
+            for p in map(str, removed):
+                paths.pop(p, None)
+                gone[p] = None
+            job.paths, job.removed = list(paths), list(gone)
+            return replace(job)
+
+    def _enqueue(self) -> IndexJob:
+        # caller holds self._lock
+        if self._queued is not None:
+            return self._queued
+        job = IndexJob(id=uuid.uuid4().hex[:12], kind="files")
+        self._queued = job
+        self._idle.clear()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="rag-index-jobs", daemon=True)
+            self._thread.start()
+        self._queue.put(job)
+        return job
+
+    def status(self) -> Optional[IndexJob]:
+        """
+        Copy of the running job, else the queued one, else the last finished
+        (or interrupted) one.
+        """
+        with self._lock:
+            job = self._last if self._last is not None and self._last.status == "running" else (self._queued or self._last)
+            return replace(job) if job is not None else None
+
+    def cancel(self, wait: bool = False, timeout: Optional[float] = None) -> bool:
+        """
+        Drop the queued build and stop the running one. Returns whether there was anything to cancel.
+        """
+        with self._lock:
+            had = self._queued is not None or (self._last is not None and self._last.status == "running")
+            if self._queued is not None:
+                self._queued.status = "cancelled"
+                self._queued = None
+            if had:
+                self._cancel.set()
+        if wait:
+            self.wait(timeout)
+        return had
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until no build is queued or running.
+        """
+        return self._idle.wait(timeout)
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                if job.status == "cancelled":
+                    if self._queued is None and self._queue.empty():
+                        self._idle.set()
+                    continue
+                self._queued = None
+                self._cancel.clear()
+                job.status = "running"
+                job.started_at = time.time()
+                self._last = job
+            self._save(job, force=True)
+            try:
+                msg, stats = self._execute(job)
+                with self._lock:
+                    job.status = "cancelled" if stats.get("cancelled") else "done"
+                    job.message, job.stats = msg, stats
+            except Exception as e:
+                with self._lock:
+                    job.status = "failed"
+                    job.error = f"{type(e).__name__}: {e}"
+            finally:
+                with self._lock:
+                    job.current = None
+                    job.finished_at = time.time()
+                self._save(job, force=True)
+                with self._lock:
+                    if self._queued is None and self._queue.empty():
+                        self._idle.set()
+
+    def _execute(self, job: IndexJob):
+        progress = partial(self._progress, job)
+        if job.kind == "build":
+            msg, stats = self._index.build_or_update(progress=progress, cancel=self._cancel)
+        else:
+            msg, stats = self._index.update_files(map(Path, job.paths), progress=progress, cancel=self._cancel)
+        if job.removed and not stats.get("cancelled"):
+            stats["chunks_removed"] += self._index.remove_files(map(Path, job.removed))
+        return msg, stats
+
+    def _progress(self, job: IndexJob, p: IndexProgress) -> None:
+        with self._lock:
+            job.files_total = p.files_total
+            job.files_pending = p.files_pending
+            job.files_done = p.files_done
+            job.chunks_written = p.chunks_written
+            job.chunks_per_s = round(p.chunks_per_s, 1)
+            job.current = p.current
+        self._save(job)
@@ -0,0 +1,134 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+import re
+import sqlite3
+import threading
+
+# keep '-' and '_' inside tokens so ids like ERR-0042 or AB_12 stay whole
+_TOKEN_RE = re.compile(r"[\w\-]+", re.UNICODE)
+
+
+def query_terms(query: str) -> List[str]:
+    terms = []
+    for tok in _TOKEN_RE.findall(query.lower()):
+        tok = tok.strip("-_")
+        if tok:
+            terms.append(tok)
+    return list(dict.fromkeys(terms))
+
+
+class LexicalIndex:
+    """
+    On-disk BM25 inverted index over chunk text (SQLite FTS5).
+    Maintained alongside the vectors: rows are added when chunks are written
+    and removed when chunks are deleted, so it never needs a rebuild.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunk_fts USING fts5("
+                " text, tokenize=\"unicode61 tokenchars '-_'\");"
+                "CREATE TABLE IF NOT EXISTS chunk_rows ("
+                " chunk_id TEXT PRIMARY KEY,"
+                " row INTEGER NOT NULL UNIQUE);"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def open(self) -> None:
+        with self._lock:
+            self._db()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def add(self, ids: Sequence[str], texts: Sequence[str]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            db = self._db()
+            with db:
+                self._remove(db, ids)
+                for cid, text in zip(ids, texts):
+                    cur = db.execute("INSERT INTO chunk_fts(text) VALUES (?)", (text,))
+                    db.execute("INSERT INTO chunk_rows(chunk_id, row) VALUES (?, ?)", (cid, cur.lastrowid))
+
+    def remove(self, ids: Sequence[str]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            if not self.exists():
+                return
+            db = self._db()
+            with db:
+                self._remove(db, ids)
+
+    def _remove(self, db: sqlite3.Connection, ids: Sequence[str]) -> None:
+        ids = list(ids)
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            marks = ",".join("?" * len(part))
+            rows = [r[0] for r in db.execute(f"SELECT row FROM chunk_rows WHERE chunk_id IN ({marks})", part)]
+            if rows:
+                db.executemany("DELETE FROM chunk_fts WHERE rowid = ?", [(r,) for r in rows])
+                db.execute(f"DELETE FROM chunk_rows WHERE chunk_id IN ({marks})", part)
+
+    def search(self, query: str, limit: int) -> List[Tuple[str, float]]:
+        """
+        Top chunks by BM25 for any of the query terms.
+        Returns [(chunk_id, score)] best first; higher score is better.
+        """
+        terms = query_terms(query)
+        if not terms or limit <= 0:
+            return []
+        match = " OR ".join('"' + t.replace('"', '""') + '"' for t in terms)
+        with self._lock:
+            if not self.exists():
+                return []
+            try:
+                rows = self._db().execute(
+                    "SELECT r.chunk_id, bm25(chunk_fts) AS s FROM chunk_fts"
+                    " JOIN chunk_rows r ON r.row = chunk_fts.rowid"
+                    " WHERE chunk_fts MATCH ? ORDER BY s LIMIT ?",
+                    (match, limit),
+                ).fetchall()
+            except sqlite3.OperationalError:
+                return []
+        # FTS5's bm25() is "lower is better"; flip the sign
+        return [(cid, -s) for cid, s in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            if not self.exists():
+                return 0
+            return int(self._db().execute("SELECT COUNT(*) FROM chunk_rows").fetchone()[0])
+
+    def bootstrap(self, records: Iterable[Tuple[str, str]]) -> None:
+        """
+        Fill an empty index from (chunk_id, text) pairs of an existing store.
+        """
+        ids, texts = [], []
+        for cid, text in records:
+            ids.append(cid)
+            texts.append(text or "")
+            if len(ids) >= 1000:
+                self.add(ids, texts)
+                ids, texts = [], []
+        self.add(ids, texts)
@@ -0,0 +1,72 @@
+from __future__ import annotations
+from typing import Optional
+import asyncio
+import weakref
+
+
+class Overloaded(RuntimeError):
+    """
+    Raised when the wait queue is full or a queued request timed out.
+    Callers should shed load (e.g. HTTP 503) instead of piling up work.
+    """
+
+
+class AsyncLimiter:
+    """
+    Global concurrency cap for async work with a bounded wait queue.
+    At most `max_concurrency` holders run at once, at most `max_queue`
+    wait behind them, and a waiter gives up after `queue_timeout_s`.
+    State is kept per event loop.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout_s: Optional[float] = None):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.max_queue = max(max_queue, 0)
+        self.queue_timeout_s = queue_timeout_s
+        self.rejected = 0
+        self._state: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, list]" = weakref.WeakKeyDictionary()
+
+    def _loop_state(self) -> list:
+        loop = asyncio.get_running_loop()
+        st = self._state.get(loop)
+        if st is None:
+            # [semaphore, waiting, active]
+            st = [asyncio.Semaphore(self.max_concurrency), 0, 0]
+            self._state[loop] = st
+        return st
+
+    def stats(self) -> dict:
+        waiting = sum(st[1] for st in self._state.values())
+        active = sum(st[2] for st in self._state.values())
+        return {"active": active, "waiting": waiting, "rejected": self.rejected}
+
+    async def acquire(self) -> None:
+        st = self._loop_state()
+        sem = st[0]
+        if sem.locked():
+            if st[1] >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded("too many queued requests")
+            st[1] += 1
+            try:
+                await asyncio.wait_for(sem.acquire(), timeout=self.queue_timeout_s)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise Overloaded("timed out waiting for a free slot") from None
+            finally:
+                st[1] -= 1
+        else:
+            await sem.acquire()
+        st[2] += 1
+
+    def release(self) -> None:
+        st = self._loop_state()
+        st[2] -= 1
+        st[0].release()
+
+    async def __aenter__(self) -> "AsyncLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.release()
@@ -0,0 +1,89 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+import json
+import os
+import time
+
+
+@dataclass(frozen=True)
+class FileEntry:
+    path: Path
+    doc_id: str
+    size: int
+    mtime_ns: int
+    inode: int
+
+
+# Files modified this recently are not trusted from the manifest:
+# a write landing in the same mtime tick as our hash would go unnoticed.
+RACY_WINDOW_NS = 2_000_000_000
+
+
+class FileManifest:
+    """
+    Persisted (doc_id -> size, mtime_ns, inode, sha256) map.
+    If a file's stat signature matches its entry, its stored sha256 is reused
+    and the file is never read.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._entries: Optional[Dict[str, list]] = None
+
+    def _load(self) -> Dict[str, list]:
+        if self._entries is None:
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+                if data.get("version") != self.VERSION:
+                    raise ValueError("manifest version mismatch")
+                self._entries = dict(data.get("files") or {})
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def lookup(self, entry: FileEntry) -> Optional[str]:
+        rec = self._load().get(entry.doc_id)
+        if not rec:
+            return None
+        size, mtime_ns, inode, sha = rec
+        if size == entry.size and mtime_ns == entry.mtime_ns and inode == entry.inode:
+            return sha
+        return None
+
+    def update(self, entry: FileEntry, sha256: str) -> None:
+        entries = self._load()
+        if time.time_ns() - entry.mtime_ns < RACY_WINDOW_NS:
+            # too fresh to trust next time; rehash on the next run
+            entries.pop(entry.doc_id, None)
+            return
+        entries[entry.doc_id] = [entry.size, entry.mtime_ns, entry.inode, sha256]
+
+    def retain(self, doc_ids: Iterable[str]) -> None:
+        """
+        Drop entries for files that no longer exist.
+        """
+        keep = set(doc_ids)
+        entries = self._load()
+        for did in [d for d in entries if d not in keep]:
+            del entries[did]
+
+    def save(self) -> None:
+        entries = self._load()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps({"version": self.VERSION, "files": entries}), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        self._entries = {}
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,411 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from .backends import SearchHit, VectorBackend, l2_relevance
+from .quantize import approx_distances, code_dtype, code_width, encode, smallest
+
+
+class _Column:
+    """
+    Append-only variable-length bytes column: `<name>.bin` + int64 end offsets `<name>.off`.
+    """
+
+    def __init__(self, seg: Path, name: str):
+        self.bin_path = seg / f"{name}.bin"
+        self.off_path = seg / f"{name}.off"
+        self.bin_path.touch(exist_ok=True)
+        self.off_path.touch(exist_ok=True)
+        self._ends: Optional[np.ndarray] = None
+        self._blob: Optional[np.memmap] = None
+
+    def refresh(self) -> None:
+        self._ends = np.fromfile(self.off_path, dtype=np.int64) if self.off_path.stat().st_size else np.zeros(0, np.int64)
+        self._blob = np.memmap(self.bin_path, dtype=np.uint8, mode="r") if self.bin_path.stat().st_size else None
+
+    def append(self, values: List[bytes]) -> None:
+        base = int(self._ends[-1]) if self._ends is not None and len(self._ends) else 0
+        ends = np.cumsum([len(v) for v in values], dtype=np.int64) + base
+        with self.bin_path.open("ab") as f:
+            f.write(b"".join(values))
+        with self.off_path.open("ab") as f:
+            f.write(ends.tobytes())
+
+    def truncate(self, rows: int) -> None:
+        """
+        Drop rows written after the last committed count (crash leftovers).
+        """
+        self.refresh()
+        rows = min(rows, len(self._ends))
+        end = int(self._ends[rows - 1]) if rows else 0
+        if len(self._ends) > rows or self.bin_path.stat().st_size > end:
+            os.truncate(self.off_path, rows * 8)
+            os.truncate(self.bin_path, end)
+            self.refresh()
+
+    def get(self, row: int) -> bytes:
+        start = int(self._ends[row - 1]) if row else 0
+        end = int(self._ends[row])
+        return self._blob[start:end].tobytes() if end > start else b""
+
+
+class NumpyBackend(VectorBackend):
+    """
+    In-process exact vector engine for corpora that fit in RAM.
+    Embeddings live in a memory-mapped float32 matrix, squared norms and an
+    alive mask alongside it, and ids/texts/metadata as append-only columns.
+    Top-k is one vectorized matrix-vector product plus argpartition.
+    Opening is just mmap; writes append rows and then atomically publish a new
+    row count in state.json. Deletes are tombstones, compacted once they pile up.
+
+    With quantization="int8" or "binary", compressed codes are kept next to
+    the vectors. A query scans only the codes to pick k * rescore candidates and
+    then rescores those rows exactly. The float32 matrix stays on disk and only
+    the candidate rows are paged in.
+    """
+
+    name = "numpy"
+
+    def __init__(self, path: Path, compact_ratio: float = 0.3, quantization: str = "none", rescore: int = 10):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.compact_ratio = compact_ratio
+        if quantization != "none":
+            code_width(quantization, 1)  # validate
+        self.quantization = quantization
+        self.rescore = max(int(rescore), 1)
+        self._lock = threading.RLock()
+        self._state_mtime: Optional[int] = None
+        self._id_to_row: Optional[Dict[str, int]] = None
+        self._load()
+
+    # ---- storage ----
+
+    def _state_path(self) -> Path:
+        return self.path / "state.json"
+
+    def _read_state(self) -> dict:
+        try:
+            return json.loads(self._state_path().read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {"version": 1, "segment": "seg-0", "dim": 0, "rows": 0, "dead": 0}
+
+    def _write_state(self, state: dict) -> None:
+        tmp = self._state_path().with_suffix(".tmp")
+        tmp.write_text(json.dumps(state), encoding="utf-8")
+        os.replace(tmp, self._state_path())
+        self._state_mtime = self._state_path().stat().st_mtime_ns
+
+    def _load(self) -> None:
+        with self._lock:
+            self.state = self._read_state()
+            seg = self.path / self.state["segment"]
+            seg.mkdir(exist_ok=True)
+            self._seg = seg
+            rows, dim = self.state["rows"], self.state["dim"]
+            self._ids = _Column(seg, "ids")
+            self._texts = _Column(seg, "texts")
+            self._metas = _Column(seg, "metas")
+            for col in (self._ids, self._texts, self._metas):
+                col.refresh()
+            self._vec = self._map("vectors.f32", np.float32, (rows, dim) if dim else (0, 0))
+            self._norms = self._map("norms.f32", np.float32, (rows,))
+            self._alive = self._map("alive.u8", np.uint8, (rows,))
+            self._load_codes(rows, dim)
+            self._id_to_row = None
+            try:
+                self._state_mtime = self._state_path().stat().st_mtime_ns
+            except OSError:
+                self._state_mtime = None
+
+    def _map(self, name: str, dtype, shape) -> np.ndarray:
+        p = self._seg / name
+        p.touch(exist_ok=True)
+        n = int(np.prod(shape))
+        if n == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(p, dtype=dtype, mode="r+", shape=shape)
+
+    def _load_codes(self, rows: int, dim: int) -> None:
+        """
+        Map the quantized codes. They may cover fewer rows than the vectors
+        (quantization just enabled); sync() fills the gap.
+        """
+        self._codes = self._scales = None
+        self._code_rows = 0
+        kind = self.quantization
+        if kind == "none" or not dim:
+            return
+        width = code_width(kind, dim)
+        p = self._seg / f"codes.{kind}"
+        p.touch(exist_ok=True)
+        have = min(p.stat().st_size // width, rows)
+        if kind == "int8":
+            sp = self._seg / "scales.f32"
+            sp.touch(exist_ok=True)
+            have = min(have, sp.stat().st_size // 4)
+            self._scales = self._map("scales.f32", np.float32, (have,))
+        self._codes = self._map(f"codes.{kind}", code_dtype(kind), (have, width))
+        self._code_rows = have
+
+    def _repair(self) -> None:
+        """
+        Writer side: drop bytes appended after the last published row count
+        (a write that crashed before updating state.json).
+        """
+        rows, dim = self.state["rows"], self.state["dim"]
+        sizes = {"vectors.f32": rows * dim * 4, "norms.f32": rows * 4, "alive.u8": rows}
+        if self.quantization != "none" and dim:
+            sizes[f"codes.{self.quantization}"] = self._code_rows * code_width(self.quantization, dim)
+            if self.quantization == "int8":
+                sizes["scales.f32"] = self._code_rows * 4
+        for name, size in sizes.items():
+            p = self._seg / name
+            if p.exists() and p.stat().st_size > size:
+                os.truncate(p, size)
+        for col in (self._ids, self._texts, self._metas):
+            col.truncate(rows)
+
+    def _codes_ready(self) -> bool:
+        return self.quantization != "none" and self.state["rows"] > 0 and self._code_rows == self.state["rows"]
+
+    def _append_codes(self, vecs: np.ndarray) -> None:
+        codes, scales = encode(self.quantization, vecs)
+        self._append_array(f"codes.{self.quantization}", codes)
+        if scales is not None:
+            self._append_array("scales.f32", scales)
+
+    def _sync_codes(self) -> bool:
+        """
+        Encode rows that have no codes yet. Returns True if anything was written.
+        """
+        if self.quantization == "none" or not self.state["dim"]:
+            return False
+        rows, start = self.state["rows"], self._code_rows
+        if start >= rows:
+            return False
+        for i in range(start, rows, 16384):
+            self._append_codes(np.asarray(self._vec[i:min(i + 16384, rows)]))
+        return True
+
+    def sync(self) -> None:
+        with self._lock:
+            self._maybe_reload()
+            self._repair()
+            if self._sync_codes():
+                self._load()
+
+    def _maybe_reload(self) -> None:
+        """
+        Pick up writes made by another process (cheap stat per call).
+        """
+        try:
+            m = self._state_path().stat().st_mtime_ns
+        except OSError:
+            return
+        if m != self._state_mtime:
+            self._load()
+
+    def _rows_map(self) -> Dict[str, int]:
+        if self._id_to_row is None:
+            m: dict[str, int] = {}
+            alive = self._alive
+            for row in range(self.state["rows"]):
+                if alive[row]:
+                    m[self._ids.get(row).decode("utf-8")] = row
+            self._id_to_row = m
+        return self._id_to_row
+
+    def _append_array(self, name: str, arr: np.ndarray) -> None:
+        with (self._seg / name).open("ab") as f:
+            f.write(np.ascontiguousarray(arr).tobytes())
+
+    # ---- VectorBackend ----
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        if not ids:
+            return
+        vecs = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            self._maybe_reload()
+            st = dict(self.state)
+            if st["dim"] == 0:
+                st["dim"] = int(vecs.shape[1])
+            elif vecs.shape[1] != st["dim"]:
+                raise ValueError(f"embedding dim {vecs.shape[1]} != index dim {st['dim']}")
+
+            # later duplicates in the same call win
+            last: dict[str, int] = {}
+            for i, cid in enumerate(ids):
+                last[cid] = i
+            order = sorted(last.values())
+
+            rows = self._rows_map()
+            dead = [rows.pop(ids[i]) for i in order if ids[i] in rows]
+            if dead:
+                self._alive[dead] = 0
+                self._alive.flush()
+
+            self._repair()
+            self._sync_codes()
+            base = st["rows"]
+            v = vecs[order]
+            self._append_array("vectors.f32", v)
+            self._append_array("norms.f32", np.einsum("ij,ij->i", v, v).astype(np.float32))
+            self._append_array("alive.u8", np.ones(len(order), dtype=np.uint8))
+            self._ids.append([ids[i].encode("utf-8") for i in order])
+            self._texts.append([(documents[i] or "").encode("utf-8") for i in order])
+            self._metas.append([json.dumps(metadatas[i] or {}).encode("utf-8") for i in order])
+            if self.quantization != "none":
+                self._append_codes(v)
+
+            st["rows"] = base + len(order)
+            st["dead"] = st.get("dead", 0) + len(dead)
+            self._write_state(st)
+            self._load()
+            self._id_to_row = rows
+            for j, i in enumerate(order):
+                rows[ids[i]] = base + j
+            self._maybe_compact()
+
+    def delete(self, ids) -> None:
+        if not ids:
+            return
+        with self._lock:
+            self._maybe_reload()
+            rows = self._rows_map()
+            dead = [rows.pop(cid) for cid in ids if cid in rows]
+            if not dead:
+                return
+            self._alive[dead] = 0
+            self._alive.flush()
+            st = dict(self.state)
+            st["dead"] = st.get("dead", 0) + len(dead)
+            self._write_state(st)
+            self.state = st
+            self._maybe_compact()
+
+    def count(self) -> int:
+        with self._lock:
+            self._maybe_reload()
+            return int(self.state["rows"] - self.state.get("dead", 0))
+
+    def _hit(self, row: int, score: Optional[float], include_embeddings: bool) -> SearchHit:
+        return SearchHit(
+            id=self._ids.get(row).decode("utf-8"),
+            text=self._texts.get(row).decode("utf-8"),
+            metadata=json.loads(self._metas.get(row) or b"{}"),
+            score=score,
+            embedding=np.array(self._vec[row]) if include_embeddings else None,
+        )
+
+    def get(self, ids, include_embeddings: bool = False) -> List[SearchHit]:
+        with self._lock:
+            self._maybe_reload()
+            rows = self._rows_map()
+            return [self._hit(rows[c], None, include_embeddings) for c in ids if c in rows]
+
+    def query(self, vector, k: int, include_embeddings: bool = False) -> List[SearchHit]:
+        with self._lock:
+            self._maybe_reload()
+            live = self.state["rows"] - self.state.get("dead", 0)
+            if live <= 0 or k <= 0:
+                return []
+            # snapshot the maps; the scan itself runs without the lock
+            vec, norms, alive = self._vec, self._norms, self._alive
+            ids_col, texts_col, metas_col = self._ids, self._texts, self._metas
+            codes, scales = (self._codes, self._scales) if self._codes_ready() else (None, None)
+
+        q = np.asarray(vector, dtype=np.float32)
+        qq = float(q @ q)
+        k = min(k, int(live))
+        if codes is not None:
+            # stage 1: cheap scan over codes; stage 2: exact rescoring of survivors
+            approx = approx_distances(self.quantization, codes, scales, norms, q)
+            approx[alive == 0] = np.inf
+            cand = smallest(approx, k * self.rescore)
+            cand = cand[np.isfinite(approx[cand])]
+            cand_dist = norms[cand] - 2.0 * (vec[cand] @ q) + qq
+            order = smallest(cand_dist, k)
+            top, dist = cand[order].tolist(), dict(zip(cand[order].tolist(), cand_dist[order].tolist()))
+        else:
+            # squared L2 = |v|^2 + |q|^2 - 2 v.q
+            full = norms - 2.0 * (vec @ q) + qq
+            full[alive == 0] = np.inf
+            top = [int(r) for r in smallest(full, k) if np.isfinite(full[r])]
+            dist = {r: float(full[r]) for r in top}
+
+        return [
+            SearchHit(
+                id=ids_col.get(r).decode("utf-8"),
+                text=texts_col.get(r).decode("utf-8"),
+                metadata=json.loads(metas_col.get(r) or b"{}"),
+                score=l2_relevance(max(dist[r], 0.0)),
+                embedding=np.array(vec[r]) if include_embeddings else None,
+            )
+            for r in top
+        ]
+
+    def iter_records(self, batch_size: int = 1000) -> Iterator[Tuple[str, str, dict]]:
+        with self._lock:
+            self._maybe_reload()
+            n = self.state["rows"]
+            alive = np.array(self._alive[:n])
+            cols = (self._ids, self._texts, self._metas)
+        for r in range(n):
+            if alive[r]:
+                yield (
+                    cols[0].get(r).decode("utf-8"),
+                    cols[1].get(r).decode("utf-8"),
+                    json.loads(cols[2].get(r) or b"{}"),
+                )
+
+    # ---- maintenance ----
+
+    def _maybe_compact(self) -> None:
+        st = self.state
+        if st["rows"] >= 1024 and st.get("dead", 0) > self.compact_ratio * st["rows"]:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        Rewrite live rows into a fresh segment and switch state.json to it.
+        Readers holding the old mmaps keep working until they reload.
+        """
+        with self._lock:
+            self._maybe_reload()
+            st = self.state
+            n = st["rows"]
+            live = np.flatnonzero(np.asarray(self._alive[:n]))
+            gen = int(st["segment"].split("-")[-1]) + 1
+            new_seg = self.path / f"seg-{gen}"
+            if new_seg.exists():
+                shutil.rmtree(new_seg)
+            new_seg.mkdir()
+
+            if len(live):
+                (new_seg / "vectors.f32").write_bytes(np.ascontiguousarray(self._vec[live]).tobytes())
+                (new_seg / "norms.f32").write_bytes(np.ascontiguousarray(self._norms[live]).tobytes())
+                (new_seg / "alive.u8").write_bytes(np.ones(len(live), dtype=np.uint8).tobytes())
+                if self._codes_ready():
+                    kind = self.quantization
+                    (new_seg / f"codes.{kind}").write_bytes(np.ascontiguousarray(self._codes[live]).tobytes())
+                    if self._scales is not None:
+                        (new_seg / "scales.f32").write_bytes(np.ascontiguousarray(self._scales[live]).tobytes())
+            for name, col in (("ids", self._ids), ("texts", self._texts), ("metas", self._metas)):
+                out = _Column(new_seg, name)
+                out.refresh()
+                for i in range(0, len(live), 4096):
+                    out.append([col.get(int(r)) for r in live[i:i + 4096]])
+                    out.refresh()
+
+            old_seg = self._seg
+            self._write_state({"version": 1, "segment": new_seg.name, "dim": st["dim"], "rows": int(len(live)), "dead": 0})
+            self._load()
+            shutil.rmtree(old_seg, ignore_errors=True)
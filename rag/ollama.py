@@ -1,5 +1,8 @@
 from __future__ import annotations
+from typing import Optional
 import json
+import threading
+import time
 import urllib.request
 import urllib.error
 
@@ -7,6 +10,37 @@ import urllib.error
 class OllamaHealth:
     def __init__(self, host: str = "http://127.0.0.1:11434"):
         self.host = host.rstrip("/")
+        self._lock = threading.Lock()
+        self._ready = False
+        self._checked_at: Optional[float] = None
+        self._refreshing = False
+
+    def cached_ready(self, max_age_s: float = 5.0, timeout_s: float = 0.35) -> bool:
+        """
+        Last known readiness, for callers that run often (every Streamlit rerun).
+        Only the first call probes inline; after that a stale result is
+        returned as-is while a background thread refreshes it.
+        """
+        with self._lock:
+            checked_at, ready = self._checked_at, self._ready
+            refresh = (
+                checked_at is not None
+                and not self._refreshing
+                and time.monotonic() - checked_at > max_age_s
+            )
+            if refresh:
+                self._refreshing = True
+        if checked_at is None:
+            return self._probe(timeout_s)
+        if refresh:
+            threading.Thread(target=self._probe, args=(timeout_s,), daemon=True).start()
+        return ready
+
+    def _probe(self, timeout_s: float) -> bool:
+        ready = self.is_ready(timeout_s)
+        with self._lock:
+            self._ready, self._checked_at, self._refreshing = ready, time.monotonic(), False
+        return ready
 
     def is_ready(self, timeout_s: float = 0.35) -> bool:
         """
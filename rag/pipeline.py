@@ -0,0 +1,354 @@
+from __future__ import annotations
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import islice
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+import queue
+import threading
+import time
+
+from .db import VectorDB
+from .ingestion import iter_documents
+from .textcache import ParsedTextCache
+from .tracing import get_tracer, span
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import Embeddings
+
+
+def iter_chunks(
+    path: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    timing: Optional[dict] = None,
+    text_cache: Optional[ParsedTextCache] = None,
+    file_hash: Optional[str] = None,
+) -> Iterator[Document]:
+    """
+    Load and split one file page by page: only the current page and its
+    chunks are in memory at any time. Fills `timing` with load/split seconds
+    and page/char counts as it goes.
+    With `text_cache` and the file's sha256, pages come from (or go to) the
+    parsed-text cache, so re-chunking an unchanged file skips parsing.
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    # start_index lets the context packer merge neighboring chunks exactly
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True)
+    timing = timing if timing is not None else {}
+    timing.update(load_s=0.0, split_s=0.0, pages=0, chars=0, cached=0)
+    if text_cache is not None and file_hash:
+        timing["cached"] = int(text_cache.path_for(file_hash, Path(path).suffix).exists())
+        pages = text_cache.iter_documents(Path(path), file_hash)
+    else:
+        pages = iter_documents(Path(path))
+    while True:
+        t0 = time.perf_counter()
+        page = next(pages, None)
+        t1 = time.perf_counter()
+        timing["load_s"] += t1 - t0
+        if page is None:
+            return
+        timing["pages"] += 1
+        timing["chars"] += len(page.page_content)
+        chunks = splitter.split_documents([page])
+        timing["split_s"] += time.perf_counter() - t1
+        yield from chunks
+
+
+def _split_timed(
+    path: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    text_cache: Optional[ParsedTextCache] = None,
+    file_hash: Optional[str] = None,
+) -> Tuple[List[Document], dict]:
+    """
+    Process-pool task: a whole file's chunks (iter_chunks) plus load/split
+    timings, which the parent records (spans cannot be recorded across processes).
+    Module-level so it can be pickled into worker processes.
+    """
+    timing: dict = {}
+    chunks = list(iter_chunks(path, chunk_size, chunk_overlap, timing, text_cache, file_hash))
+    return chunks, timing
+
+
+def _record_parse(chunks: int, timing: dict) -> None:
+    tracer = get_tracer()
+    tracer.record(
+        "index.load", timing["load_s"],
+        files=1, cached_files=timing["cached"], pages=timing["pages"], chars=timing["chars"],
+    )
+    tracer.record("index.split", timing["split_s"], chunks=chunks)
+
+
+def _stream_chunks(
+    path: Path,
+    chunk_size: int,
+    chunk_overlap: int,
+    text_cache: Optional[ParsedTextCache] = None,
+    file_hash: Optional[str] = None,
+) -> Iterator[Document]:
+    timing: dict = {}
+    n = 0
+    for ch in iter_chunks(str(path), chunk_size, chunk_overlap, timing, text_cache, file_hash):
+        n += 1
+        yield ch
+    _record_parse(n, timing)
+
+
+def _file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def batched(items: Iterable, n: int) -> Iterator[list]:
+    """
+    Consecutive lists of up to n items (itertools.batched before 3.12).
+    """
+    it = iter(items)
+    while True:
+        batch = list(islice(it, max(n, 1)))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_files(
+    paths: Iterable[Path],
+    chunk_size: int,
+    chunk_overlap: int,
+    workers: int,
+    stream_bytes: int = 8 * 1024 * 1024,
+    text_cache: Optional[ParsedTextCache] = None,
+    hashes: Optional[Mapping[Path, str]] = None,
+) -> Iterator[Tuple[Path, Iterable[Document]]]:
+    """
+    Yields (path, chunks). Consume each file's chunks before advancing.
+
+    Files of at least `stream_bytes` (and every file when workers <= 1) are
+    parsed lazily in this process: their chunks come out page by page, so
+    memory stays flat and embedding starts before parsing finishes.
+    Smaller files are parsed in a process pool meanwhile; at most 2 * workers
+    of them are in flight, so parsed chunks never pile up faster than the
+    consumer drains them.
+    `text_cache` + `hashes` (path -> sha256) enable the parsed-text cache.
+    """
+    paths = list(paths)
+    hashes = hashes or {}
+
+    def stream(p: Path) -> Iterator[Document]:
+        return _stream_chunks(p, chunk_size, chunk_overlap, text_cache, hashes.get(p))
+
+    if workers <= 1 or len(paths) <= 1:
+        for p in paths:
+            yield p, stream(p)
+        return
+
+    sizes = {p: _file_size(p) for p in paths}
+    large = [p for p in paths if sizes[p] >= stream_bytes]
+    small = [p for p in paths if sizes[p] < stream_bytes]
+    if not small:
+        for p in large:
+            yield p, stream(p)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(small))) as pool:
+        pending: dict[Future, Path] = {}
+        it = iter(small)
+
+        def refill() -> None:
+            while len(pending) < 2 * workers:
+                nxt = next(it, None)
+                if nxt is None:
+                    return
+                pending[pool.submit(_split_timed, str(nxt), chunk_size, chunk_overlap, text_cache, hashes.get(nxt))] = nxt
+
+        def drain(block: bool) -> Iterator[Tuple[Path, List[Document]]]:
+            done, _ = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for fut in done:
+                p = pending.pop(fut)
+                chunks, timing = fut.result()
+                _record_parse(len(chunks), timing)
+                yield p, chunks
+            refill()
+
+        try:
+            refill()
+            for p in large:
+                # the pool keeps parsing small files while this one streams
+                yield p, stream(p)
+                yield from drain(block=False)
+            while pending:
+                yield from drain(block=True)
+        finally:
+            # consumer stopped early (e.g. cancelled): don't parse the rest
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+class BatchWriter:
+    """
+    Single writer thread: buffers embedded chunks and flushes them
+    to the vector store in large upsert batches.
+    Markers (callbacks) run in the writer thread as soon as every chunk
+    queued before them has been written.
+    """
+
+    _STOP = object()
+
+    def __init__(self, vector_db: VectorDB, batch_size: int = 1000, max_pending: int = 8):
+        self.vector_db = vector_db
+        self.batch_size = max(batch_size, 1)
+        self.written = 0
+        self._q: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="rag-index-writer", daemon=True)
+        self._thread.start()
+
+    def put(
+        self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[dict],
+        vectors: List[List[float]],
+        markers: Sequence[Callable[[], None]] = (),
+    ) -> None:
+        if self._error is not None:
+            raise self._error
+        self._q.put((ids, texts, metadatas, vectors, list(markers)))
+
+    def _run(self) -> None:
+        ids: list[str] = []
+        texts: list[str] = []
+        metas: list[dict] = []
+        vecs: list[List[float]] = []
+        markers: list[Callable[[], None]] = []
+        while True:
+            item = self._q.get()
+            if item is self._STOP:
+                break
+            if self._error is not None:
+                continue  # keep draining so producers never block
+            i, t, m, v, mk = item
+            ids.extend(i)
+            texts.extend(t)
+            metas.extend(m)
+            vecs.extend(v)
+            markers.extend(mk)
+            if len(ids) >= self.batch_size or (markers and not ids):
+                self._flush(ids, texts, metas, vecs, markers)
+                ids, texts, metas, vecs, markers = [], [], [], [], []
+        if (ids or markers) and self._error is None:
+            self._flush(ids, texts, metas, vecs, markers)
+
+    def _flush(self, ids, texts, metas, vecs, markers) -> None:
+        try:
+            with span("index.write", chunks=len(ids)):
+                self.vector_db.upsert(ids, vecs, texts, metas)
+            self.written += len(ids)
+            for cb in markers:
+                cb()
+        except BaseException as e:
+            self._error = e
+
+    def close(self) -> None:
+        self._q.put(self._STOP)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+class EmbedStage:
+    """
+    Groups chunks into embedding batches and runs up to `concurrency`
+    embedding requests at once. Finished batches are handed to the writer
+    in submission order, so markers keep their position in the stream.
+    Submission blocks once 2 * concurrency batches are outstanding (backpressure).
+    """
+
+    def __init__(self, embeddings: Embeddings, writer: BatchWriter, batch_size: int = 64, concurrency: int = 4):
+        self.embeddings = embeddings
+        self.writer = writer
+        self.batch_size = max(batch_size, 1)
+        self._pool = ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix="rag-embed")
+        self._slots = threading.Semaphore(2 * max(concurrency, 1))
+        self._futures: list[Future] = []
+        self._ids: list[str] = []
+        self._texts: list[str] = []
+        self._metas: list[dict] = []
+        self._markers: list[Tuple[int, Callable[[], None]]] = []  # (buffer position, callback)
+        self._seq = 0
+        self._next_out = 0
+        self._ready: dict[int, tuple] = {}
+        self._out_lock = threading.RLock()
+        self._error: Optional[BaseException] = None
+
+    def submit(self, ids: List[str], texts: List[str], metadatas: List[dict]) -> None:
+        self._ids.extend(ids)
+        self._texts.extend(texts)
+        self._metas.extend(metadatas)
+        while len(self._ids) >= self.batch_size:
+            self._dispatch(self.batch_size)
+
+    def mark(self, callback: Callable[[], None]) -> None:
+        """
+        Run callback in the writer thread once everything submitted so far is written.
+        """
+        self._markers.append((len(self._ids), callback))
+
+    def _dispatch(self, n: int) -> None:
+        if self._error is not None:
+            raise self._error
+        ids, texts, metas = self._ids[:n], self._texts[:n], self._metas[:n]
+        del self._ids[:n], self._texts[:n], self._metas[:n]
+        markers = [cb for pos, cb in self._markers if pos <= n]
+        self._markers = [(pos - n, cb) for pos, cb in self._markers if pos > n]
+
+        while not self._slots.acquire(timeout=0.1):
+            if self._error is not None:
+                raise self._error
+        seq = self._seq
+        self._seq += 1
+        fut = self._pool.submit(self._embed, seq, ids, texts, metas, markers)
+
+        # surface failures early instead of at the very end
+        pending = [fut]
+        for f in self._futures:
+            if f.done():
+                f.result()
+            else:
+                pending.append(f)
+        self._futures = pending
+
+    def _embed(self, seq, ids, texts, metas, markers) -> None:
+        try:
+            with span("index.embed", texts=len(texts), chars=sum(map(len, texts))):
+                vectors = self.embeddings.embed_documents(texts) if texts else []
+            with self._out_lock:
+                if self._error is not None:
+                    return
+                self._ready[seq] = (ids, texts, metas, vectors, markers)
+                while self._next_out in self._ready:
+                    item = self._ready.pop(self._next_out)
+                    self._next_out += 1
+                    self.writer.put(*item)
+                    self._slots.release()
+        except BaseException as e:
+            with self._out_lock:
+                if self._error is None:
+                    self._error = e
+                # later batches can never be delivered in order
+                self._ready.clear()
+            raise
+
+    def close(self) -> None:
+        try:
+            if self._ids or self._markers:
+                self._dispatch(len(self._ids))
+            for f in self._futures:
+                f.result()
+        finally:
+            self._pool.shutdown(wait=True)
@@ -0,0 +1,122 @@
+from __future__ import annotations
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable
+import os
+import re
+import secrets
+import threading
+import time
+import unicodedata
+
+_WS_RE = re.compile(r"\s+")
+
+_MISSING = object()
+
+
+def normalize_query(query: str) -> str:
+    """
+    Cache key form of a query: NFKC, case-folded, whitespace collapsed.
+    """
+    return _WS_RE.sub(" ", unicodedata.normalize("NFKC", query).casefold()).strip()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after `ttl_s` seconds.
+    max_entries <= 0 disables it.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if self.max_entries <= 0:
+            return default
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING or (self.ttl_s > 0 and item[0] < now):
+                if item is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        expires = time.monotonic() + self.ttl_s if self.ttl_s > 0 else float("inf")
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+class QueryCache:
+    """
+    Per-process cache for the query path, shared by every session:
+      - query embeddings, keyed by (normalized query, embed model)
+      - retrieval results, keyed by (normalized query, params, embed model,
+        index generation), so any index change makes old results unreachable
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.embeddings = TTLCache(max_entries, ttl_s)
+        self.results = TTLCache(max_entries, ttl_s)
+
+    def clear(self) -> None:
+        self.embeddings.clear()
+        self.results.clear()
+
+    def stats(self) -> dict:
+        return {"embeddings": self.embeddings.stats(), "results": self.results.stats()}
+
+
+def read_generation(path: Path) -> str:
+    try:
+        return path.read_text(encoding="utf-8").strip()
+    except OSError:
+        return "0"
+
+
+def bump_generation(path: Path) -> str:
+    """
+    Write a new generation token (counter + random suffix, so concurrent
+    bumps from different processes never produce the same value).
+    """
+    cur = read_generation(path)
+    try:
+        n = int(cur.split(":", 1)[0]) + 1
+    except ValueError:
+        n = 1
+    token = f"{n}:{secrets.token_hex(4)}"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+    tmp.write_text(token, encoding="utf-8")
+    os.replace(tmp, path)
+    return token
@@ -0,0 +1,201 @@
+"""
+Compressed vector codes for a two-stage search: scan the codes to pick a
+candidate set, then rescore the candidates exactly with float32 vectors.
+
+    int8    per-row scalar quantization         4x smaller than float32
+    binary  sign bits (1 bit per dimension)    32x smaller than float32
+
+Benchmark recall@k against memory:
+
+    python -m rag.quantize --n 100000 --dim 768 --k 10
+    python -m rag.quantize --store chroma_db/numpy
+"""
+from __future__ import annotations
+from typing import Optional, Tuple
+import argparse
+import json
+import time
+
+import numpy as np
+
+QUANTIZATIONS = ("none", "int8", "binary")
+
+BLOCK_ROWS = 16384  # rows per scan block; bounds temporaries to a few MB
+
+
+def code_dtype(kind: str):
+    return np.int8 if kind == "int8" else np.uint8
+
+
+def code_width(kind: str, dim: int) -> int:
+    """
+    Bytes (elements) per row of codes.
+    """
+    if kind == "int8":
+        return dim
+    if kind == "binary":
+        return (dim + 7) // 8
+    raise ValueError(f"Unknown quantization: {kind!r} (expected one of {QUANTIZATIONS})")
+
+
+def encode(kind: str, vecs: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Codes for float32 rows. Returns (codes, per-row scales or None).
+    """
+    vecs = np.asarray(vecs, dtype=np.float32)
+    if kind == "int8":
+        scales = np.abs(vecs).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vecs / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    if kind == "binary":
+        return np.packbits(vecs > 0, axis=1), None
+    raise ValueError(f"Unknown quantization: {kind!r} (expected one of {QUANTIZATIONS})")
+
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(x: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(x)
+else:  # numpy < 2.0
+    _POP = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(x: np.ndarray) -> np.ndarray:
+        return _POP[x]
+
+
+def approx_distances(
+    kind: str,
+    codes: np.ndarray,
+    scales: Optional[np.ndarray],
+    norms: np.ndarray,
+    query: np.ndarray,
+) -> np.ndarray:
+    """
+    Approximate distance (lower is better) from the query to every coded row,
+    computed block by block so the float32 matrix is never materialized.
+    int8 estimates squared L2; binary is the Hamming distance of sign bits.
+    """
+    q = np.asarray(query, dtype=np.float32)
+    n = len(codes)
+    out = np.empty(n, dtype=np.float32)
+    if kind == "int8":
+        qq = float(q @ q)
+        for i in range(0, n, BLOCK_ROWS):
+            j = min(i + BLOCK_ROWS, n)
+            dots = codes[i:j].astype(np.float32) @ q
+            out[i:j] = norms[i:j] - 2.0 * scales[i:j] * dots + qq
+    elif kind == "binary":
+        qbits = np.packbits(q > 0)
+        for i in range(0, n, BLOCK_ROWS):
+            j = min(i + BLOCK_ROWS, n)
+            out[i:j] = _popcount(np.bitwise_xor(codes[i:j], qbits)).sum(axis=1, dtype=np.int32)
+    else:
+        raise ValueError(f"Unknown quantization: {kind!r} (expected one of {QUANTIZATIONS})")
+    return out
+
+
+def smallest(values: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k smallest values, sorted ascending.
+    """
+    k = min(k, len(values))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(values, k - 1)[:k] if k < len(values) else np.arange(len(values))
+    return top[np.argsort(values[top], kind="stable")]
+
+
+# ---- benchmark ----
+
+def _exact(vecs: np.ndarray, norms: np.ndarray, q: np.ndarray, k: int) -> np.ndarray:
+    return smallest(norms - 2.0 * (vecs @ q), k)
+
+
+def _two_stage(kind, codes, scales, vecs, norms, q, k, candidates) -> np.ndarray:
+    cand = smallest(approx_distances(kind, codes, scales, norms, q), candidates)
+    exact = norms[cand] - 2.0 * (vecs[cand] @ q)
+    return cand[smallest(exact, k)]
+
+
+def _synthetic(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    # clustered, normalized vectors: closer to text embeddings than pure noise
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(n // 200, 8), dim)).astype(np.float32)
+    vecs = centers[rng.integers(0, len(centers), n)] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def benchmark(
+    vecs: np.ndarray,
+    k: int = 10,
+    queries: int = 200,
+    multipliers=(2, 5, 10, 20),
+    seed: int = 1,
+) -> list[dict]:
+    """
+    recall@k and vector memory for exact search vs each quantization and
+    rescoring depth (candidates = k * multiplier).
+    """
+    vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+    norms = np.einsum("ij,ij->i", vecs, vecs)
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(vecs), queries)
+    qs = vecs[picks] + 0.1 * rng.normal(size=(queries, vecs.shape[1])).astype(np.float32)
+
+    t0 = time.perf_counter()
+    truth = [set(_exact(vecs, norms, q, k).tolist()) for q in qs]
+    exact_ms = (time.perf_counter() - t0) / queries * 1000
+    results = [{
+        "quantization": "none", "candidates": k, "recall": 1.0,
+        "vector_bytes": int(vecs.nbytes), "compression": 1.0, "query_ms": round(exact_ms, 3),
+    }]
+
+    for kind in ("int8", "binary"):
+        codes, scales = encode(kind, vecs)
+        nbytes = codes.nbytes + (scales.nbytes if scales is not None else 0)
+        for m in multipliers:
+            t0 = time.perf_counter()
+            found = [_two_stage(kind, codes, scales, vecs, norms, q, k, k * m) for q in qs]
+            ms = (time.perf_counter() - t0) / queries * 1000
+            recall = float(np.mean([len(truth[i] & set(f.tolist())) / k for i, f in enumerate(found)]))
+            results.append({
+                "quantization": kind, "candidates": k * m, "recall": round(recall, 4),
+                "vector_bytes": int(nbytes), "compression": round(vecs.nbytes / nbytes, 1),
+                "query_ms": round(ms, 3),
+            })
+    return results
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="recall@k vs memory for quantized two-stage search")
+    ap.add_argument("--store", help="NumpyBackend directory to read vectors from (default: synthetic)")
+    ap.add_argument("--n", type=int, default=100_000, help="synthetic vectors")
+    ap.add_argument("--dim", type=int, default=768, help="synthetic dimension")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    args = ap.parse_args(argv)
+
+    if args.store:
+        from .npstore import NumpyBackend
+
+        store = NumpyBackend(args.store)
+        vecs = np.asarray(store._vec)[np.asarray(store._alive) == 1]
+    else:
+        vecs = _synthetic(args.n, args.dim)
+
+    rows = benchmark(vecs, k=args.k, queries=args.queries)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{len(vecs)} vectors x {vecs.shape[1]} dims, recall@{args.k} over {args.queries} queries")
+    print(f"{'quantization':<13}{'candidates':>11}{'recall':>9}{'MB':>10}{'x smaller':>11}{'ms/query':>10}")
+    for r in rows:
+        print(
+            f"{r['quantization']:<13}{r['candidates']:>11}{r['recall']:>9.4f}"
+            f"{r['vector_bytes'] / 1e6:>10.1f}{r['compression']:>11.1f}{r['query_ms']:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import sqlite3
+import threading
+import time
+
+
+class DocRegistry:
+    """
+    Transactional document-level registry stored next to the vectors.
+    Keyed by doc_id: file hash, chunk count, chunk ids and index timestamps.
+    Answers "what is indexed" without touching the vector store.
+
+    Its chunks table is the live set: a document update writes its new
+    chunks to the vector store first (journaled as 'add' while 'writing'),
+    then commit() swaps the doc's chunk list in one transaction and journals
+    the replaced chunks as 'drop'. Chunks outside the live set are never
+    served. Recovery rolls 'writing' entries back (delete their adds) and
+    'committed' ones forward (delete their drops).
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS docs ("
+                " doc_id TEXT PRIMARY KEY,"
+                " file_name TEXT,"
+                " file_hash TEXT,"
+                " chunk_count INTEGER NOT NULL DEFAULT 0,"
+                " indexed_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " chunk_id TEXT PRIMARY KEY,"
+                " doc_id TEXT NOT NULL REFERENCES docs(doc_id) ON DELETE CASCADE);"
+                "CREATE INDEX IF NOT EXISTS chunks_doc ON chunks(doc_id);"
+                "CREATE TABLE IF NOT EXISTS journal ("
+                " doc_id TEXT PRIMARY KEY,"
+                " state TEXT NOT NULL,"
+                " file_hash TEXT,"
+                " started_at REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS journal_chunks ("
+                " doc_id TEXT NOT NULL,"
+                " chunk_id TEXT NOT NULL,"
+                " op TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS journal_chunks_doc ON journal_chunks(doc_id);"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def open(self) -> None:
+        """
+        Create the database and schema if needed.
+        """
+        with self._lock:
+            self._db()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def put_doc(self, doc_id: str, file_name: str, file_hash: str, chunk_ids: List[str]) -> None:
+        """
+        Atomically replace everything known about doc_id.
+        """
+        with self._lock:
+            db = self._db()
+            with db:
+                self._put_doc(db, doc_id, file_name, file_hash, chunk_ids)
+
+    def _put_doc(self, db: sqlite3.Connection, doc_id: str, file_name: str, file_hash: str, chunk_ids: List[str]) -> None:
+        now = time.time()
+        db.execute(
+            "INSERT INTO docs(doc_id, file_name, file_hash, chunk_count, indexed_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(doc_id) DO UPDATE SET"
+            " file_name = excluded.file_name, file_hash = excluded.file_hash,"
+            " chunk_count = excluded.chunk_count, updated_at = excluded.updated_at",
+            (doc_id, file_name, file_hash, len(chunk_ids), now, now),
+        )
+        db.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+        db.executemany(
+            "INSERT OR REPLACE INTO chunks(chunk_id, doc_id) VALUES (?, ?)",
+            [(cid, doc_id) for cid in chunk_ids],
+        )
+
+    def stage(self, doc_id: str, file_hash: str, chunk_ids: List[str]) -> None:
+        """
+        Journal chunks about to be written for a doc update (not live until commit).
+        """
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute(
+                    "INSERT INTO journal(doc_id, state, file_hash, started_at) VALUES (?, 'writing', ?, ?)"
+                    " ON CONFLICT(doc_id) DO UPDATE SET state = 'writing', file_hash = excluded.file_hash",
+                    (doc_id, file_hash, time.time()),
+                )
+                db.executemany(
+                    "INSERT INTO journal_chunks(doc_id, chunk_id, op) VALUES (?, ?, 'add')",
+                    [(doc_id, cid) for cid in chunk_ids],
+                )
+
+    def commit(self, doc_id: str, file_name: str, file_hash: str, chunk_ids: List[str], removed: List[str]) -> None:
+        """
+        The pointer switch: make chunk_ids the doc's live set and journal
+        `removed` for garbage collection, in one transaction.
+        """
+        with self._lock:
+            db = self._db()
+            with db:
+                self._put_doc(db, doc_id, file_name, file_hash, chunk_ids)
+                self._journal_drops(db, doc_id, file_hash, removed)
+
+    def drop_doc(self, doc_id: str) -> List[str]:
+        """
+        Unpublish a doc in one transaction; its chunks are journaled for
+        garbage collection. Returns their ids.
+        """
+        with self._lock:
+            if not self.exists():
+                return []
+            db = self._db()
+            with db:
+                ids = [r[0] for r in db.execute("SELECT chunk_id FROM chunks WHERE doc_id = ?", (doc_id,))]
+                db.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+                db.execute("DELETE FROM docs WHERE doc_id = ?", (doc_id,))
+                self._journal_drops(db, doc_id, None, ids)
+        return ids
+
+    def _journal_drops(self, db: sqlite3.Connection, doc_id: str, file_hash: Optional[str], ids: List[str]) -> None:
+        db.execute(
+            "INSERT INTO journal(doc_id, state, file_hash, started_at) VALUES (?, 'committed', ?, ?)"
+            " ON CONFLICT(doc_id) DO UPDATE SET state = 'committed', file_hash = excluded.file_hash",
+            (doc_id, file_hash, time.time()),
+        )
+        # written adds are live (or garbage to drop) now
+        db.execute("DELETE FROM journal_chunks WHERE doc_id = ? AND op = 'add'", (doc_id,))
+        db.executemany(
+            "INSERT INTO journal_chunks(doc_id, chunk_id, op) VALUES (?, ?, 'drop')",
+            [(doc_id, cid) for cid in ids],
+        )
+
+    def journal(self, states: Iterable[str] = ("writing", "committed")) -> List[Tuple[str, str, List[str]]]:
+        """
+        Unfinished entries as (doc_id, state, journaled chunk ids that are
+        not live): a 'writing' doc's ids are its unpublished adds (roll back),
+        a 'committed' doc's are its replaced chunks (roll forward).
+        """
+        states = list(states)
+        with self._lock:
+            if not self.exists() or not states:
+                return []
+            db = self._db()
+            marks = ",".join("?" * len(states))
+            entries = db.execute(f"SELECT doc_id, state FROM journal WHERE state IN ({marks})", states).fetchall()
+            out = []
+            for doc_id, state in entries:
+                ids = [r[0] for r in db.execute(
+                    "SELECT DISTINCT j.chunk_id FROM journal_chunks j"
+                    " LEFT JOIN chunks c ON c.chunk_id = j.chunk_id"
+                    " WHERE j.doc_id = ? AND c.chunk_id IS NULL",
+                    (doc_id,),
+                )]
+                out.append((doc_id, state, ids))
+        return out
+
+    def clear_journal(self, doc_ids: Iterable[str], state: Optional[str] = None) -> None:
+        """
+        Forget finished journal entries (only those still in `state`, if given).
+        """
+        with self._lock:
+            db = self._db()
+            with db:
+                for did in doc_ids:
+                    if state is not None:
+                        row = db.execute("SELECT state FROM journal WHERE doc_id = ?", (did,)).fetchone()
+                        if row is None or row[0] != state:
+                            continue  # restaged meanwhile
+                    db.execute("DELETE FROM journal_chunks WHERE doc_id = ?", (did,))
+                    db.execute("DELETE FROM journal WHERE doc_id = ?", (did,))
+
+    def live_ids(self, chunk_ids: Iterable[str]) -> set[str]:
+        """
+        The given chunk ids that belong to a committed doc version.
+        """
+        ids = list(chunk_ids)
+        out: set[str] = set()
+        with self._lock:
+            if not ids:
+                return out
+            db = self._db()
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                marks = ",".join("?" * len(part))
+                out.update(r[0] for r in db.execute(f"SELECT chunk_id FROM chunks WHERE chunk_id IN ({marks})", part))
+        return out
+
+    def remove_doc(self, doc_id: str) -> None:
+        with self._lock:
+            if not self.exists():
+                return
+            db = self._db()
+            with db:
+                db.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+                db.execute("DELETE FROM docs WHERE doc_id = ?", (doc_id,))
+
+    def chunk_ids(self, doc_id: str) -> set[str]:
+        with self._lock:
+            if not self.exists():
+                return set()
+            rows = self._db().execute("SELECT chunk_id FROM chunks WHERE doc_id = ?", (doc_id,)).fetchall()
+        return {r[0] for r in rows}
+
+    def file_hashes(self, doc_ids: Iterable[str]) -> Dict[str, str]:
+        """
+        doc_id -> file_hash for the given docs that are indexed.
+        """
+        ids = list(doc_ids)
+        out: Dict[str, str] = {}
+        with self._lock:
+            if not ids or not self.exists():
+                return out
+            db = self._db()
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                marks = ",".join("?" * len(part))
+                out.update(db.execute(f"SELECT doc_id, file_hash FROM docs WHERE doc_id IN ({marks})", part).fetchall())
+        return out
+
+    def list_docs(self) -> Dict[str, dict]:
+        with self._lock:
+            if not self.exists():
+                return {}
+            rows = self._db().execute(
+                "SELECT doc_id, file_name, file_hash, chunk_count, indexed_at, updated_at FROM docs"
+            ).fetchall()
+        return {
+            did: {
+                "file_name": name,
+                "file_hash": fh,
+                "chunks": n,
+                "indexed_at": ia,
+                "updated_at": ua,
+            }
+            for did, name, fh, n, ia, ua in rows
+        }
+
+    def count_chunks(self) -> int:
+        with self._lock:
+            if not self.exists():
+                return 0
+            row = self._db().execute("SELECT COALESCE(SUM(chunk_count), 0) FROM docs").fetchone()
+        return int(row[0])
+
+    def bootstrap(self, records: Iterable[tuple]) -> None:
+        """
+        Fill an empty registry from (chunk_id, metadata) pairs read out of
+        an existing vector store that predates the registry.
+        """
+        by_doc: dict[str, dict] = {}
+        for cid, md in records:
+            did = (md or {}).get("doc_id")
+            if not did:
+                continue
+            rec = by_doc.setdefault(did, {"file_name": md.get("file_name"), "file_hash": md.get("file_hash"), "ids": []})
+            rec["ids"].append(cid)
+        for did, rec in by_doc.items():
+            self.put_doc(did, rec["file_name"], rec["file_hash"], rec["ids"])
@@ -1,18 +1,74 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import List, Tuple, Optional, Literal
+from dataclasses import astuple, dataclass, field, replace
+import asyncio
+from typing import Any, List, Tuple, Optional, Literal
 
+import numpy as np
+
+from .backends import SearchHit, VectorBackend
 from .config import RagConfig
+from .context import pack_context
+from .qcache import normalize_query
+from .tracing import span
 from .db import VectorDB
 
-RetrievalMode = Literal["similarity", "mmr", "threshold"]
+RetrievalMode = Literal["similarity", "mmr", "threshold", "hybrid"]
+
+RRF_K = 60  # reciprocal rank fusion constant
+
+
+def rrf_fuse(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """
+    Reciprocal rank fusion of several ranked id lists.
+    Returns [(id, score)] best first, scores normalized to 0..1.
+    """
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, 1):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (k + rank)
+    best = len(rankings) / (k + 1)
+    fused = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+    return [(cid, sc / best) for cid, sc in fused]
+
+def mmr_select(query_vec, embeddings, k: int, lambda_mult: float = 0.5) -> List[int]:
+    """
+    Maximal marginal relevance over a candidate matrix, fully vectorized:
+    each step is one matrix-vector product that updates every candidate's
+    max similarity to the already selected set.
+    Returns indices into `embeddings` in selection order.
+    """
+    emb = np.asarray(embeddings, dtype=np.float32)
+    n = len(emb)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    emb = emb / np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+    q = np.asarray(query_vec, dtype=np.float32)
+    q = q / max(float(np.linalg.norm(q)), 1e-12)
+
+    relevance = emb @ q
+    max_sim = np.full(n, -np.inf, dtype=np.float32)
+    taken = np.zeros(n, dtype=bool)
+    picked: List[int] = []
+    for _ in range(k):
+        # before anything is selected the redundancy term is 0
+        redundancy = max_sim if picked else np.zeros(n, dtype=np.float32)
+        score = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        score[taken] = -np.inf
+        best = int(np.argmax(score))
+        picked.append(best)
+        taken[best] = True
+        np.maximum(max_sim, emb @ emb[best], out=max_sim)
+    return picked
 
 @dataclass
 class RetrievalParams:
     mode: RetrievalMode = "similarity"
     k: int = 4
-    fetch_k: int = 20          # MMR
+    fetch_k: int = 20          # MMR / hybrid candidates per list
     score_threshold: float = 0.35  # Threshold (0-1)
+    lambda_mult: float = 0.5   # MMR: 1 = pure relevance, 0 = max diversity
+    token_budget: Optional[int] = None  # context token budget; None = cfg.context_token_budget
 
 @dataclass
 class RetrievedChunk:
@@ -20,78 +76,175 @@ class RetrievedChunk:
     source: str
     page: Optional[int]
     score: Optional[float]  # 0-1 relevance score
+    chunk_id: Optional[str] = None
+    doc_id: Optional[str] = None
+
+@dataclass
+class RetrievalResult:
+    """
+    Packed context plus what went into it. Unpacks like the old
+    (context, sources, debug_chunks) tuple.
+    """
+    context: str
+    sources: List[str]
+    chunks: List[RetrievedChunk]
+    context_tokens: int = 0   # estimated tokens of the packed context
+    input_tokens: int = 0     # estimated tokens of the raw retrieved chunks
+    passages: int = 0
+    cached: bool = False      # served from the query result cache
+    query_vec: Optional[List[float]] = field(default=None, repr=False)
+
+    def __iter__(self):
+        return iter((self.context, self.sources, self.chunks))
 
 @dataclass
 class Retriever:
     cfg: RagConfig
     vector_db: VectorDB
+    # optional async query embedder (e.g. a QueryEmbeddingBatcher) used by aretrieve
+    query_embedder: Optional[Any] = field(default=None, repr=False)
+
+    def retrieve(self, query: str, params: RetrievalParams) -> RetrievalResult:
+        """
+        Returns a RetrievalResult:
+          context_text, unique_sources, debug_chunks (with optional scores),
+          plus token counts of the packed context
+        """
+        if not self.vector_db.exists():
+            return RetrievalResult("", [], [])
+        key, cached = self._cached(query, params)
+        if cached is not None:
+            return cached
+        cache = self.vector_db.query_cache()
+        query_vec = cache.embeddings.get(key[:2])
+        if query_vec is None:
+            with span("retrieve.embed_query"):
+                query_vec = self.vector_db.embeddings().embed_query(query)
+            cache.embeddings.put(key[:2], query_vec)
+        result = self.retrieve_by_vector(query_vec, params, query=query)
+        cache.results.put(key, result)
+        return result
 
-    def retrieve(self, query: str, params: RetrievalParams) -> Tuple[str, List[str], List[RetrievedChunk]]:
+    async def aretrieve(self, query: str, params: RetrievalParams) -> RetrievalResult:
         """
-        Returns:
-          context_text, unique_sources, debug_chunks (with optional scores)
+        Async retrieve: the query embedding is a non-blocking Ollama call,
+        the local vector search runs in the default executor.
         """
         if not self.vector_db.exists():
-            return ("", [], [])
+            return RetrievalResult("", [], [])
+        key, cached = self._cached(query, params)
+        if cached is not None:
+            return cached
+        cache = self.vector_db.query_cache()
+        query_vec = cache.embeddings.get(key[:2])
+        if query_vec is None:
+            with span("retrieve.embed_query"):
+                if self.query_embedder is not None:
+                    query_vec = await self.query_embedder.embed(query)
+                else:
+                    query_vec = await self.vector_db.embeddings().aembed_query(query)
+            cache.embeddings.put(key[:2], query_vec)
+        result = await asyncio.to_thread(self.retrieve_by_vector, query_vec, params, query)
+        cache.results.put(key, result)
+        return result
 
-        db = self.vector_db.open()
+    def _cached(self, query: str, params: RetrievalParams) -> Tuple[tuple, Optional[RetrievalResult]]:
+        """
+        Result-cache key for a query and a hit, if any.
+        key[:2] (normalized query, embed model) is the embedding-cache key.
+        """
+        key = (
+            normalize_query(query),
+            self.cfg.embed_model,
+            astuple(params),
+            self.vector_db.generation(),
+        )
+        with span("retrieve.cache_lookup") as sp:
+            hit = self.vector_db.query_cache().results.get(key)
+            sp.set(hits=int(hit is not None))
+        return key, (replace(hit, cached=True) if hit is not None else None)
 
-        docs = []
-        scored = []  # list[(doc, score)] if we have scores
+    def cache_stats(self) -> dict:
+        return self.vector_db.query_cache().stats()
 
+    def retrieve_by_vector(
+        self,
+        query_vec: List[float],
+        params: RetrievalParams,
+        query: str = "",
+    ) -> RetrievalResult:
+        """
+        Same as retrieve() for an already embedded query.
+        The query text is only needed by hybrid mode (lexical side).
+        """
+        if not self.vector_db.exists():
+            return RetrievalResult("", [], [])
+
+        backend = self.vector_db.open()
+        hits: List[SearchHit] = []
         mode = params.mode
 
-        # --- Similarity / Threshold: use relevance scores when possible ---
-        if mode in ("similarity", "threshold"):
-            # Chroma wrapper usually supports this:
-            # returns List[Tuple[Document, float]] where float is relevance score 0..1
-            try:
-                scored = db.similarity_search_with_relevance_scores(query, k=params.k)
-            except Exception:
-                # fallback: no scores
-                docs = db.similarity_search(query, k=params.k)
-
-            if scored:
+        with span("retrieve.search", mode=mode) as sp:
+            # --- Similarity / Threshold: relevance scores come from the backend ---
+            if mode in ("similarity", "threshold"):
+                hits = self._search(backend, query_vec, params.k)
                 if mode == "threshold":
-                    scored = [pair for pair in scored if pair[1] is not None and pair[1] >= params.score_threshold]
-                docs = [d for d, _ in scored]
+                    hits = [h for h in hits if h.score is not None and h.score >= params.score_threshold]
+
+            # --- MMR: diverse results, reranked from one batched candidate fetch ---
+            elif mode == "mmr":
+                candidates = self._search(backend, query_vec, max(params.fetch_k, params.k), include_embeddings=True)
+                if candidates:
+                    picked = mmr_select(
+                        query_vec,
+                        np.stack([h.embedding for h in candidates]),
+                        k=params.k,
+                        lambda_mult=params.lambda_mult,
+                    )
+                    hits = [candidates[i] for i in picked]
+                    for h in hits:
+                        h.embedding = None  # keep the relevance score from the backend
 
-        # --- MMR: diverse results (scores not typically returned) ---
-        elif mode == "mmr":
-            # returns List[Document]
-            docs = db.max_marginal_relevance_search(query, k=params.k, fetch_k=params.fetch_k)
+            # --- Hybrid: BM25 + dense, fused by reciprocal rank ---
+            elif mode == "hybrid":
+                hits = self._hybrid(backend, query_vec, query, params)
 
-        else:
-            # default fallback
-            docs = db.similarity_search(query, k=params.k)
+            else:
+                # default fallback
+                hits = self._search(backend, query_vec, params.k)
 
-        # Build context
-        context = "\n\n".join([d.page_content for d in docs]) if docs else ""
+            sp.set(hits=len(hits))
 
-        # Build sources + debug chunks
+        # Build context: merge overlapping/adjacent chunks, fit the token budget
+        budget = params.token_budget if params.token_budget is not None else self.cfg.context_token_budget
+        with span("retrieve.pack", chunks=len(hits)) as sp:
+            packed = pack_context(
+                hits, budget,
+                max_overlap=2 * self.cfg.chunk_overlap,
+                min_overlap=min(self.cfg.chunk_overlap // 2, 20),
+            )
+            sp.set(tokens=packed.tokens, passages=len(packed.passages))
+        used = {h.id for p in packed.passages for h in p.hits}
+
+        # Build sources (what made it into the context) + debug chunks (everything retrieved)
         sources: list[str] = []
         debug: list[RetrievedChunk] = []
 
-        # If we have scored pairs, map doc->score
-        score_map = {}
-        if scored:
-            for d, s in scored:
-                # doc objects may not be hashable; map by id
-                score_map[id(d)] = s
+        for h in hits:
+            src = h.metadata.get("source", "unknown")
+            page = h.metadata.get("page", None)
 
-        for d in docs:
-            src = d.metadata.get("source", "unknown")
-            page = d.metadata.get("page", None)
-            score = score_map.get(id(d), None)
-
-            sources.append(f"{src} (page {page})" if page is not None else src)
+            if h.id in used:
+                sources.append(f"{src} (page {page})" if page is not None else src)
 
             debug.append(
                 RetrievedChunk(
-                    text=d.page_content,
+                    text=h.text,
                     source=src,
                     page=page,
-                    score=score,
+                    score=h.score,
+                    chunk_id=h.id,
+                    doc_id=h.metadata.get("doc_id"),
                 )
             )
 
@@ -103,4 +256,55 @@ class Retriever:
                 uniq_sources.append(s)
                 seen.add(s)
 
-        return (context, uniq_sources, debug)
\ No newline at end of file
+        return RetrievalResult(
+            context=packed.text,
+            sources=uniq_sources,
+            chunks=debug,
+            context_tokens=packed.tokens,
+            input_tokens=packed.input_tokens,
+            passages=len(packed.passages),
+            query_vec=query_vec,
+        )
+
+    def _search(self, backend: VectorBackend, query_vec: List[float], n: int, include_embeddings: bool = False) -> List[SearchHit]:
+        """
+        backend.query limited to published chunks: those of an update still
+        being written, or replaced and awaiting garbage collection, are
+        skipped (and made up for by fetching deeper).
+        """
+        fetch = n
+        for _ in range(3):
+            hits = backend.query(query_vec, fetch, include_embeddings=include_embeddings)
+            live = self.vector_db.live_chunk_ids([h.id for h in hits])
+            if live is None:
+                return hits
+            out = [h for h in hits if h.id in live]
+            if len(out) >= n or len(hits) < fetch:
+                break
+            fetch = 2 * fetch + (len(hits) - len(out))
+        return out[:n]
+
+    def _hybrid(self, backend: VectorBackend, query_vec: List[float], query: str, params: RetrievalParams) -> List[SearchHit]:
+        """
+        Fuse the dense top-n and the BM25 top-n (n = max(fetch_k, k)) with RRF.
+        Returns hits for the best k, scored with the fused score.
+        """
+        n = max(params.fetch_k, params.k)
+        dense = self._search(backend, query_vec, n)
+        by_id = {h.id: h for h in dense}
+        lexical = self.vector_db.lexical().search(query, n) if query else []
+        live = self.vector_db.live_chunk_ids([cid for cid, _ in lexical])
+        if live is not None:
+            lexical = [(cid, sc) for cid, sc in lexical if cid in live]
+
+        fused = rrf_fuse([[h.id for h in dense], [cid for cid, _ in lexical]])[:params.k]
+
+        missing = [cid for cid, _ in fused if cid not in by_id]
+        if missing:
+            by_id.update((h.id, h) for h in backend.get(missing))
+        out = []
+        for cid, sc in fused:
+            if cid in by_id:
+                by_id[cid].score = sc
+                out.append(by_id[cid])
+        return out
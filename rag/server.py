@@ -0,0 +1,213 @@
+"""
+Headless HTTP query service.
+
+    python -m rag.server --root . --port 8000 [--workers 4]
+
+Endpoints:
+  GET  /health          readiness + chunk count
+  GET  /metrics         per-stage timings, Prometheus text format
+  GET  /metrics.json    the same as JSON
+  POST /retrieve        context, sources and chunks for a query
+  POST /answer          full answer
+  POST /answer/stream   NDJSON stream: {"type": "sources"}, {"type": "token"}..., {"type": "done"}
+
+Built on `fastapi` and `uvicorn` (see requirements.txt).
+"""
+from __future__ import annotations
+from dataclasses import asdict
+from pathlib import Path
+from typing import Literal, Optional
+import argparse
+import asyncio
+import json
+import os
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from . import AppServices
+from .batching import QueryEmbeddingBatcher
+from .limits import Overloaded
+from .ollama import OllamaHealth
+from .retrieval import RetrievalParams
+from .tracing import get_tracer
+from .versions import ActiveServices
+
+
+class QueryRequest(BaseModel):
+    query: str
+    mode: Literal["similarity", "mmr", "threshold", "hybrid"] = "similarity"
+    k: Optional[int] = None
+    fetch_k: int = 20
+    score_threshold: float = 0.35
+    lambda_mult: float = 0.5
+    token_budget: Optional[int] = None
+
+
+def _params(req: QueryRequest, default_k: int) -> RetrievalParams:
+    return RetrievalParams(
+        mode=req.mode,
+        k=req.k or default_k,
+        fetch_k=req.fetch_k,
+        score_threshold=req.score_threshold,
+        lambda_mult=req.lambda_mult,
+        token_budget=req.token_budget,
+    )
+
+
+class _SlotStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that runs `on_close` (releasing the answer slot) however
+    the response ends, including when the client is gone before the body
+    generator ever starts, which skips the generator's own finally.
+    """
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self._on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self._on_close()
+
+
+def _overloaded(e: Overloaded) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
+def create_server(project_root: Path, svc: Optional[AppServices] = None) -> FastAPI:
+    """
+    Build the FastAPI app on top of create_app_services.
+    Query embeddings of concurrent requests are merged by a QueryEmbeddingBatcher.
+    Without `svc`, the active index version is served and a cutover or
+    rollback (rag.versions) is picked up on the next request.
+    """
+    def attach_batcher(s: AppServices) -> None:
+        s.retriever.query_embedder = QueryEmbeddingBatcher(
+            s.vector_db.embeddings(),
+            window_ms=s.cfg.query_batch_window_ms,
+            max_batch=s.cfg.query_batch_max,
+        )
+
+    if svc is not None:
+        attach_batcher(svc)
+        current = lambda: svc
+    else:
+        live = ActiveServices(project_root, setup=attach_batcher)
+        current = live.get
+    ollama = OllamaHealth()
+
+    app = FastAPI(title="BuildRAG")
+    app.state.services = current  # () -> AppServices being served
+
+    @app.get("/health")
+    async def health():
+        ready = await asyncio.to_thread(ollama.is_ready)
+        svc = current()
+        return {
+            "ollama": ready,
+            "index_version": svc.cfg.db_dir.name,
+            "chunks": svc.vector_db.count_chunks(),
+            "limiter": svc.chat.limiter.stats(),
+            "query_batcher": svc.retriever.query_embedder.stats(),
+            "query_cache": svc.retriever.cache_stats(),
+            "answer_cache": svc.chat.answer_cache().stats(),
+        }
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        return PlainTextResponse(get_tracer().prometheus(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/metrics.json")
+    async def metrics_json():
+        return get_tracer().snapshot()
+
+    @app.post("/retrieve")
+    async def retrieve(req: QueryRequest):
+        svc = current()
+        res = await svc.retriever.aretrieve(req.query, _params(req, svc.cfg.default_k))
+        return {
+            "context": res.context,
+            "sources": res.sources,
+            "chunks": [asdict(c) for c in res.chunks],
+            "context_tokens": res.context_tokens,
+        }
+
+    @app.post("/answer")
+    async def answer(req: QueryRequest):
+        svc = current()
+        try:
+            stream = await svc.chat.astream_answer(req.query, _params(req, svc.cfg.default_k))
+        except Overloaded as e:
+            raise _overloaded(e)
+        text = await stream.read()
+        return {
+            "answer": text,
+            "sources": stream.sources,
+            "chunks": [asdict(c) for c in stream.debug_chunks],
+            "metrics": asdict(stream.metrics),
+            "trace": stream.trace.as_dicts() if stream.trace is not None else [],
+        }
+
+    @app.post("/answer/stream")
+    async def answer_stream(req: QueryRequest):
+        svc = current()
+        try:
+            stream = await svc.chat.astream_answer(req.query, _params(req, svc.cfg.default_k))
+        except Overloaded as e:
+            raise _overloaded(e)
+
+        async def events():
+            try:
+                yield json.dumps({
+                    "type": "sources",
+                    "sources": stream.sources,
+                    "chunks": [asdict(c) for c in stream.debug_chunks],
+                }) + "\n"
+                async for tok in stream:
+                    yield json.dumps({"type": "token", "text": tok}) + "\n"
+                yield json.dumps({
+                    "type": "done",
+                    "metrics": asdict(stream.metrics),
+                    "trace": stream.trace.as_dicts() if stream.trace is not None else [],
+                }) + "\n"
+            finally:
+                await stream.aclose()
+
+        return _SlotStreamingResponse(events(), stream.aclose, media_type="application/x-ndjson")
+
+    return app
+
+
+def create_server_from_env() -> FastAPI:
+    """
+    App factory for multi-worker uvicorn (reads RAG_PROJECT_ROOT).
+    """
+    return create_server(Path(os.environ.get("RAG_PROJECT_ROOT", ".")))
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    import uvicorn
+
+    ap = argparse.ArgumentParser(description="BuildRAG HTTP query service")
+    ap.add_argument("--root", default=".", help="project root (contains documents/ and chroma_db/)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--workers", type=int, default=1, help="worker processes (replicas behind one port)")
+    args = ap.parse_args(argv)
+
+    os.environ["RAG_PROJECT_ROOT"] = str(Path(args.root).resolve())
+    uvicorn.run(
+        "rag.server:create_server_from_env",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
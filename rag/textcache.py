@@ -0,0 +1,140 @@
+from __future__ import annotations
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator
+import json
+import os
+import threading
+import zlib
+
+from .ingestion import iter_documents
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# bump when loader output changes (parsing options, metadata); old entries are then ignored
+_LOADER_VERSION = {".pdf": "pdf1", ".txt": "text1", ".md": "text1"}
+_READ_BYTES = 256 * 1024
+
+
+@lru_cache(maxsize=None)
+def loader_version(suffix: str) -> str:
+    """
+    Version tag of the loader for a file type, including the parser
+    library's version (a pypdf upgrade may extract text differently).
+    """
+    version = _LOADER_VERSION.get(suffix.lower(), "0")
+    if suffix.lower() == ".pdf":
+        from importlib.metadata import PackageNotFoundError, version as pkg_version
+
+        try:
+            version += "-pypdf" + pkg_version("pypdf")
+        except PackageNotFoundError:
+            pass
+    return version
+
+
+class ParsedTextCache:
+    """
+    Extracted page text and metadata per file, keyed by (file sha256,
+    loader version) and stored as zlib-compressed JSON lines, one page per
+    line, in cache_dir/parsed.
+    Re-chunking an unchanged file (new chunk_size/overlap, rebuilds, new
+    index versions) reads the cache instead of parsing the PDF again.
+    Pages are written and read incrementally, so large files stay streamed.
+    Picklable (just a path), so pool workers use it directly.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path_for(self, file_hash: str, suffix: str) -> Path:
+        return self.root / file_hash[:2] / f"{file_hash}.{loader_version(suffix)}.jsonl.z"
+
+    def iter_documents(self, file_path: Path, file_hash: str) -> Iterator[Document]:
+        """
+        Pages of `file_path` (whose content hashes to `file_hash`): from the
+        cache if present, else parsed and written to the cache on the way.
+        """
+        path = self.path_for(file_hash, file_path.suffix)
+        if path.exists():
+            yielded = False
+            try:
+                for page in self._read(path, file_path):
+                    yielded = True
+                    yield page
+                return
+            except (OSError, ValueError, zlib.error):
+                if yielded:
+                    raise
+                # unreadable entry: drop it and parse again
+                path.unlink(missing_ok=True)
+        yield from self._parse_and_store(file_path, path)
+
+    def _read(self, path: Path, file_path: Path) -> Iterator[Document]:
+        from langchain_core.documents import Document
+
+        source = str(file_path)
+        dec = zlib.decompressobj()
+        buf = b""
+        with path.open("rb") as f:
+            while True:
+                data = f.read(_READ_BYTES)
+                if not data:
+                    break
+                buf += dec.decompress(data)
+                *lines, buf = buf.split(b"\n")
+                for line in lines:
+                    text, meta = json.loads(line)
+                    # same bytes may live under another name now
+                    meta["source"] = source
+                    yield Document(page_content=text, metadata=meta)
+        buf += dec.flush()
+        if buf.strip() or not dec.eof:
+            raise ValueError(f"Truncated parsed-text cache entry: {path}")
+
+    def _parse_and_store(self, file_path: Path, path: Path) -> Iterator[Document]:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        comp = zlib.compressobj(6)
+        done = False
+        try:
+            with tmp.open("wb") as f:
+                for page in iter_documents(file_path):
+                    line = json.dumps([page.page_content, page.metadata], ensure_ascii=False, default=str)
+                    f.write(comp.compress(line.encode("utf-8") + b"\n"))
+                    yield page
+                f.write(comp.flush())
+            os.replace(tmp, path)
+            done = True
+        finally:
+            # consumer stopped early: never store a partial entry
+            if not done:
+                tmp.unlink(missing_ok=True)
+
+    def prune(self, keep_hashes: Iterable[str]) -> int:
+        """
+        Delete entries for files that no longer exist (or older loader
+        versions). Returns the number of entries removed.
+        """
+        keep = set(keep_hashes)
+        removed = 0
+        if not self.root.exists():
+            return 0
+        for sub in self.root.iterdir():
+            if not sub.is_dir():
+                continue
+            for entry in sub.iterdir():
+                file_hash, _, rest = entry.name.partition(".")
+                current = file_hash in keep and any(
+                    rest == f"{loader_version(s)}.jsonl.z" for s in _LOADER_VERSION
+                )
+                if not current and not entry.name.startswith("."):
+                    entry.unlink(missing_ok=True)
+                    removed += 1
+        return removed
+
+    def size_bytes(self) -> int:
+        if not self.root.exists():
+            return 0
+        return sum(f.stat().st_size for f in self.root.glob("*/*.jsonl.z"))
@@ -0,0 +1,218 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+import bisect
+import os
+import re
+import threading
+import time
+
+# histogram bucket upper bounds, seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+@dataclass
+class SpanRecord:
+    name: str
+    seconds: float
+    attrs: dict = field(default_factory=dict)
+
+    def as_dict(self) -> dict:
+        return {"name": self.name, "ms": round(self.seconds * 1000.0, 3), **self.attrs}
+
+
+class Trace:
+    """
+    Spans recorded for one request (e.g. one answer), in finish order.
+    """
+
+    def __init__(self):
+        self.spans: List[SpanRecord] = []
+        self._lock = threading.Lock()
+
+    def add(self, rec: SpanRecord) -> None:
+        with self._lock:
+            self.spans.append(rec)
+
+    def as_dicts(self) -> List[dict]:
+        with self._lock:
+            return [s.as_dict() for s in self.spans]
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("rag_trace", default=None)
+
+
+class _Stat:
+    __slots__ = ("count", "total", "buckets", "counters")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.counters: Dict[str, float] = {}
+
+
+class _Span:
+    """
+    Active span; set numeric attributes (chunk/byte/token counts) with set().
+    """
+    __slots__ = ("tracer", "name", "attrs", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record(self.name, time.perf_counter() - self.start, **self.attrs)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Tracer:
+    """
+    Process-wide span aggregator.
+    Every span feeds a latency histogram plus sums of its numeric attributes,
+    and is also appended to the active per-request Trace, if there is one.
+    When disabled, span() returns a shared no-op object and record() returns
+    at once.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _Stat] = {}
+        self.started = time.time()
+
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, name, attrs)
+
+    def record(self, name: str, seconds: float, trace: Optional[Trace] = None, **attrs) -> None:
+        """
+        Record an already measured span (e.g. timed in a worker process).
+        `trace` overrides the active per-request trace.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            st = self._stats.get(name)
+            if st is None:
+                st = self._stats[name] = _Stat()
+            st.count += 1
+            st.total += seconds
+            st.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+            for k, v in attrs.items():
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    st.counters[k] = st.counters.get(k, 0) + v
+        trace = trace or _current.get()
+        if trace is not None:
+            trace.add(SpanRecord(name, seconds, attrs))
+
+    @contextmanager
+    def collect(self) -> Iterator[Trace]:
+        """
+        Collect the spans recorded in this context into a Trace. asyncio
+        tasks and asyncio.to_thread calls inherit it; plain threads and
+        executor workers do not (run them via contextvars.copy_context().run,
+        or pass `trace=` to record()).
+        """
+        trace = Trace()
+        token = _current.set(trace)
+        try:
+            yield trace
+        finally:
+            _current.reset(token)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def snapshot(self) -> dict:
+        """
+        JSON-friendly view: per span count, total/mean seconds, and attribute sums.
+        """
+        with self._lock:
+            spans = {
+                name: {
+                    "count": st.count,
+                    "total_s": round(st.total, 6),
+                    "mean_ms": round(st.total / st.count * 1000.0, 3) if st.count else 0.0,
+                    "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], st.buckets)),
+                    **({"sums": dict(st.counters)} if st.counters else {}),
+                }
+                for name, st in sorted(self._stats.items())
+            }
+        return {"enabled": self.enabled, "since": self.started, "spans": spans}
+
+    def prometheus(self, prefix: str = "rag") -> str:
+        """
+        Prometheus text exposition format.
+        """
+        lines = [
+            f"# HELP {prefix}_span_seconds Time spent per pipeline stage.",
+            f"# TYPE {prefix}_span_seconds histogram",
+        ]
+        counters: Dict[str, List[str]] = {}
+        with self._lock:
+            for name, st in sorted(self._stats.items()):
+                label = f'span="{name}"'
+                cum = 0
+                for ub, n in zip(BUCKETS, st.buckets):
+                    cum += n
+                    lines.append(f'{prefix}_span_seconds_bucket{{{label},le="{ub}"}} {cum}')
+                lines.append(f'{prefix}_span_seconds_bucket{{{label},le="+Inf"}} {st.count}')
+                lines.append(f"{prefix}_span_seconds_sum{{{label}}} {st.total}")
+                lines.append(f"{prefix}_span_seconds_count{{{label}}} {st.count}")
+                for k, v in st.counters.items():
+                    metric = f"{prefix}_{_NAME_RE.sub('_', k)}_total"
+                    counters.setdefault(metric, []).append(f"{metric}{{{label}}} {v}")
+        for metric, samples in sorted(counters.items()):
+            lines.append(f"# TYPE {metric} counter")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+_TRACER = Tracer(enabled=os.environ.get("RAG_TRACING", "1").lower() not in ("0", "false", "no", "off"))
+
+
+def get_tracer() -> Tracer:
+    return _TRACER
+
+
+def span(name: str, **attrs):
+    """
+    Shorthand for get_tracer().span(...).
+    """
+    if not _TRACER.enabled:
+        return _NOOP
+    return _Span(_TRACER, name, attrs)
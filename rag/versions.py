@@ -0,0 +1,497 @@
+"""
+Blue/green index versions.
+
+Each version is a complete index built with fixed embedding/chunking
+settings, in its own directory:
+
+    indexes/
+      ACTIVE                                    tag of the version being served
+      PREVIOUS                                  tag to roll back to
+      nomic-embed-text-c800-o120-chroma-v1/     db_dir of that version
+      nomic-embed-text-c800-o120-chroma-v1.json settings, build and smoke-test results
+
+A new version is built in the background (reusing the shared stat manifest
+and embedding cache) while the active one keeps serving. It is then checked
+with smoke queries, caught up with document edits made meanwhile (those
+only reached the active version) and activated by atomically replacing the
+ACTIVE pointer. Rollback swaps ACTIVE and PREVIOUS. Without an ACTIVE pointer, the legacy
+index in chroma_db/ is served (tag "legacy").
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, List, Optional
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+from .config import RagConfig
+from .handles import shared
+
+if TYPE_CHECKING:
+    from . import AppServices
+    from .indexing import IndexProgress
+
+LEGACY = "legacy"
+
+# settings that make a version (changing any of them needs a full rebuild)
+VERSION_SETTINGS = ("embed_model", "chunk_size", "chunk_overlap", "vector_backend")
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def settings_slug(cfg: RagConfig) -> str:
+    model = re.sub(r"[^A-Za-z0-9.]+", "-", cfg.embed_model).strip("-")
+    return f"{model}-c{cfg.chunk_size}-o{cfg.chunk_overlap}-{cfg.vector_backend}"
+
+
+@dataclass
+class Migration:
+    """
+    State of a background version build, as shown in the UI.
+    """
+    tag: str
+    status: str = "building"  # building | checking | syncing | active | ready | failed | cancelled
+    files_pending: int = 0
+    files_done: int = 0
+    chunks_written: int = 0
+    chunks_per_s: float = 0.0
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    smoke: dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("building", "checking", "syncing")
+
+
+class _MigrationSlot:
+    # process-wide: one background build per indexes/ dir
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current: Optional[Migration] = None
+        self.cancel = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+
+class IndexVersions:
+    """
+    Versioned index directories under base_dir/indexes and the ACTIVE pointer.
+    `base_cfg` supplies everything that is not a version setting
+    (documents, cache, retrieval and serving options).
+    """
+
+    def __init__(self, base_cfg: RagConfig):
+        self.base_cfg = base_cfg
+        self.root = base_cfg.base_dir / "indexes"
+
+    # ---------- pointer ----------
+
+    def _read(self, name: str) -> Optional[str]:
+        try:
+            tag = (self.root / name).read_text(encoding="utf-8").strip()
+        except OSError:
+            return None
+        return tag or None
+
+    def active(self) -> str:
+        return self._read("ACTIVE") or LEGACY
+
+    def previous(self) -> Optional[str]:
+        return self._read("PREVIOUS")
+
+    def pointer_signature(self) -> Optional[tuple]:
+        """
+        Cheap change detector for the ACTIVE pointer (one stat call).
+        """
+        try:
+            st = (self.root / "ACTIVE").stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def activate(self, tag: str, catch_up: bool = True, cancel: Optional[threading.Event] = None) -> bool:
+        """
+        Atomically switch serving to `tag`; the current version becomes PREVIOUS.
+        Document edits only reach the active version (watcher, index jobs),
+        so `tag` is first caught up with documents/ (see catch_up()); without
+        `catch_up` it switches at once and catches up in the background.
+        Returns False if `cancel` stopped the catch-up (nothing switched).
+        """
+        from . import create_app_services
+
+        if tag != LEGACY and not self._meta_path(tag).exists():
+            raise ValueError(f"Unknown index version: {tag!r}")
+        current = self.active()
+        if current == tag:
+            return True
+        svc = create_app_services(self.base_cfg.base_dir, cfg=self.config_for(tag))
+        if catch_up:
+            synced = self.catch_up(svc, cancel)
+            if synced["cancelled"]:
+                return False
+            self._update_meta(tag, caught_up=synced)
+        _write_atomic(self.root / "PREVIOUS", current)
+        _write_atomic(self.root / "ACTIVE", tag)
+        self._update_meta(tag, activated_at=time.time())
+        # served content changed: drop cached results everywhere
+        svc.vector_db.bump_generation()
+        # edits landing between the catch-up and the switch went to the old
+        # version: one more incremental pass, on the new version's job queue
+        stale = self._stale_docs(svc)
+        svc.index_manager.jobs().submit()
+        if stale:
+            svc.index_manager.jobs().submit_files((), stale)
+        return True
+
+    def rollback(self) -> str:
+        """
+        Switch back to the previous version at once (it catches up with
+        documents/ in the background). Returns the now active tag.
+        """
+        prev = self.previous()
+        if prev is None:
+            raise ValueError("No previous index version to roll back to")
+        self.activate(prev, catch_up=False)
+        return prev
+
+    def catch_up(self, svc: AppServices, cancel: Optional[threading.Event] = None, rounds: int = 3) -> dict:
+        """
+        Bring a version's index up to date with documents/: index new and
+        changed files, drop deleted ones. Repeats (at most `rounds` times)
+        while a pass still finds changes, as edits may keep landing.
+        Runs on the version's own job queue, after any build already running
+        there: index updates of one store must never overlap (each run's
+        recover() rolls back whatever another run has staged).
+        """
+        jobs = svc.index_manager.jobs()
+        out = {"changed": 0, "removed": 0, "cancelled": False}
+        for _ in range(rounds):
+            stale = self._stale_docs(svc)
+            jobs.submit()
+            if stale:
+                jobs.submit_files((), stale)
+            while not jobs.wait(0.2):
+                if cancel is not None and cancel.is_set():
+                    jobs.cancel(wait=True)
+            # the last finished job (a later one queued meanwhile scanned too)
+            job = jobs.status()
+            if job is not None and job.status == "failed":
+                raise RuntimeError(f"Catching up {svc.cfg.db_dir.name} failed: {job.error}")
+            if job is None or job.status != "done":
+                out["cancelled"] = True
+                break
+            changed = job.stats.get("new", 0) + job.stats.get("updated", 0)
+            out["changed"] += changed
+            out["removed"] += len(stale)
+            if not changed and not stale:
+                break
+        return out
+
+    @staticmethod
+    def _stale_docs(svc: AppServices) -> List[Path]:
+        # indexed docs whose file is gone from documents/
+        on_disk = {e.doc_id for e in svc.doc_manager.scan()}
+        indexed = svc.vector_db.list_indexed_docs()
+        return [svc.cfg.docs_dir / d for d in sorted(set(indexed) - on_disk)]
+
+    # ---------- versions ----------
+
+    def version_dir(self, tag: str) -> Path:
+        if tag == LEGACY:
+            return self.base_cfg.db_dir
+        return self.root / tag
+
+    def _meta_path(self, tag: str) -> Path:
+        # next to the version dir, not in it: IndexManager.reset() wipes db_dir
+        return self.root / f"{tag}.json"
+
+    def _meta(self, tag: str) -> dict:
+        if tag == LEGACY:
+            return {"tag": LEGACY, **{k: getattr(self.base_cfg, k) for k in VERSION_SETTINGS}, "status": "ready"}
+        try:
+            return json.loads(self._meta_path(tag).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _update_meta(self, tag: str, **changes) -> None:
+        if tag == LEGACY:
+            return
+        meta = self._meta(tag)
+        meta.update(changes)
+        _write_atomic(self._meta_path(tag), json.dumps(meta, indent=2))
+
+    def config_for(self, tag: str) -> RagConfig:
+        if tag == LEGACY:
+            return self.base_cfg
+        meta = self._meta(tag)
+        settings = {k: meta[k] for k in VERSION_SETTINGS if k in meta}
+        return replace(self.base_cfg, db_dir=self.version_dir(tag), **settings)
+
+    def active_config(self) -> RagConfig:
+        return self.config_for(self.active())
+
+    def list_versions(self) -> List[dict]:
+        """
+        All versions with their settings and status, newest first
+        (legacy last, if it holds an index).
+        """
+        active, prev = self.active(), self.previous()
+        out = []
+        if self.root.exists():
+            for f in self.root.glob("*.json"):
+                meta = self._meta(f.stem)
+                if meta.get("tag") == f.stem:
+                    out.append(meta)
+        out.sort(key=lambda m: m.get("created_at", 0), reverse=True)
+        legacy = self.base_cfg.db_dir
+        if legacy.exists() and any(legacy.iterdir()):
+            out.append(self._meta(LEGACY))
+        for m in out:
+            m["active"] = m.get("tag") == active
+            m["previous"] = m.get("tag") == prev
+        return out
+
+    def new_tag(self, cfg: RagConfig) -> str:
+        slug = settings_slug(cfg)
+        n = 1
+        while (self.root / f"{slug}-v{n}").exists() or self._meta_path(f"{slug}-v{n}").exists():
+            n += 1
+        return f"{slug}-v{n}"
+
+    def remove(self, tag: str) -> None:
+        """
+        Delete a version that is neither active nor the rollback target.
+        """
+        if tag == LEGACY or tag in (self.active(), self.previous()):
+            raise ValueError(f"Refusing to remove index version {tag!r} (legacy, active or previous)")
+        from .db import VectorDB
+
+        VectorDB(self.config_for(tag)).close()
+        shutil.rmtree(self.version_dir(tag), ignore_errors=True)
+        self._meta_path(tag).unlink(missing_ok=True)
+
+    # ---------- building ----------
+
+    def build(
+        self,
+        activate: bool = True,
+        progress: Optional[Callable[[IndexProgress], None]] = None,
+        cancel: Optional[threading.Event] = None,
+        on_status: Optional[Callable[[str], None]] = None,
+        **settings,
+    ) -> dict:
+        """
+        Build a new version with `settings` (any of VERSION_SETTINGS; the
+        rest come from the active version), smoke-test it and, if it passes
+        and `activate` is set, switch to it. Edits made to documents/ during
+        the build are caught up before the smoke test and again right before
+        the switch. Blocking; see start_build().
+        Returns the version's metadata.
+        """
+        from . import create_app_services
+
+        unknown = set(settings) - set(VERSION_SETTINGS)
+        if unknown:
+            raise ValueError(f"Not version settings: {sorted(unknown)}")
+        base = self.active_config()
+        cfg = replace(base, **settings)
+        tag = self.new_tag(cfg)
+        cfg = replace(cfg, db_dir=self.version_dir(tag))
+        cfg.db_dir.mkdir(parents=True, exist_ok=True)
+        meta = {
+            "tag": tag,
+            **{k: getattr(cfg, k) for k in VERSION_SETTINGS},
+            "created_at": time.time(),
+            "status": "building",
+        }
+        _write_atomic(self._meta_path(tag), json.dumps(meta, indent=2))
+
+        svc = create_app_services(cfg.base_dir, cfg=cfg)
+        status = on_status or (lambda s: None)
+        try:
+            status("building")
+            _, stats = svc.index_manager.build_or_update(progress=progress, cancel=cancel)
+            if stats.get("cancelled"):
+                self._update_meta(tag, status="cancelled", stats=stats)
+                return self._meta(tag)
+            # edits made during the build only reached the active version
+            status("syncing")
+            synced = self.catch_up(svc, cancel)
+            if synced["cancelled"]:
+                self._update_meta(tag, status="cancelled", stats=stats)
+                return self._meta(tag)
+            status("checking")
+            smoke = self.smoke_test(svc)
+        except Exception as e:
+            self._update_meta(tag, status="failed", error=f"{type(e).__name__}: {e}")
+            raise
+        passed = smoke["passed"]
+        self._update_meta(
+            tag,
+            status="ready" if passed else "failed",
+            built_at=time.time(),
+            stats=stats,
+            smoke=smoke,
+        )
+        if passed and activate:
+            self.activate(tag, cancel=cancel)
+        return self._meta(tag)
+
+    def smoke_test(self, svc: AppServices, samples: int = 8) -> dict:
+        """
+        Checks a freshly built version before it may serve:
+        - coverage: every doc the active version serves (and that still
+          exists) is indexed;
+        - self-retrieval: a sample chunk's own text finds its doc in the top 5;
+        - queries from indexes/smoke_queries.txt (one per line) return hits.
+        """
+        from .db import VectorDB
+        from .retrieval import RetrievalParams
+
+        on_disk = {e.doc_id for e in svc.doc_manager.scan()}
+        new_docs = set(svc.vector_db.list_indexed_docs())
+        old_docs = set(VectorDB(self.active_config()).list_indexed_docs())
+        missing = sorted((old_docs & on_disk) - new_docs)
+
+        params = RetrievalParams(mode="similarity", k=5)
+        reg = svc.vector_db.registry()
+        backend = svc.vector_db.open()
+        docs = sorted(new_docs)
+        picked = docs[:: max(1, len(docs) // samples)][:samples] if docs else []
+        found = 0
+        for doc_id in picked:
+            ids = sorted(reg.chunk_ids(doc_id))
+            hits = backend.get(ids[:1]) if ids else []
+            if not hits:
+                continue
+            res = svc.retriever.retrieve(hits[0].text[:400], params)
+            found += any(ch.doc_id == doc_id for ch in res.chunks)
+        self_rate = found / len(picked) if picked else 1.0
+
+        try:
+            lines = (self.root / "smoke_queries.txt").read_text(encoding="utf-8").splitlines()
+        except OSError:
+            lines = []
+        queries = [q.strip() for q in lines if q.strip() and not q.startswith("#")]
+        answered = sum(1 for q in queries if svc.retriever.retrieve(q, params).chunks)
+
+        return {
+            "passed": not missing and bool(new_docs or not on_disk) and self_rate >= 0.8 and answered == len(queries),
+            "docs": len(new_docs),
+            "missing_docs": missing[:20],
+            "self_retrieval": round(self_rate, 3),
+            "queries": f"{answered}/{len(queries)}",
+        }
+
+    def _slot(self) -> _MigrationSlot:
+        return shared(("index_migration", str(self.root)), _MigrationSlot)
+
+    def migration(self) -> Optional[Migration]:
+        """
+        The running (or last) background build in this process.
+        """
+        slot = self._slot()
+        with slot.lock:
+            return replace(slot.current) if slot.current is not None else None
+
+    def start_build(self, activate: bool = True, **settings) -> Migration:
+        """
+        build() on a background thread; the active version keeps serving.
+        Poll migration() for progress.
+        """
+        slot = self._slot()
+        with slot.lock:
+            if slot.current is not None and slot.current.active:
+                raise RuntimeError("An index version is already being built")
+            mig = Migration(tag="")
+            slot.current = mig
+            slot.cancel.clear()
+
+        def on_progress(p: IndexProgress) -> None:
+            with slot.lock:
+                mig.files_pending, mig.files_done = p.files_pending, p.files_done
+                mig.chunks_written, mig.chunks_per_s = p.chunks_written, round(p.chunks_per_s, 1)
+
+        def on_status(status: str) -> None:
+            with slot.lock:
+                mig.status = status
+
+        def run() -> None:
+            try:
+                meta = self.build(activate=activate, progress=on_progress, cancel=slot.cancel, on_status=on_status, **settings)
+                with slot.lock:
+                    mig.tag = meta.get("tag", "")
+                    mig.smoke = meta.get("smoke", {})
+                    status = meta.get("status", "failed")
+                    mig.status = "active" if status == "ready" and self.active() == mig.tag else status
+            except Exception as e:
+                with slot.lock:
+                    mig.status = "failed"
+                    mig.error = f"{type(e).__name__}: {e}"
+            finally:
+                with slot.lock:
+                    mig.finished_at = time.time()
+
+        # the tag is known before the thread starts, so the UI can show it at once
+        with slot.lock:
+            mig.tag = self.new_tag(replace(self.active_config(), **settings))
+        slot.thread = threading.Thread(target=run, name="rag-index-migration", daemon=True)
+        slot.thread.start()
+        return replace(mig)
+
+    def cancel_build(self) -> None:
+        self._slot().cancel.set()
+
+
+class ActiveServices:
+    """
+    AppServices for whatever version is active, rebuilt when the ACTIVE
+    pointer changes (checked with one stat per get()), so a cutover or
+    rollback reaches running processes without a restart.
+    `setup` runs on every new AppServices (e.g. to attach a query batcher).
+    """
+
+    def __init__(self, project_root: Path, base_cfg: Optional[RagConfig] = None, setup: Optional[Callable[[AppServices], None]] = None):
+        self.base_cfg = base_cfg or RagConfig.from_project_root(project_root)
+        self.versions = IndexVersions(self.base_cfg)
+        self.setup = setup
+        self._lock = threading.Lock()
+        self._sig: Optional[tuple] = None
+        self._svc: Optional[AppServices] = None
+
+    def get(self) -> AppServices:
+        sig = self.versions.pointer_signature()
+        if self._svc is not None and sig == self._sig:
+            return self._svc
+        with self._lock:
+            if self._svc is None or sig != self._sig:
+                self._swap(sig)
+        return self._svc
+
+    def _swap(self, sig: Optional[tuple]) -> None:
+        from . import create_app_services
+
+        old = self._svc
+        svc = create_app_services(self.base_cfg.base_dir, cfg=self.versions.active_config())
+        if self.setup is not None:
+            self.setup(svc)
+        if old is not None and old.cfg.db_dir != svc.cfg.db_dir:
+            # the watcher follows the served version
+            w = old.index_manager.watcher()
+            if w.running:
+                w.stop()
+                svc.index_manager.watcher().start()
+        self._svc, self._sig = svc, sig
@@ -0,0 +1,296 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from .ingestion import SUPPORTED_SUFFIXES
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+_WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len (name follows)
+
+OnChanges = Callable[[List[Path], List[Path]], None]
+
+
+def _relevant(name: str) -> bool:
+    # skip editor swap files, partial downloads and hidden files
+    return name.endswith(SUPPORTED_SUFFIXES) and not name.startswith((".", "~"))
+
+
+class _Inotify:
+    """
+    Recursive inotify watch over a directory tree (Linux, via ctypes).
+    read() returns the paths that changed, plus whether the kernel queue
+    overflowed (events were lost).
+    """
+
+    def __init__(self, root: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add = libc.inotify_add_watch
+        self._add.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm = libc.inotify_rm_watch
+        self._rm.argtypes = [ctypes.c_int, ctypes.c_int]
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.fd = fd
+        self._dirs: Dict[int, Path] = {}
+        self.add_tree(root)
+
+    def add_tree(self, root: Path) -> List[Path]:
+        """
+        Watch root and every directory below it; returns the files found
+        (for a directory that was moved in with content).
+        """
+        files: list[Path] = []
+        for dir_path, dir_names, file_names in os.walk(root):
+            dir_names[:] = [d for d in dir_names if not d.startswith(".")]
+            wd = self._add(self.fd, os.fsencode(dir_path), _WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    raise OSError(err, "inotify watch limit reached (fs.inotify.max_user_watches)")
+                continue
+            self._dirs[wd] = Path(dir_path)
+            files.extend(Path(dir_path) / n for n in file_names if _relevant(n))
+        return files
+
+    def read(self) -> Tuple[Set[Path], bool]:
+        changed: set[Path] = set()
+        overflow = False
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+            off = 0
+            while off + _EVENT.size <= len(buf):
+                wd, mask, _cookie, length = _EVENT.unpack_from(buf, off)
+                name = buf[off + _EVENT.size: off + _EVENT.size + length].rstrip(b"\0").decode("utf-8", "surrogateescape")
+                off += _EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                parent = self._dirs.get(wd)
+                if mask & IN_IGNORED:
+                    self._dirs.pop(wd, None)
+                    continue
+                if parent is None or not name:
+                    continue
+                path = parent / name
+                if mask & IN_ISDIR:
+                    if name.startswith("."):
+                        continue
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        changed.update(self.add_tree(path))
+                    elif mask & (IN_DELETE | IN_MOVED_FROM):
+                        # a whole directory went away: drop every doc under it
+                        changed.add(path)
+                elif _relevant(name):
+                    changed.add(path)
+        return changed, overflow
+
+    def close(self) -> None:
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class _Poller:
+    """
+    Fallback: stat walk of the tree every interval, diffed against the last one.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._snap = self._snapshot()
+
+    def _snapshot(self) -> Dict[Path, tuple]:
+        out: dict[Path, tuple] = {}
+        stack = [str(self.root)]
+        while stack:
+            try:
+                it = os.scandir(stack.pop())
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not entry.name.startswith("."):
+                                stack.append(entry.path)
+                        elif _relevant(entry.name):
+                            st = entry.stat()
+                            out[Path(entry.path)] = (st.st_size, st.st_mtime_ns, st.st_ino)
+                    except OSError:
+                        continue
+        return out
+
+    def read(self) -> Tuple[Set[Path], bool]:
+        snap = self._snapshot()
+        old, self._snap = self._snap, snap
+        changed = {p for p, sig in snap.items() if old.get(p) != sig}
+        changed.update(p for p in old if p not in snap)
+        return changed, False
+
+    def close(self) -> None:
+        pass
+
+
+def inotify_available() -> bool:
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6")
+        return hasattr(libc, "inotify_init1")
+    except OSError:
+        return False
+
+
+class DocWatcher:
+    """
+    Watches documents/ and reports changes per file: inotify on Linux,
+    polling elsewhere (or if inotify cannot be set up).
+    Events are debounced per path (a file is reported once it has been quiet
+    for debounce_s) and coalesced: whatever a path went through, it is
+    reported once, as changed if it exists by then, else as removed.
+    Only touched paths are reported, the tree is never rescanned for
+    indexing; `on_overflow` is called if events were lost (inotify queue
+    overflow), e.g. to queue a full build.
+    Changes made while the watcher is stopped are picked up by the next build.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        on_changes: OnChanges,
+        debounce_s: float = 1.0,
+        poll_s: float = 2.0,
+        on_overflow: Optional[Callable[[], None]] = None,
+        backend: str = "auto",
+    ):
+        self.root = Path(root)
+        self.on_changes = on_changes
+        self.on_overflow = on_overflow
+        self.debounce_s = max(debounce_s, 0.0)
+        self.poll_s = max(poll_s, 0.05)
+        self.backend = backend
+        self.events = 0
+        self.last_error: Optional[str] = None
+        self._pending: Dict[Path, float] = {}
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "DocWatcher":
+        with self._lock:
+            if self.running:
+                return self
+            self.root.mkdir(parents=True, exist_ok=True)
+            source = self._open_source()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(source,), name="rag-doc-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stop.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def _open_source(self):
+        if self.backend in ("auto", "inotify") and inotify_available():
+            try:
+                src = _Inotify(self.root)
+                self.backend = "inotify"
+                return src
+            except OSError as e:
+                if self.backend == "inotify":
+                    raise
+                self.last_error = str(e)
+        self.backend = "poll"
+        return _Poller(self.root)
+
+    def _run(self, source) -> None:
+        try:
+            while not self._stop.is_set():
+                if isinstance(source, _Inotify):
+                    ready, _, _ = select.select([source.fd], [], [], self._wait_s())
+                    if not ready:
+                        self._flush()
+                        continue
+                elif self._stop.wait(self.poll_s):
+                    break
+                changed, overflow = source.read()
+                if overflow and self.on_overflow is not None:
+                    self._call(self.on_overflow)
+                now = time.monotonic()
+                for p in changed:
+                    self._pending[p] = now
+                self.events += len(changed)
+                self._flush()
+        finally:
+            source.close()
+
+    def _wait_s(self) -> float:
+        if not self._pending:
+            return 0.5
+        due = min(self._pending.values()) + self.debounce_s - time.monotonic()
+        return min(max(due, 0.0), 0.5)
+
+    def _flush(self) -> None:
+        now = time.monotonic()
+        due = [p for p, t in self._pending.items() if now - t >= self.debounce_s]
+        if not due:
+            return
+        changed: list[Path] = []
+        removed: list[Path] = []
+        for p in due:
+            del self._pending[p]
+            if p.is_file():
+                changed.append(p)
+            elif not p.exists():
+                removed.append(p)
+        if changed or removed:
+            self._call(self.on_changes, sorted(changed), sorted(removed))
+
+    def _call(self, fn, *args) -> None:
+        try:
+            fn(*args)
+        except Exception as e:
+            # keep watching; the next build catches up
+            self.last_error = f"{type(e).__name__}: {e}"
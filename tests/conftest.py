@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# run from anywhere: `pytest tests` or `python -m pytest`
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
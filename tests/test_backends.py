@@ -0,0 +1,18 @@
+import pytest
+
+from rag.backends import ChromaBackend, VectorBackend
+from rag.npstore import NumpyBackend
+
+
+def test_backends_implement_the_interface():
+    for cls in (ChromaBackend, NumpyBackend):
+        assert not getattr(cls, "__abstractmethods__", None), cls
+
+
+def test_incomplete_backend_fails_at_construction():
+    class Partial(VectorBackend):
+        def upsert(self, ids, embeddings, documents, metadatas):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from rag.batching import QueryEmbeddingBatcher
+
+
+class _SlowEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    async def aembed_queries(self, texts):
+        self.calls.append(list(texts))
+        await asyncio.sleep(0.05)
+        return [[float(len(t))] for t in texts]
+
+
+def test_concurrent_queries_share_one_request():
+    emb = _SlowEmbeddings()
+    batcher = QueryEmbeddingBatcher(emb, window_ms=5)
+
+    async def main():
+        return await asyncio.gather(*(batcher.embed(q) for q in ["a", "bb", "a"]))
+
+    assert asyncio.run(main()) == [[1.0], [2.0], [1.0]]
+    assert emb.calls == [["a", "bb"]]
+
+
+def test_cancelled_batch_resolves_waiters():
+    batcher = QueryEmbeddingBatcher(_SlowEmbeddings(), window_ms=0)
+
+    async def main():
+        waiter = asyncio.ensure_future(batcher.embed("q"))
+        await asyncio.sleep(0.01)  # batch is in flight
+        (task,) = batcher._loop_state()["tasks"]
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(waiter, 1.0)
+
+    asyncio.run(main())
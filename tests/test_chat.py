@@ -0,0 +1,50 @@
+import asyncio
+from dataclasses import replace
+
+from bench.run import install_fakes
+from rag import RagConfig, create_app_services
+from rag.retrieval import RetrievalParams
+from rag.tracing import get_tracer
+
+
+class _Fakes:
+    dim = 32
+    embed_request_ms = 0
+    embed_text_ms = 0
+    answer_tokens = 8
+    llm_ttft_ms = 0
+    llm_token_ms = 0
+
+
+def _services(tmp_path):
+    cfg = replace(RagConfig.from_project_root(tmp_path), vector_backend="numpy", ingest_workers=1)
+    svc = create_app_services(tmp_path, cfg=cfg)
+    install_fakes(svc, _Fakes)
+    (cfg.docs_dir / "a.md").write_text("hello world text " * 100)
+    svc.index_manager.build_or_update()
+    return svc
+
+
+def test_cached_answers_are_not_generation_spans(tmp_path):
+    svc = _services(tmp_path)
+    tracer = get_tracer()
+    tracer.reset()
+
+    first = svc.chat.answer_stream("hello world", RetrievalParams())
+    "".join(first)
+    sync_hit = svc.chat.answer_stream("hello world", RetrievalParams())
+    "".join(sync_hit)
+
+    async def ask():
+        stream = await svc.chat.astream_answer("hello world", RetrievalParams())
+        await stream.read()
+        return stream
+
+    async_hit = asyncio.run(ask())
+
+    assert sync_hit.metrics.cached and async_hit.metrics.cached
+    spans = tracer.snapshot()["spans"]
+    assert spans["chat.generate"]["count"] == 1
+    assert spans["chat.answer_cache_hit"]["count"] == 2
+    assert spans["chat.answer"]["count"] == 3
+    assert [s["name"] for s in async_hit.trace.as_dicts()][-2:] == ["chat.answer_cache_hit", "chat.answer"]
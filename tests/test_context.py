@@ -0,0 +1,35 @@
+from rag.backends import SearchHit
+from rag.context import pack_context
+
+
+def _hit(i: int, text: str, **meta) -> SearchHit:
+    return SearchHit(id=f"c{i}", text=text, metadata={"doc_id": "manual.pdf", "page": 3, **meta})
+
+
+def test_no_start_index_short_match_stays_separate():
+    # chunks indexed before start_index was stored: a 1-char coincidence is not an overlap
+    hits = [_hit(0, "Torque to 40 Nm"), _hit(1, "m. Remove the cover.")]
+    packed = pack_context(hits, budget_tokens=0, max_overlap=240, min_overlap=20)
+    assert [p.text for p in packed.passages] == ["Torque to 40 Nm", "m. Remove the cover."]
+
+
+def test_no_start_index_mid_word_match_stays_separate():
+    a = "the pump housing is sealed with a gasketringseal assembly"
+    b = "ringseal assembly and then torqued to spec in a star pattern"
+    packed = pack_context([_hit(0, a), _hit(1, b)], budget_tokens=0, max_overlap=240, min_overlap=10)
+    assert len(packed.passages) == 2
+
+
+def test_no_start_index_real_overlap_merges():
+    a = "Drain the oil first. Then loosen the four cover bolts evenly"
+    b = "loosen the four cover bolts evenly and lift the cover off."
+    packed = pack_context([_hit(0, a), _hit(1, b)], budget_tokens=0, max_overlap=240, min_overlap=20)
+    assert [p.text for p in packed.passages] == [
+        "Drain the oil first. Then loosen the four cover bolts evenly and lift the cover off."
+    ]
+
+
+def test_start_index_merge_unchanged():
+    hits = [_hit(0, "abcdef ghij", start_index=0), _hit(1, "ghij klmno", start_index=7)]
+    packed = pack_context(hits, budget_tokens=0, min_overlap=20)
+    assert [p.text for p in packed.passages] == ["abcdef ghij klmno"]
@@ -0,0 +1,164 @@
+"""
+Crash safety of per-document updates (stage -> write -> commit -> GC),
+with the bench's fake embedding backend.
+"""
+import threading
+from dataclasses import replace
+
+import pytest
+from langchain_core.documents import Document
+
+from bench.run import install_fakes
+from rag import RagConfig, create_app_services
+from rag.indexing import make_chunk_ids
+from rag.retrieval import RetrievalParams
+
+
+class _Fakes:
+    dim = 64
+    embed_request_ms = 0
+    embed_text_ms = 0
+    answer_tokens = 8
+    llm_ttft_ms = 0
+    llm_token_ms = 0
+
+
+def _doc(version: str, paragraphs: int = 12) -> str:
+    return "\n\n".join(f"alpha {version} paragraph {i} " * 12 for i in range(paragraphs))
+
+
+@pytest.fixture(params=["numpy", "chroma"])
+def env(request, tmp_path):
+    cfg = replace(
+        RagConfig.from_project_root(tmp_path),
+        vector_backend=request.param,
+        embed_batch_size=4,
+        ingest_workers=1,
+        query_cache_entries=0,
+    )
+    svc = create_app_services(tmp_path, cfg=cfg)
+    emb = install_fakes(svc, _Fakes)
+    (cfg.docs_dir / "a.md").write_text(_doc("one"))
+    (cfg.docs_dir / "b.md").write_text("\n\n".join(f"beta stable paragraph {i} " * 12 for i in range(6)))
+    svc.index_manager.build_or_update()
+    yield svc, emb
+    svc.vector_db.close()
+
+
+def _consistent(svc):
+    # every stored chunk is live, every live chunk is stored, nothing journaled
+    db = svc.vector_db
+    reg = db.registry()
+    live = set().union(*(reg.chunk_ids(d) for d in reg.list_docs()))
+    assert db.open().count() == len(live)
+    assert len(db.open().get(sorted(live))) == len(live)
+    assert reg.journal() == []
+    return live
+
+
+def _served_versions(svc, query="alpha paragraph"):
+    chunks = svc.retriever.retrieve(query, RetrievalParams(k=6)).chunks
+    return {c.text.split()[1] for c in chunks if c.doc_id == "a.md"}
+
+
+def _write_orphans(svc, emb, text, file_hash="deadbeef"):
+    chunks = [Document(page_content=text, metadata={"doc_id": "a.md", "source": "a.md"})]
+    ids = make_chunk_ids("a.md", chunks)
+    svc.vector_db.stage_chunks("a.md", file_hash, ids)
+    svc.vector_db.upsert(ids, emb.embed_documents([text]), [text], [chunks[0].metadata])
+    return ids
+
+
+def test_embedding_failure_keeps_old_version(env):
+    svc, emb = env
+    before = _consistent(svc)
+    (svc.cfg.docs_dir / "a.md").write_text(_doc("two"))
+    orig, calls = emb.embed_documents, []
+
+    def flaky(texts):
+        calls.append(len(texts))
+        if len(calls) == 2:
+            raise RuntimeError("embedding server timeout")
+        return orig(texts)
+
+    emb.embed_documents = flaky
+    with pytest.raises(RuntimeError):
+        svc.index_manager.build_or_update()
+    emb.embed_documents = orig
+
+    assert _consistent(svc) == before
+    assert _served_versions(svc) == {"one"}
+
+    svc.index_manager.build_or_update()
+    _consistent(svc)
+    assert _served_versions(svc) == {"two"}
+
+
+def test_cancel_mid_update_keeps_old_version(env):
+    svc, _ = env
+    before = _consistent(svc)
+    (svc.cfg.docs_dir / "a.md").write_text(_doc("two", paragraphs=40))
+    cancel = threading.Event()
+
+    def progress(p):
+        if p.current == "a.md":
+            cancel.set()
+
+    _, stats = svc.index_manager.build_or_update(progress=progress, cancel=cancel)
+    assert stats["cancelled"]
+    assert _consistent(svc) == before
+    assert _served_versions(svc) == {"one"}
+
+
+def test_staged_chunks_are_not_served_and_roll_back(env):
+    svc, emb = env
+    before = _consistent(svc)
+    text = "orphan zebra text " * 10
+    ids = _write_orphans(svc, emb, text)
+
+    # nearest to the query, but unpublished
+    hits = svc.retriever._search(svc.vector_db.open(), emb.embed_query(text), 3)
+    assert hits and not set(ids) & {h.id for h in hits}
+    hybrid = svc.retriever.retrieve(text, RetrievalParams(k=3, mode="hybrid")).chunks
+    assert not set(ids) & {c.chunk_id for c in hybrid}
+
+    # crash after stage: the next run rolls the write back
+    stats = svc.vector_db.recover()
+    assert stats["rolled_back"] == 1 and stats["chunks_deleted"] == len(ids)
+    assert _consistent(svc) == before
+
+
+def test_committed_update_rolls_forward(env):
+    svc, emb = env
+    old = svc.vector_db.registry().chunk_ids("a.md")
+    text = "alpha three paragraph replacement " * 10
+    ids = _write_orphans(svc, emb, text, file_hash="f00d")
+    svc.vector_db.commit_doc("a.md", "a.md", "f00d", ids, sorted(old))
+
+    # crash after commit, before garbage collection: replaced chunks are stored, not served
+    assert svc.vector_db.open().count() == len(old) + len(ids) + len(svc.vector_db.registry().chunk_ids("b.md"))
+    assert _served_versions(svc) == {"three"}
+
+    stats = svc.vector_db.recover()
+    assert stats["rolled_forward"] == 1 and stats["chunks_deleted"] == len(old)
+    assert svc.vector_db.registry().chunk_ids("a.md") == set(ids)
+    _consistent(svc)
+
+
+def test_restaged_doc_with_pending_drops(env):
+    svc, emb = env
+    old = svc.vector_db.registry().chunk_ids("a.md")
+    v2 = _write_orphans(svc, emb, "alpha three paragraph replacement " * 10, file_hash="v2")
+    svc.vector_db.commit_doc("a.md", "a.md", "v2", v2, sorted(old))
+    # a new update of the same doc starts before the drops were collected, then crashes
+    v3 = _write_orphans(svc, emb, "alpha four paragraph again " * 10, file_hash="v3")
+
+    (entry,) = svc.vector_db.registry().journal()
+    assert entry[0] == "a.md" and entry[1] == "writing"
+    assert set(entry[2]) == old | set(v3)
+    assert _served_versions(svc) == {"three"}
+
+    svc.vector_db.recover()
+    assert svc.vector_db.registry().chunk_ids("a.md") == set(v2)
+    assert _consistent(svc) >= set(v2)
+    assert _served_versions(svc) == {"three"}